@@ -5,9 +5,9 @@ student_code = interact.unittest.load_files(["main.cpp"])
 
 captured_function = capture_function(student_code["main"]["bar"], 3, 4)
 
-# Wait for the function to end.
-captured_function.wait()
+# Wait for the function to end, reading everything it outputs as it goes.
+completed = captured_function.communicate()
 
-print "The function returned:", repr(captured_function.return_value)
-print "The function wrote to stdout:", repr(captured_function.stdout.read())
-print "The function wrote to stderr:", repr(captured_function.stderr.read())
+print "The function returned:", repr(completed.return_value)
+print "The function wrote to stdout:", repr(completed.stdout)
+print "The function wrote to stderr:", repr(completed.stderr)
@@ -34,9 +34,14 @@ directory of the git repo.
 
 from core import *
 
-import pretty
-import execute
-import parse
-import standardtests
-import unittest
-import capture
+import _utils
+
+# Submodules are only imported the first time they are used (ex: the first time
+# interact.unittest is accessed) so that harnesses only pay for what they use.
+_utils.make_lazy(__name__, dict(
+    (i, _utils.lazy_import(__name__ + "." + i)) for i in [
+        "pretty", "execute", "parse", "standardtests", "unittest", "capture",
+        "cache", "plan", "merge", "server", "journal", "stats",
+        "resultstore", "style", "similarity"
+    ]
+))
@@ -16,9 +16,86 @@
 # limitations under the License.
 
 import os
-#: An open file descriptor ready for writing that goes directly to the null file
-#: device (``/dev/null`` on Linux).
-DEVNULL = open(os.devnull, "wb")
+
+_devnull = None
+def devnull():
+    """
+    :returns: An open file object ready for writing that goes directly to the
+            null file device (``/dev/null`` on Linux). It is opened the first
+            time this function is called and reused afterwards.
+
+    """
+
+    global _devnull
+    if _devnull is None:
+        _devnull = open(os.devnull, "wb")
+
+    return _devnull
+
+import sys
+import types
+class LazyModule(types.ModuleType):
+    """
+    A module whose attributes may be computed the first time they are accessed
+    rather than when the module is imported. See :func:`make_lazy`.
+
+    """
+
+    def __init__(self, module, loaders):
+        types.ModuleType.__init__(self, module.__name__, module.__doc__)
+        self.__dict__.update(module.__dict__)
+
+        # Python 2 clears out a module's globals when the module object is
+        # destroyed, which would break every function defined in it, so we need
+        # to keep the original module alive.
+        self._lazy_original = module
+        self._lazy_loaders = loaders
+
+    def __getattr__(self, name):
+        # Only called when normal lookup fails.
+        loader = self.__dict__.get("_lazy_loaders", {}).get(name)
+        if loader is None:
+            raise AttributeError(
+                "'module' object has no attribute '%s'" % (name, )
+            )
+
+        value = loader()
+        setattr(self, name, value)
+        return value
+
+def make_lazy(module_name, loaders):
+    """
+    Replaces an already imported module with a :class:`LazyModule`.
+
+    :param module_name: The full name of the module (ex: ``"interact"``).
+    :param loaders: A dictionary mapping attribute names to functions taking no
+            arguments that compute the attribute's value.
+    :returns: The new module.
+
+    .. note::
+
+        Functions defined in the module see its original globals, so they
+        can't use lazy attributes as plain global names.
+
+    """
+
+    lazy = LazyModule(sys.modules[module_name], loaders)
+    sys.modules[module_name] = lazy
+
+    return lazy
+
+def lazy_import(module_name):
+    """
+    :returns: A function suitable to give to :func:`make_lazy` that imports and
+            returns ``module_name``.
+
+    """
+
+    def loader():
+        __import__(module_name)
+        return sys.modules[module_name]
+
+    return loader
 
 def default_repr(obj):
     """
@@ -27,7 +104,16 @@ def default_repr(obj):
 
     """
 
-    attributes = sorted(obj.__dict__.items(), key = lambda x: x[0])
+    attributes = dict(getattr(obj, "__dict__", {}))
+
+    # Objects using __slots__ keep (some of) their attributes outside of their
+    # __dict__, so go looking for them too.
+    for cls in type(obj).__mro__ if hasattr(type(obj), "__mro__") else []:
+        for name in cls.__dict__.get("__slots__", ()):
+            if name not in attributes and hasattr(obj, name):
+                attributes[name] = getattr(obj, name)
+
+    attributes = sorted(attributes.items(), key = lambda x: x[0])
     attribute_strings = []
     for key, value in attributes:
         if not key.startswith("_"):
@@ -39,7 +125,6 @@ import os.path
 def resolve_path(path):
     return os.path.abspath(os.path.expanduser(path))
 
-import inspect
 def get_root_script_path():
     """
     :returns: An absolute path to the file that is actually being executed.
@@ -49,6 +134,9 @@ def get_root_script_path():
 
     """
 
+    # inspect is slow to import and rarely needed.
+    import inspect
+
     return resolve_path(inspect.stack()[-1][1])
 
 import os.path
@@ -89,9 +177,6 @@ def which(program_name):
 
     return None
 
-import os
-import subprocess
-
 def sed_call(file_in, file_out, *args):
     """
     Calls ``sed``.
@@ -101,6 +186,8 @@ def sed_call(file_in, file_out, *args):
     :param *args: Arguments to pass to ``sed``.
     """
     
+    import subprocess
+
     with open(file_in, "r") as read:
         with open(file_out, "w") as out:
             job = subprocess.Popen(
@@ -112,3 +199,8 @@ def sed_call(file_in, file_out, *args):
             if job.returncode != 0:
                 raise Exception("sed failed")
     return
+
+#: An open file object ready for writing that goes directly to the null file
+#: device (``/dev/null`` on Linux). It is opened the first time it is used (see
+#: :func:`devnull`).
+make_lazy(__name__, {"DEVNULL": devnull})
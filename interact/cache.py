@@ -0,0 +1,217 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module provides a persistent cache of test results. A test that declares
+its inputs (see :meth:`Harness.test <interact.core.Harness.test>`) will only be
+run if those inputs, or the test's code, have changed since a previous run that
+used the same cache. Otherwise the stored :class:`TestResult
+<interact.core.TestResult>` is replayed.
+
+.. code-block:: python
+
+    harness = interact.Harness()
+    harness.result_cache = interact.cache.ResultCache("~/.galah_cache")
+    harness.start()
+
+    student_files = harness.student_files("main.cpp")
+
+    @harness.test("Proper indentation is used.",
+            inputs = student_files + ["indent-rules-v2"])
+    def check_indentation():
+        return interact.standardtests.check_indentation(student_files)
+
+"""
+
+import _utils
+import hashlib
+import os
+import os.path
+import pickle
+import tempfile
+import types
+
+def _hash_code(hasher, code):
+    hasher.update(code.co_code)
+    hasher.update(repr(code.co_names))
+
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _hash_code(hasher, const)
+        else:
+            hasher.update(repr(const))
+
+# Types whose repr is stable between runs and which can't be mutated, making
+# them safe to use as part of a cache key.
+_STABLE_TYPES = (basestring, int, long, float, bool, type(None))
+
+def _is_stable(value):
+    if isinstance(value, tuple):
+        return all(_is_stable(i) for i in value)
+
+    return isinstance(value, _STABLE_TYPES)
+
+def hash_function(func):
+    """
+    Creates a digest of a function's code that will change whenever the
+    function's body is changed.
+
+    :param func: A Python function.
+    :returns: A hex string.
+
+    The bytecode, constants, and referenced names of the function (and of any
+    functions defined within it) are hashed, along with the values of any
+    variables the function closes over that are strings, numbers, or tuples of
+    them (useful when tests are generated in a loop). Globals and any other
+    values the function uses are *not* hashed, so if a test depends on them they
+    should be declared as inputs.
+
+    """
+
+    hasher = hashlib.sha1()
+    _hash_code(hasher, func.__code__)
+
+    for cell in func.__closure__ or ():
+        try:
+            contents = cell.cell_contents
+        except ValueError:
+            # The cell is empty (the variable was never assigned).
+            continue
+
+        if _is_stable(contents):
+            hasher.update(repr(contents))
+
+    return hasher.hexdigest()
+
+def _hash_file(hasher, path):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                break
+            hasher.update(chunk)
+
+def hash_inputs(inputs):
+    """
+    Creates a digest of a list of declared inputs.
+
+    :param inputs: A list of inputs. Any input that is a path to an existing
+            file is hashed by its path and contents. Every other input (such as
+            a version tag or a configuration value) is hashed by its ``repr``.
+    :returns: A hex string.
+
+    """
+
+    hasher = hashlib.sha1()
+
+    for i in inputs:
+        if isinstance(i, basestring) and os.path.isfile(i):
+            hasher.update("file:%s:" % (_utils.resolve_path(i), ))
+            _hash_file(hasher, i)
+        else:
+            hasher.update("value:%s" % (repr(i), ))
+
+        # Seperate each input so that ["ab", "c"] and ["a", "bc"] differ.
+        hasher.update("\0")
+
+    return hasher.hexdigest()
+
+class ResultCache:
+    """
+    A directory of pickled :class:`TestResult <interact.core.TestResult>`
+    objects keyed by a hash of a test's name, code, and declared inputs.
+
+    :ivar directory: An absolute path to the directory the results are stored
+            in. It is created if it does not exist.
+
+    The cache is safe to share between many harnesses running at once as each
+    result is written to a temporary file that is then atomically renamed into
+    place.
+
+    """
+
+    def __init__(self, directory):
+        self.directory = _utils.resolve_path(directory)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def make_key(name, code_digest, inputs):
+        """
+        :param name: The name of the test.
+        :param code_digest: The result of :func:`hash_function` on the test's
+                function.
+        :param inputs: The test's declared inputs. See :func:`hash_inputs`.
+        :returns: A key suitable to pass to :meth:`get` and :meth:`put`.
+
+        """
+
+        hasher = hashlib.sha1()
+        hasher.update(repr(name))
+        hasher.update(code_digest)
+        hasher.update(hash_inputs(inputs))
+
+        return hasher.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pickle")
+
+    def get(self, key):
+        """
+        :returns: The cached ``TestResult`` stored under ``key`` or ``None`` if
+                there is no such result (or it could not be loaded).
+
+        """
+
+        try:
+            with open(self._path(key), "rb") as f:
+                return pickle.load(f)
+        except IOError:
+            return None
+        except Exception:
+            # A result that can't be unpickled (maybe the class it was an
+            # instance of no longer exists) is treated as a cache miss.
+            return None
+
+    def put(self, key, result):
+        """
+        Stores ``result`` under ``key``. If the result cannot be pickled it is
+        silently not cached.
+
+        """
+
+        fd, temp_path = tempfile.mkstemp(dir = self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(result, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_path, self._path(key))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            os.remove(temp_path)
+        except:
+            os.remove(temp_path)
+            raise
+
+    def clear(self):
+        """
+        Removes every result from the cache.
+
+        """
+
+        for i in os.listdir(self.directory):
+            if i.endswith(".pickle"):
+                os.remove(os.path.join(self.directory, i))
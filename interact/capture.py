@@ -21,10 +21,122 @@ seperate process in order to capture its standard input, output, and error.
 
 """
 
+import errno
+import functools
+import mmap
+import os
+import pickle
+import Queue
+import resource
+import select
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
+
 class _ExceptionCarrier:
     def __init__(self, exception):
         self.exception = exception
 
+class _InSharedMemory:
+    """
+    Sent through a pipe in place of something large that was instead written
+    to the start of a shared memory region.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+#: Return values (and, with a :class:`WorkerPool`, input) that take at least
+#: this many bytes are passed through memory shared with the process running
+#: the function rather than through a pipe.
+SHARED_MEMORY_THRESHOLD = 2 ** 16
+
+#: The size of the memory shared with each process running a function. Only
+#: the pages that are used take up any memory, but anything bigger than this
+#: is passed through a pipe. It is not counted against an ``RLIMIT_AS`` limit
+#: (see :func:`_call`).
+SHARED_MEMORY_SIZE = 2 ** 26
+
+def _share(data, shared):
+    """
+    Writes the string ``data`` (such as the input for a function) to the
+    shared memory ``shared`` if it's big enough to be worth it (and small
+    enough to fit). Returns an :class:`_InSharedMemory` to send in its place if
+    it was written, otherwise ``None``.
+
+    """
+
+    if shared is None or \
+            not SHARED_MEMORY_THRESHOLD <= len(data) <= len(shared):
+        return None
+
+    shared[:len(data)] = data
+    return _InSharedMemory(len(data))
+
+def _dumps(value, shared):
+    """
+    Pickles ``value``. If the pickle is big enough to be worth it (and small
+    enough to fit), it is left in the shared memory ``shared`` and a pickled
+    :class:`_InSharedMemory` is returned instead.
+
+    """
+
+    if shared is not None:
+        # Pickling straight into the shared memory saves copying a large
+        # pickle out of a string.
+        shared.seek(0)
+        try:
+            pickle.Pickler(shared, pickle.HIGHEST_PROTOCOL).dump(value)
+        except ValueError:
+            # It doesn't fit, the mmap refuses to write past its end.
+            pass
+        else:
+            size = shared.tell()
+            if size < SHARED_MEMORY_THRESHOLD:
+                return shared[:size]
+
+            return pickle.dumps(
+                _InSharedMemory(size), protocol = pickle.HIGHEST_PROTOCOL
+            )
+
+    return pickle.dumps(value, protocol = pickle.HIGHEST_PROTOCOL)
+
+def _unpickle(data, shared):
+    """
+    Unpickles what a process running a captured function sent back, reading
+    it from the shared memory ``shared`` if it was put there.
+
+    """
+
+    returned = pickle.loads(data)
+    if isinstance(returned, _InSharedMemory):
+        # Unpickle straight out of the shared memory rather than copying all
+        # of it into a string first.
+        shared.seek(0)
+        returned = pickle.load(shared)
+
+    return returned
+
+class FunctionTimedOut(RuntimeError):
+    """
+    Exception raised by :meth:`CapturedFunction.wait` when a captured function
+    does not finish within its timeout. The process running it has been
+    killed by the time this is raised.
+
+    :ivar timeout: The timeout, in seconds.
+
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        RuntimeError.__init__(
+            self, "The function did not finish within %s seconds." % (timeout, )
+        )
+
 class CapturedFunction:
     """
     The type of object returned by :func:`capture_function`. Provides access to
@@ -41,6 +153,16 @@ class CapturedFunction:
             :meth:`CapturedFunction.wait` is called. Will contain the value
             :attr:`CapturedFunction.NOT_SET` if it has not been set by a call to
             :meth:`CapturedFunction.wait`.
+    :ivar timeout: How many seconds the function has to finish (counting from
+            when it was started), or ``None`` if it has as long as it likes.
+    :ivar timed_out: ``True`` if the function was killed for running past its
+            timeout.
+    :ivar status: The exit status of the process, as returned by
+            ``os.waitpid``, once it has finished.
+    :ivar rusage: The resources used by the process, as returned by
+            ``os.wait4``, once it has finished. ``ru_utime`` and ``ru_stime``
+            are the seconds of CPU time it used, and ``ru_maxrss`` is the most
+            memory it used at once, in kilobytes.
 
     The correct way to check if ``return_value`` is set is to compare with
     :attr:`CapturedFunction.NOT_SET` like so:
@@ -52,6 +174,15 @@ class CapturedFunction:
         else:
             print "It's set!"
 
+    .. warning::
+
+        A pipe only holds so much (usually 64 KB). If the function writes more
+        than that to stderr while you are reading its stdout (or the other way
+        around), or returns a large value before you have read its output,
+        both processes will wait on each other forever. Use
+        :meth:`communicate` unless you need to talk to the function as it
+        runs.
+
     """
 
     class _NotSet:
@@ -69,102 +200,947 @@ class CapturedFunction:
     NOT_SET = _NotSet()
 
     def __init__(self, pid, stdin_pipe, stdout_pipe, stderr_pipe,
-            returnvalue_pipe):
+            returnvalue_pipe, timeout = None, shared_memory = None):
         self.pid = pid
         self.stdin = stdin_pipe
         self.stdout = stdout_pipe
         self.stderr = stderr_pipe
         self._returnvalue_pipe = returnvalue_pipe
+        self._shared_memory = shared_memory
         self.return_value = CapturedFunction.NOT_SET
 
+        self.timeout = timeout
+        self._deadline = None if timeout is None else time.time() + timeout
+        self.timed_out = False
+        self.status = None
+        self.rusage = None
+
+    def _time_left(self):
+        """
+        Returns how many seconds the function has left (never less than 0), or
+        ``None`` if it has no timeout or has already been killed.
+
+        """
+
+        if self._deadline is None:
+            return None
+
+        return max(0, self._deadline - time.time())
+
+    def _kill(self):
+        """
+        Kills the process running the function because it ran out of time.
+
+        """
+
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError as e:
+            # It may have finished just in time.
+            if e.errno != errno.ESRCH:
+                raise
+
+        self.timed_out = True
+        self._deadline = None
+
+    def _reap(self):
+        """
+        Waits for the process running the function to exit, and records its
+        exit status and resource usage.
+
+        """
+
+        if self.status is None:
+            self.status, self.rusage = _wait4(self.pid)
+
     def wait(self):
         """
         Blocks until the process running the captured function exits (which
         will be when the function returns). Sets ``return_value``.
 
         If the function raised an exception, this function will raise that
-        exception.
+        exception. If the function has a :attr:`timeout` and doesn't return in
+        time, its process is killed and :class:`FunctionTimedOut` is raised.
 
         """
 
-        returned = pickle.load(self._returnvalue_pipe)
-        os.waitpid(self.pid, 0)
+        pipe = self._returnvalue_pipe.fileno()
+        chunks = []
+        while True:
+            if self._time_left() == 0:
+                self._kill()
+                break
+
+            if _select([pipe], [], self._time_left())[0]:
+                chunk = os.read(pipe, 65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+        self._returnvalue_pipe.close()
+        self._reap()
+
+        if self.timed_out:
+            self._close_shared_memory()
+            raise FunctionTimedOut(self.timeout)
+
+        # Like pickle.load, this raises EOFError if the process died without
+        # sending anything back.
+        try:
+            returned = _unpickle("".join(chunks), self._shared_memory)
+        finally:
+            self._close_shared_memory()
 
         if isinstance(returned, _ExceptionCarrier):
             raise returned.exception
         else:
             self.return_value = returned
 
-import os
-import multiprocessing
-import pickle
-import sys
+    def communicate(self, input = None, max_bytes = None):
+        """
+        Sends ``input`` to the function's stdin, and reads everything it
+        writes to stdout and stderr along with its return value, all at the
+        same time, so that no pipe ever fills up and blocks it. Then waits for
+        the function to finish.
+
+        :param input: A string to write to stdin, which is then closed. If
+                ``None``, stdin is closed straight away.
+        :param max_bytes: If not ``None``, at most this many bytes of stdout
+                and of stderr are kept. Anything more is still read (so the
+                function isn't blocked) but thrown away.
+        :returns: A :class:`CompletedFunction`. Unlike :meth:`wait`, an
+                exception raised by the function is not raised again, it is
+                put in :attr:`CompletedFunction.exception`. Likewise if the
+                function runs past its :attr:`timeout`, its process is killed
+                and a :class:`FunctionTimedOut` is put there.
+
+        Don't read from :attr:`stdout` or :attr:`stderr` or write to
+        :attr:`stdin` yourself before calling this.
+
+        """
+
+        completed = CompletedFunction(self.pid)
+
+        stdout_fd = self.stdout.fileno()
+        stderr_fd = self.stderr.fileno()
+        returnvalue_fd = self._returnvalue_pipe.fileno()
+
+        # Maps each file descriptor we are reading from to what we've read.
+        outputs = {
+            stdout_fd: _Output(max_bytes),
+            stderr_fd: _Output(max_bytes),
+            returnvalue_fd: _Output()
+        }
+
+        writing = []
+        if input:
+            writing.append(self.stdin.fileno())
+        else:
+            self.stdin.close()
+        input_offset = 0
+
+        reading = list(outputs)
+        while reading or writing:
+            if self._time_left() == 0:
+                # Out of time. Once the process is dead every pipe it had is
+                # closed, so we keep reading until then.
+                self._kill()
+                if writing:
+                    writing = []
+                    self.stdin.close()
+
+            readable, writable = _select(reading, writing, self._time_left())
+
+            for fd in writable:
+                try:
+                    # Writing at most PIPE_BUF bytes to a pipe that select
+                    # says is writable never blocks.
+                    input_offset += os.write(
+                        fd, input[input_offset:input_offset + select.PIPE_BUF]
+                    )
+                except OSError as e:
+                    if e.errno != errno.EPIPE:
+                        raise
+
+                    # The function closed its stdin, it doesn't want the
+                    # rest.
+                    input_offset = len(input)
+
+                if input_offset >= len(input):
+                    writing.remove(fd)
+                    self.stdin.close()
+
+            for fd in readable:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    reading.remove(fd)
+                    continue
+
+                outputs[fd].add(chunk)
+
+        for i in (self.stdout, self.stderr, self._returnvalue_pipe):
+            i.close()
+
+        self._reap()
+        completed.status = self.status
+        completed.rusage = self.rusage
+        completed.timed_out = self.timed_out
+        if self.timed_out:
+            completed.exception = FunctionTimedOut(self.timeout)
+
+        completed._set_output(outputs[stdout_fd], outputs[stderr_fd])
+
+        returned = outputs[returnvalue_fd].value()
+        try:
+            if returned and not self.timed_out:
+                completed._set_returned(returned, self._shared_memory)
+        finally:
+            self._close_shared_memory()
+        self.return_value = completed.return_value
+
+        return completed
+
+    def _close_shared_memory(self):
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory = None
+
+def _wait4(pid):
+    """
+    Waits for the process ``pid`` to exit. Returns a two-tuple of its exit
+    status and resource usage, as returned by ``os.wait4``.
+
+    """
+
+    while True:
+        try:
+            return os.wait4(pid, 0)[1:]
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+
+def _select(reading, writing, timeout):
+    """
+    Waits until one of the file descriptors in ``reading`` can be read from or
+    one in ``writing`` can be written to, or until ``timeout`` seconds have
+    passed (forever if ``timeout`` is ``None``). Returns a two-tuple of lists
+    of the ready file descriptors, which are both empty if time ran out.
+
+    """
+
+    while True:
+        try:
+            readable, writable, _ = select.select(
+                reading, writing, [], timeout
+            )
+            return (readable, writable)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+
+class _Output:
+    """
+    Collects what is read from one of a captured function's pipes, keeping at
+    most ``limit`` bytes of it (or all of it if ``limit`` is ``None``).
+
+    """
+
+    def __init__(self, limit = None):
+        self.limit = limit
+        self.chunks = []
+        self.kept = 0
+        self.truncated = False
+
+    def add(self, chunk):
+        if self.limit is not None and self.kept + len(chunk) > self.limit:
+            chunk = chunk[:self.limit - self.kept]
+            self.truncated = True
+        self.chunks.append(chunk)
+        self.kept += len(chunk)
+
+    def value(self):
+        return "".join(self.chunks)
+
+class CompletedFunction:
+    """
+    The type of object returned by :meth:`CapturedFunction.communicate`: what a
+    captured function did once it has finished.
+
+    :ivar pid: The process ID of the process that ran the function.
+    :ivar stdout: A string of everything the function wrote to stdout (up to
+            ``max_bytes``).
+    :ivar stderr: A string of everything the function wrote to stderr (up to
+            ``max_bytes``).
+    :ivar stdout_truncated: ``True`` if the function wrote more than
+            ``max_bytes`` to stdout.
+    :ivar stderr_truncated: ``True`` if the function wrote more than
+            ``max_bytes`` to stderr.
+    :ivar return_value: Whatever the function returned, or
+            :attr:`CapturedFunction.NOT_SET` if it raised an exception or the
+            process died before it returned.
+    :ivar exception: The exception the function raised (or a
+            :class:`FunctionTimedOut` if it ran out of time), or ``None``.
+    :ivar timed_out: ``True`` if the function was killed for running past its
+            timeout.
+    :ivar status: The exit status of the process, as returned by
+            ``os.waitpid``.
+    :ivar rusage: The resources used by the process, as returned by
+            ``os.wait4`` (see :attr:`CapturedFunction.rusage`).
+
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.stdout = ""
+        self.stderr = ""
+        self.stdout_truncated = False
+        self.stderr_truncated = False
+        self.return_value = CapturedFunction.NOT_SET
+        self.exception = None
+        self.timed_out = False
+        self.status = None
+        self.rusage = None
+
+    @property
+    def cpu_time(self):
+        """
+        The seconds of CPU time (user and system) the process used.
+
+        """
+
+        return self.rusage.ru_utime + self.rusage.ru_stime
+
+    @property
+    def max_rss(self):
+        """
+        The most memory the process used at once, in kilobytes.
+
+        """
+
+        return self.rusage.ru_maxrss
+
+    def _set_output(self, stdout, stderr):
+        """
+        Sets :attr:`stdout` and :attr:`stderr` (and whether they were
+        truncated) from two :class:`_Output` objects.
+
+        """
+
+        self.stdout = stdout.value()
+        self.stderr = stderr.value()
+        self.stdout_truncated = stdout.truncated
+        self.stderr_truncated = stderr.truncated
+
+    def _set_returned(self, returned, shared_memory):
+        """
+        Sets :attr:`return_value` or :attr:`exception` from what the process
+        running the function sent back.
+
+        """
+
+        returned = _unpickle(returned, shared_memory)
+        if isinstance(returned, _ExceptionCarrier):
+            self.exception = returned.exception
+        else:
+            self.return_value = returned
+
 def capture_function(func, *args, **kwargs):
     """
     Executes a function and captures anything it prints to standard output or
     standard error, along with capturing its return value.
 
     :param func: The function to execute and capture.
-    :param \*args,\*\*kwargs: The arguments to pass to the function.
+    :param \*args,\*\*kwargs: The arguments to pass to the function, except
+            for the keyword arguments below.
+    :param timeout: How many seconds the function has to finish before its
+            process is killed (see :attr:`CapturedFunction.timeout`). If not
+            given, the function can take as long as it likes.
+    :param rlimits: A dictionary mapping resources (such as
+            ``resource.RLIMIT_CPU`` or ``resource.RLIMIT_AS``) to the limit to
+            set on them (as passed to ``resource.setrlimit``) in the process
+            running the function. A single number sets both the soft and hard
+            limit. The memory used to pass back large return values is
+            added to any ``resource.RLIMIT_AS`` limit, so the function gets
+            all of the address space asked for.
     :returns: An instance of :class:`CapturedFunction`.
 
     >>> def foo(x, c = 3):
     ...     print x, "likes", c
     ...     return x + c
     >>> a = capture_function(foo, 2, c = 9)
-    >>> a.stdout.read()
-    "2 likes 9\\n"
-    >>> a.wait()
-    >>> print a.return_value
+    >>> completed = a.communicate()
+    >>> completed.stdout
+    '2 likes 9\\n'
+    >>> print completed.return_value
     11
 
+    A function that never finishes can be stopped with a timeout.
+
+    >>> def forever():
+    ...     while True:
+    ...         pass
+    >>> completed = capture_function(forever, timeout = 0.1).communicate()
+    >>> completed.timed_out, completed.cpu_time > 0
+    (True, True)
+
+    To pass keyword arguments named ``timeout`` or ``rlimits`` to the function
+    itself, wrap it with ``functools.partial``.
+
     """
 
+    timeout = kwargs.pop("timeout", None)
+    rlimits = kwargs.pop("rlimits", None)
+
     # I'm using a dict here to avoid copying and pasting code for each pipe
     pipes = {}
     for i in ("stdin", "stdout", "stderr", "return_value"):
         read_end, write_end = os.pipe()
         pipes[i] = (os.fdopen(read_end, "r"), os.fdopen(write_end, "w"))
 
+    # A large return value is passed back through this instead of the
+    # return_value pipe. It has to exist before we fork to be shared.
+    shared_memory = mmap.mmap(-1, SHARED_MEMORY_SIZE)
+
     child_pid = os.fork()
     if child_pid == 0:
-        # We are in the child process.
+        # We are in the child process, which must never return from here no
+        # matter what goes wrong.
+        try:
+            _run_child(pipes, shared_memory, func, args, kwargs, rlimits)
+        finally:
+            os._exit(0)
+    else:
+        # We are in the parent process. Close the ends only the child uses.
+        for i in (pipes["stdin"][0], pipes["stdout"][1], pipes["stderr"][1],
+                pipes["return_value"][1]):
+            i.close()
 
-        # Make sure all of our standard descriptors redirect to pipes controlled
-        # by our parent.
-        # sys.stdin = stdin_read
-        # sys.stdout = stdout_write
-        # sys.stderr = stderr_write
-        os.dup2(pipes["stdin"][0].fileno(), 0)
-        os.dup2(pipes["stdout"][1].fileno(), 1)
-        os.dup2(pipes["stderr"][1].fileno(), 2)
+        return CapturedFunction(
+            child_pid,
+            pipes["stdin"][1],
+            pipes["stdout"][0],
+            pipes["stderr"][0],
+            pipes["return_value"][0],
+            timeout = timeout,
+            shared_memory = shared_memory
+        )
 
-        try:
-            return_value = func(*args, **kwargs)
+def _run_child(pipes, shared_memory, func, args, kwargs, rlimits):
+    """
+    Runs a captured function in the process forked by
+    :func:`capture_function`.
 
-            pickle.dump(
-                return_value,
-                pipes["return_value"][1],
-                protocol = pickle.HIGHEST_PROTOCOL
+    """
+
+    # Make sure all of our standard descriptors redirect to pipes controlled
+    # by our parent.
+    os.dup2(pipes["stdin"][0].fileno(), 0)
+    os.dup2(pipes["stdout"][1].fileno(), 1)
+    os.dup2(pipes["stderr"][1].fileno(), 2)
+
+    # Close every end we don't use (including the originals of the ends we
+    # just duplicated), so that the parent sees the end of each pipe as soon
+    # as we are done with it.
+    for i in (pipes["stdin"][0], pipes["stdin"][1], pipes["stdout"][0],
+            pipes["stdout"][1], pipes["stderr"][0], pipes["stderr"][1],
+            pipes["return_value"][0]):
+        i.close()
+
+    # Whatever sys.stdout and friends were before (they may have been
+    # replaced by something that doesn't write to a file descriptor at all),
+    # Python code should use the pipes too.
+    sys.stdin = os.fdopen(0, "r")
+    sys.stdout = os.fdopen(1, "w")
+    sys.stderr = os.fdopen(2, "w")
+
+    returned = _call(func, args, kwargs, rlimits, shared_memory)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pipes["return_value"][1].write(returned)
+    pipes["return_value"][1].flush()
+
+def _call(func, args, kwargs, rlimits = None, shared_memory = None):
+    """
+    Sets the resource limits ``rlimits`` on the current process, then calls
+    ``func``. Returns what it returned, or an :class:`_ExceptionCarrier` for
+    what it raised, pickled (see :func:`_dumps`).
+
+    ``shared_memory`` was mapped before this process was forked, so it is
+    already part of the address space. Its size is added to an
+    ``RLIMIT_AS`` limit so that it doesn't use up the function's share.
+
+    """
+
+    try:
+        for limited, limit in (rlimits or {}).items():
+            if isinstance(limit, (int, long)):
+                limit = (limit, limit)
+            if limited == resource.RLIMIT_AS and shared_memory is not None:
+                limit = tuple(
+                    i if i == resource.RLIM_INFINITY else i + len(shared_memory)
+                    for i in limit
+                )
+            resource.setrlimit(limited, limit)
+
+        return_value = func(*args, **kwargs)
+        return _dumps(return_value, shared_memory)
+    except:
+        exception = sys.exc_info()[1]
+        try:
+            return pickle.dumps(
+                _ExceptionCarrier(exception), protocol = pickle.HIGHEST_PROTOCOL
             )
-        except:
-            raised = sys.exc_info()[0]
-            pickle.dump(
-                _ExceptionCarrier(raised),
-                pipes["return_value"][1],
+        except Exception:
+            # Not every exception can be pickled, but its type can.
+            return pickle.dumps(
+                _ExceptionCarrier(type(exception)),
                 protocol = pickle.HIGHEST_PROTOCOL
             )
 
-        for i in (pipes["stdout"][1], pipes["stderr"][1], pipes["return_value"][1]):
-            i.flush()
+#: The header sent before each message between a :class:`WorkerPool` and its
+#: workers: the length of the message.
+_HEADER = struct.Struct("!Q")
 
-        os._exit(0)
-    else:
-        # We are in the parent process
-        return CapturedFunction(
-            child_pid,
-            pipes["stdin"][1],
-            pipes["stdout"][0],
-            pipes["stderr"][0],
-            pipes["return_value"][0]
+def _write_all(fd, data):
+    offset = 0
+    while offset < len(data):
+        offset += os.write(fd, buffer(data, offset))
+
+def _write_message(fd, data):
+    _write_all(fd, _HEADER.pack(len(data)))
+    _write_all(fd, data)
+
+def _read_exactly(fd, size):
+    """
+    Reads exactly ``size`` bytes from ``fd``, or returns ``None`` if the pipe
+    is closed before then.
+
+    """
+
+    chunks = []
+    while size:
+        chunk = os.read(fd, min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return "".join(chunks)
+
+def _read_message(fd):
+    header = _read_exactly(fd, _HEADER.size)
+    if header is None:
+        return None
+
+    return _read_exactly(fd, _HEADER.unpack(header)[0])
+
+def _serve(tasks, results, shared_memory, rlimits):
+    """
+    Runs tasks sent by a :class:`WorkerPool` until it closes ``tasks``. This is
+    the main loop of a worker process.
+
+    Each task is two messages: the pickled function and its arguments, then
+    the pickled input (or an :class:`_InSharedMemory` if the input was put in
+    ``shared_memory``).
+
+    """
+
+    # These are the objects wrapping C's own stdin and stdout, so resetting
+    # them below resets what C and C++ code reads and writes too.
+    sys.stdin = sys.__stdin__
+    sys.stdout = sys.__stdout__
+    sys.stderr = sys.__stderr__
+
+    while True:
+        task = _read_message(tasks)
+        input = _read_message(tasks)
+        if task is None or input is None:
+            return
+
+        input = pickle.loads(input)
+        if isinstance(input, _InSharedMemory):
+            input = buffer(shared_memory, 0, input.size)
+
+        try:
+            func, args, kwargs = pickle.loads(task)
+        except Exception:
+            # The function can't be found here, probably because it was
+            # defined after this worker was forked. An empty message asks
+            # the pool to run it some other way.
+            _write_message(results, "")
+            continue
+
+        # Standard input is a temporary file that is rewritten for each call,
+        # so nothing one call leaves unread is seen by the next.
+        os.ftruncate(0, 0)
+        os.lseek(0, 0, os.SEEK_SET)
+        if input:
+            _write_all(0, input)
+        sys.stdin.seek(0)
+
+        returned = _call(func, args, kwargs, rlimits, shared_memory)
+
+        # Everything written to stdout and stderr must be in the pipes before
+        # the return value is, that's how the pool knows it has all of it.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _write_message(results, returned)
+
+class _Worker:
+    """
+    A process forked by a :class:`WorkerPool` that runs one function at a
+    time.
+
+    :ivar pid: The process ID of the worker.
+    :ivar alive: ``False`` once the worker has exited or been killed.
+    :ivar calls: How many tasks have been sent to the worker.
+
+    """
+
+    def __init__(self, rlimits, others):
+        task_read, self._tasks = os.pipe()
+        self._results, result_write = os.pipe()
+        self._stdout, stdout_write = os.pipe()
+        self._stderr, stderr_write = os.pipe()
+        stdin = tempfile.TemporaryFile()
+
+        # Large input and return values are passed through this.
+        self._shared_memory = mmap.mmap(-1, SHARED_MEMORY_SIZE)
+
+        # Anything still buffered would otherwise be written out by the
+        # worker as well.
+        sys.__stdout__.flush()
+        sys.__stderr__.flush()
+
+        self.pid = os.fork()
+        if self.pid == 0:
+            try:
+                os.dup2(stdin.fileno(), 0)
+                os.dup2(stdout_write, 1)
+                os.dup2(stderr_write, 2)
+                stdin.close()
+
+                # Close the parent's ends of our pipes and of every other
+                # worker's, so that each worker sees its tasks pipe close
+                # when the pool closes it. The other workers' shared memory
+                # would only count against our RLIMIT_AS.
+                for fd in [stdout_write, stderr_write, self._tasks,
+                        self._results, self._stdout, self._stderr]:
+                    os.close(fd)
+                for other in others:
+                    for fd in other.fds():
+                        os.close(fd)
+                    other._shared_memory.close()
+
+                _serve(task_read, result_write, self._shared_memory, rlimits)
+            finally:
+                os._exit(0)
+
+        for fd in (task_read, result_write, stdout_write, stderr_write):
+            os.close(fd)
+        stdin.close()
+
+        self.alive = True
+        self.calls = 0
+
+    def fds(self):
+        """
+        Returns the file descriptors the pool uses to talk to this worker.
+
+        """
+
+        return [self._tasks, self._results, self._stdout, self._stderr]
+
+    def call(self, task, input, timeout, max_bytes):
+        """
+        Sends ``task`` (the pickled function and its arguments) and ``input``
+        to the worker and waits for it to finish, reading its output as it
+        goes. Returns a :class:`CompletedFunction`, or ``None`` if the worker
+        could not load the task.
+
+        If the task takes longer than ``timeout`` seconds or the worker dies,
+        the worker is killed and reaped, and :attr:`alive` is set to
+        ``False``.
+
+        """
+
+        self.calls += 1
+        completed = CompletedFunction(self.pid)
+        outputs = {
+            self._stdout: _Output(max_bytes),
+            self._stderr: _Output(max_bytes)
+        }
+        deadline = None if timeout is None else time.time() + timeout
+
+        in_shared_memory = _share(input or "", self._shared_memory)
+        input = pickle.dumps(
+            in_shared_memory or input, protocol = pickle.HIGHEST_PROTOCOL
+        )
+
+        try:
+            _write_message(self._tasks, task)
+            _write_message(self._tasks, input)
+        except OSError as e:
+            # If the worker has died we'll find out from the results pipe.
+            if e.errno != errno.EPIPE:
+                raise
+
+        result = _Output()
+        expected = None
+        reading = [self._stdout, self._stderr, self._results]
+        while self._results in reading:
+            time_left = None
+            if deadline is not None:
+                time_left = max(0, deadline - time.time())
+                if time_left == 0:
+                    completed.timed_out = True
+                    completed.exception = FunctionTimedOut(timeout)
+                    break
+
+            readable, _ = _select(reading, [], time_left)
+            for fd in readable:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    reading.remove(fd)
+                elif fd in outputs:
+                    outputs[fd].add(chunk)
+                else:
+                    result.add(chunk)
+                    if expected is None and result.kept >= _HEADER.size:
+                        expected = _HEADER.size + \
+                            _HEADER.unpack(result.value()[:_HEADER.size])[0]
+                    if expected is not None and result.kept >= expected:
+                        reading.remove(fd)
+
+        finished = expected is not None and result.kept >= expected
+        if finished:
+            # The function's output was flushed before its return value was
+            # sent, so whatever is left of it is already in the pipes.
+            reading = [self._stdout, self._stderr]
+            while reading:
+                readable, _ = _select(reading, [], 0)
+                if not readable:
+                    break
+
+                for fd in readable:
+                    chunk = os.read(fd, 65536)
+                    if chunk:
+                        outputs[fd].add(chunk)
+                    else:
+                        reading.remove(fd)
+        else:
+            # The worker timed out or died. Once it's dead its pipes close,
+            # so read the rest of its output until then.
+            self._kill()
+            reading = [i for i in reading if i in outputs]
+            while reading:
+                for fd in _select(reading, [], None)[0]:
+                    chunk = os.read(fd, 65536)
+                    if chunk:
+                        outputs[fd].add(chunk)
+                    else:
+                        reading.remove(fd)
+
+            completed.status, completed.rusage = _wait4(self.pid)
+            self._close_fds()
+
+        completed._set_output(outputs[self._stdout], outputs[self._stderr])
+
+        if finished:
+            returned = result.value()[_HEADER.size:]
+            if not returned:
+                return None
+            completed._set_returned(returned, self._shared_memory)
+
+        return completed
+
+    def _kill(self):
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def _close_fds(self):
+        for fd in self.fds():
+            os.close(fd)
+        self._shared_memory.close()
+        self.alive = False
+
+    def close(self):
+        """
+        Kills the worker and waits for it to exit.
+
+        It would exit by itself once its tasks pipe is closed, but any process
+        forked since it was started (such as by :func:`capture_function`)
+        holds that pipe open too.
+
+        """
+
+        if not self.alive:
+            return
+
+        self._kill()
+        self._close_fds()
+        _wait4(self.pid)
+
+class WorkerPool:
+    """
+    A pool of processes that each run many functions, one after another,
+    capturing them like :func:`capture_function` does. Forking a process for
+    every call takes much longer than most functions being tested do, so this
+    is much faster when a function is called many times.
+
+    :ivar processes: The number of worker processes.
+    :ivar timeout: How many seconds each call has to finish, or ``None`` if
+            calls can take as long as they like. A worker running a call that
+            times out is killed.
+    :ivar rlimits: A dictionary of resource limits to set in the workers (see
+            :func:`capture_function`). Note that a limit on CPU time counts
+            the time taken by all of the calls a worker has run.
+    :ivar maxtasksperchild: How many calls a worker runs before it is
+            replaced by a newly forked one, or ``None`` if workers are kept
+            for as long as they live.
+
+    Workers are forked when they are first needed, so that they see any
+    modules loaded up until then (such as those created by
+    :func:`interact.unittest.load_files`). A worker that dies or is killed is
+    replaced by a new one on the next call.
+
+    .. warning::
+
+        Unlike :func:`capture_function`, which runs every call in a fresh fork
+        of the harness, a worker keeps its state from one call to the next:
+        module globals, static variables in C++ code loaded by
+        :func:`interact.unittest.load_files`, anything left on the heap, and
+        the CPU time counted against ``rlimits``. A student's function that
+        keeps hidden state can then pass or fail depending on which worker
+        runs it and what it ran before. Set ``maxtasksperchild`` to ``1`` to
+        give every call a fresh worker (which is about as slow as
+        :func:`capture_function`), or to a larger number to at least bound
+        how much state can build up.
+
+    Functions and their arguments are sent to the workers pickled, which
+    means that module level functions work but lambdas and nested functions
+    don't. Those are run with :func:`capture_function` instead, which is
+    slower and starts from a fresh fork every time.
+
+    >>> with WorkerPool() as pool:
+    ...     completed = pool.apply(len, ("abc", ))
+    ...     completed.return_value
+    3
+
+    """
+
+    def __init__(self, processes = 1, timeout = None, rlimits = None,
+            maxtasksperchild = None):
+        self.processes = processes
+        self.timeout = timeout
+        self.rlimits = rlimits
+        self.maxtasksperchild = maxtasksperchild
+
+        # Workers that aren't running a call right now. None stands in for
+        # one that hasn't been forked yet.
+        self._idle = Queue.Queue()
+        for _ in range(processes):
+            self._idle.put(None)
+
+        self._workers = set()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _spawn(self):
+        with self._lock:
+            worker = _Worker(self.rlimits, list(self._workers))
+            self._workers.add(worker)
+
+        return worker
+
+    def _retire(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+        worker.close()
+
+    def apply(self, func, args = (), kwds = None, input = None,
+            max_bytes = None):
+        """
+        Calls ``func(*args, **kwds)`` in one of the workers, waiting for it to
+        finish. Can be called from several threads at once, in which case up
+        to :attr:`processes` calls run at the same time.
+
+        :param input: A string the function will read from stdin. If ``None``,
+                stdin is empty.
+        :param max_bytes: If not ``None``, at most this many bytes of stdout
+                and of stderr are kept.
+        :returns: A :class:`CompletedFunction`, as returned by
+                :meth:`CapturedFunction.communicate`. Its
+                :attr:`CompletedFunction.status` and
+                :attr:`CompletedFunction.rusage` are only set if the worker
+                died or was killed.
+
+        """
+
+        if kwds is None:
+            kwds = {}
+
+        try:
+            task = pickle.dumps(
+                (func, args, kwds), protocol = pickle.HIGHEST_PROTOCOL
+            )
+        except (pickle.PicklingError, TypeError):
+            return self._apply_forked(func, args, kwds, input, max_bytes)
+
+        worker = self._idle.get()
+        try:
+            if worker is None or not worker.alive:
+                worker = self._spawn()
+
+            completed = worker.call(task, input, self.timeout, max_bytes)
+        except BaseException:
+            # We don't know what state the worker is in.
+            if worker is not None:
+                self._retire(worker)
+            worker = None
+            raise
+        finally:
+            if worker is not None and (not worker.alive or
+                    self.maxtasksperchild is not None and
+                    worker.calls >= self.maxtasksperchild):
+                self._retire(worker)
+                worker = None
+            self._idle.put(worker)
+
+        if completed is None:
+            return self._apply_forked(func, args, kwds, input, max_bytes)
+
+        return completed
+
+    def _apply_forked(self, func, args, kwds, input, max_bytes):
+        captured = capture_function(
+            functools.partial(func, *args, **kwds),
+            timeout = self.timeout,
+            rlimits = self.rlimits
         )
+
+        return captured.communicate(input = input, max_bytes = max_bytes)
+
+    def close(self):
+        """
+        Stops all of the workers, waiting for them to exit. Don't call this
+        while calls are running. The pool can still be used afterwards, new
+        workers are forked as they are needed.
+
+        """
+
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+
+        for i in workers:
+            i.close()
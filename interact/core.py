@@ -23,8 +23,10 @@ are equivalent.
 """
 
 import _utils
+import plan
 import os.path
 import sys
+import time
 
 #: An OrderedDict type. The stdlib's ``collections`` module is searched first,
 #: then the module `ordereddict <https://pypi.python.org/pypi/ordereddict>`_ is
@@ -44,7 +46,14 @@ except (ImportError, AttributeError):
     except ImportError:
         pass
 
-class TestResult:
+# The flag set on the code object of a generator function. Hard coded rather
+# than taken from the inspect module, which is slow to import.
+_CO_GENERATOR = 0x20
+
+# The kinds of message arguments that are kept when a result is frozen.
+_SCALAR_TYPES = (basestring, int, long, float, bool, type(None))
+
+class TestResult(object):
     """
     Represents the result of one unit of testing. The goal is to generate a
     number of these and then pass them all out of the test harness with a final
@@ -66,16 +75,51 @@ class TestResult:
             ``False``, they will simply be printed out one-per-line. You can
             set this to ``False`` if only one message will ever be displayed to
             the user, otherwise bullet points usually look better.
+    :ivar examples_per_type: If not ``None``, only this many messages of each
+            ``type`` are kept, and any more messages of the same type are
+            folded into a single :class:`TestResult.Summary` that follows them.
+            Messages without a type are never folded.
+    :ivar max_messages: If not ``None``, once :attr:`messages` holds this many
+            messages any more messages are dropped. Their count and summed
+            ``dscore`` are kept in :attr:`dropped_count` and
+            :attr:`dropped_dscore` so :meth:`calculate_score` and the rendered
+            text still account for them.
+    :ivar dropped_count: The number of messages dropped because of
+            :attr:`max_messages`.
+    :ivar dropped_dscore: The summed ``dscore`` of the dropped messages, or
+            ``None`` if none of them had one.
+
+    Folding and dropping happen in :meth:`add_message` as messages arrive, so a
+    test that reports thousands of problems only ever holds a bounded number
+    of messages.
+
+    Results and their messages use ``__slots__`` to keep their memory use down
+    when many of them are held at once (such as when grading a batch of
+    submissions in ``server`` mode), so arbitrary attributes cannot be set on
+    them. Subclasses that don't declare ``__slots__`` themselves are free to.
 
     """
 
-    class Message:
+    __slots__ = (
+        "brief", "score", "max_score", "messages", "default_message",
+        "bulleted_messages", "examples_per_type", "max_messages",
+        "dropped_count", "dropped_dscore", "_summaries", "_dscore_total",
+        "_summed_messages", "_summed_count"
+    )
+
+    class Message(object):
         """
         A message to the user. This is the primary mode of giving feedback to
         users.
 
+        The message is formatted the first time it is converted to a string and
+        the formatted text is reused afterwards, so changing ``args`` or
+        ``kwargs`` after that has no effect on it.
+
         """
 
+        __slots__ = ("text", "args", "kwargs", "dscore", "type", "_rendered")
+
         def __init__(self, text, *args, **kwargs):
             # We have some special keyword arguments that we want to snatch if
             # present.
@@ -86,16 +130,79 @@ class TestResult:
             self.kwargs = kwargs
 
             self.text = text
+            self._rendered = None
 
         def __str__(self):
-            return self.text.format(*self.args, **self.kwargs)
+            if self._rendered is None:
+                self._rendered = self.text.format(*self.args, **self.kwargs)
+
+            return self._rendered
 
         def __repr__(self):
             return _utils.default_repr(self)
 
+        def freeze(self):
+            """
+            Formats the message and then lets go of its arguments, keeping only
+            the keyword arguments that are simple values (strings, numbers,
+            booleans, and ``None``).
+
+            """
+
+            self._rendered = str(self)
+            self.args = ()
+            self.kwargs = dict(
+                (k, v) for k, v in self.kwargs.items()
+                    if isinstance(v, _SCALAR_TYPES)
+            )
+
+        def __reduce__(self):
+            # Nested classes cannot be found by pickle, so point it at a module
+            # level function that can rebuild us.
+            return (
+                _make_message,
+                (self.text, self.args, self.kwargs, self._rendered)
+            )
+
+    class Summary(Message):
+        """
+        Stands in for every message of a particular type past the first
+        :attr:`examples_per_type <TestResult>` (see :meth:`add_message`).
+
+        :ivar count: The number of messages folded into this one.
+        :ivar dscore: The summed ``dscore`` of those messages, or ``None`` if
+                none of them had one.
+
+        """
+
+        __slots__ = ("count", )
+
+        def __init__(self, type, count = 0, dscore = None):
+            TestResult.Message.__init__(
+                self, "...and {count} more like this.", type = type
+            )
+            self.count = count
+            self.dscore = dscore
+
+        def add(self, message):
+            self.count += 1
+            if message.dscore is not None:
+                if self.dscore is None:
+                    self.dscore = message.dscore
+                else:
+                    self.dscore += message.dscore
+
+        def __str__(self):
+            # The count keeps changing, so never reuse an old rendering.
+            return self.text.format(count = self.count)
+
+        def __reduce__(self):
+            return (_make_summary, (self.type, self.count, self.dscore))
+
     def __init__(
             self, brief = None, score = None, max_score = None, messages = None,
-            default_message = None, bulleted_messages = True):
+            default_message = None, bulleted_messages = True,
+            examples_per_type = None, max_messages = None):
         if messages is None:
             messages = []
 
@@ -105,6 +212,38 @@ class TestResult:
         self.messages = messages
         self.default_message = default_message
         self.bulleted_messages = bulleted_messages
+        self.examples_per_type = examples_per_type
+        self.max_messages = max_messages
+        self.dropped_count = 0
+        self.dropped_dscore = None
+
+        # Maps each message type to a two-tuple of how many examples of it
+        # have been kept and its Summary (or None if nothing was folded yet).
+        self._summaries = {}
+
+        # A running total of the dscores of the first _summed_count messages of
+        # the list _summed_messages (None if none of them have one). Anything
+        # that changes the messages without going through add_message is
+        # noticed by _message_dscore_total.
+        self._dscore_total = None
+        self._summed_messages = None
+        self._summed_count = 0
+
+    def __getstate__(self):
+        # Only needed so results can be pickled with old pickle protocols,
+        # which don't know about __slots__. The running total is not worth
+        # keeping.
+        state = dict(getattr(self, "__dict__", {}))
+        for i in TestResult.__slots__:
+            if i not in ("_dscore_total", "_summed_messages", "_summed_count"):
+                state[i] = getattr(self, i)
+
+        return state
+
+    def __setstate__(self, state):
+        TestResult.__init__(self)
+        for key, value in state.items():
+            setattr(self, key, value)
 
     def add_message(self, *args, **kwargs):
         """
@@ -112,18 +251,114 @@ class TestResult:
         used, otherwise a new Message object is constructed and its constructor
         is passed all the arguments.
 
+        The message may be folded into a :class:`TestResult.Summary` or
+        dropped, see :attr:`examples_per_type <TestResult>` and
+        :attr:`max_messages <TestResult>`.
+
+        >>> a = TestResult(max_score = 10, examples_per_type = 2)
+        >>> for i in range(5):
+        ...     a.add_message("Line {0} is too long.", i, type = "long",
+        ...         dscore = -1)
+        >>> print a.calculate_score(min_score = 0).to_str(show_score = False)
+         * Line 0 is too long.
+         * Line 1 is too long.
+         * ...and 3 more like this.
+        >>> print a.score
+        5
+
         """
 
         if len(args) == 1 and isinstance(args[0], TestResult.Message):
-            self.messages.append(args[0])
+            message = args[0]
         else:
-            self.messages.append(TestResult.Message(*args, **kwargs))
+            message = TestResult.Message(*args, **kwargs)
+
+        up_to_date = self._summed_messages is self.messages and \
+            self._summed_count == len(self.messages)
+
+        folding = self.examples_per_type is not None and \
+            message.type is not None
+
+        # Figure out what (if anything) needs to be added to the list.
+        added = message
+        if folding:
+            examples, summary = self._summaries.get(message.type, (0, None))
+            if summary is not None:
+                summary.add(message)
+                added = None
+            elif examples >= self.examples_per_type:
+                added = TestResult.Summary(message.type)
+                added.add(message)
+
+        if added is not None:
+            if self.max_messages is not None and \
+                    len(self.messages) >= self.max_messages:
+                self._drop(message)
+                return
+
+            self.messages.append(added)
+            if up_to_date:
+                self._summed_count += 1
+
+            if folding and added is message:
+                self._summaries[message.type] = (examples + 1, None)
+            elif folding:
+                self._summaries[message.type] = (examples, added)
+
+        if up_to_date and message.dscore is not None:
+            if self._dscore_total is None:
+                self._dscore_total = message.dscore
+            else:
+                self._dscore_total += message.dscore
+
+    def freeze(self):
+        """
+        Freezes every message (see :meth:`TestResult.Message.freeze`) so that
+        the result no longer keeps whatever objects its messages were given
+        alive. The harness does this to every test's result once the test is
+        done, unless the test asks it not to (see :meth:`Harness.test`).
+
+        :returns: ``self``.
+
+        """
+
+        for i in self.messages:
+            i.freeze()
+
+        return self
+
+    def _drop(self, message):
+        self.dropped_count += 1
+        if message.dscore is not None:
+            if self.dropped_dscore is None:
+                self.dropped_dscore = message.dscore
+            else:
+                self.dropped_dscore += message.dscore
+
+    def _message_dscore_total(self):
+        """
+        Returns the sum of the ``dscore`` of every message (or ``None`` if no
+        message has one), only adding up the messages again if
+        :attr:`messages` was changed directly rather than through
+        :meth:`add_message`.
+
+        """
+
+        if self._summed_messages is not self.messages or \
+                self._summed_count != len(self.messages):
+            dscores = [i.dscore for i in self.messages if i.dscore is not None]
+            self._dscore_total = sum(dscores) if dscores else None
+            self._summed_messages = self.messages
+            self._summed_count = len(self.messages)
+
+        return self._dscore_total
 
     def calculate_score(self, starting_score = None, max_score = None,
             min_score = None):
         """
         Automatically calculates the score by adding up the ``dscore`` of
-        each message and setting the score of the :class:`TestResult`
+        each message (including any dropped by :attr:`max_messages
+        <TestResult>`) and setting the score of the :class:`TestResult`
         appropriately.
 
         :param starting_score: This score is added to the sum of every message's
@@ -158,12 +393,12 @@ class TestResult:
         if starting_score is None:
             starting_score = max_score
 
-        self.score = starting_score
-        self.max_score = max_score
+        total = self._message_dscore_total()
+        if self.dropped_dscore is not None:
+            total = self.dropped_dscore + (0 if total is None else total)
 
-        for i in self.messages:
-            if i.dscore is not None:
-                self.score += i.dscore
+        self.score = starting_score if total is None else starting_score + total
+        self.max_score = max_score
 
         if self.score < min_score:
             self.score = min_score
@@ -248,11 +483,17 @@ class TestResult:
             result += [str(self.brief), ""]
 
         if self.messages:
-            for i in self.messages:
+            lines = [str(i) for i in self.messages]
+            if self.dropped_count:
+                lines.append(
+                    "...and %d more messages not shown." % (self.dropped_count, )
+                )
+
+            for i in lines:
                 if self.bulleted_messages:
-                    result.append(" * " + str(i))
+                    result.append(" * " + i)
                 else:
-                    result.append(str(i))
+                    result.append(i)
             result.append("")
         elif self.default_message:
             result += [self.default_message, ""]
@@ -265,6 +506,14 @@ class TestResult:
     def __repr__(self):
         return _utils.default_repr(self)
 
+def _make_message(text, args, kwargs, rendered = None):
+    message = TestResult.Message(text, *args, **kwargs)
+    message._rendered = rendered
+    return message
+
+def _make_summary(type, count, dscore):
+    return TestResult.Summary(type, count, dscore)
+
 class UniverseSet(set):
     """
     A special ``set`` such that every ``in`` query returns ``True``.
@@ -339,6 +588,42 @@ class Harness:
             information on the different modes, check out :doc:`cli`.
     :ivar tests: A dictionary mapping test functions to
             :class:`Harness.Test` objects. This is of type :data:`ORDERED_DICT`.
+    :ivar plan: An :class:`ExecutionPlan <interact.plan.ExecutionPlan>` that
+            is kept up to date as tests are registered with :meth:`test`. Cyclic
+            dependencies are detected before any test is run.
+    :ivar only: A list of glob patterns. If not ``None``, only tests whose
+            names match one of them (and their dependencies) are run. Set by
+            the ``--only`` flag, see :doc:`cli`.
+    :ivar skip: A list of glob patterns of tests that should not be run unless
+            another test depends on them. Set by the ``--skip`` flag.
+    :ivar shard: A two-tuple ``(index, count)`` where ``index`` counts from
+            ``1``, or ``None``. If set, only the ``index``-th of ``count``
+            independent pieces of the harness is run. Set by the ``--shard``
+            flag.
+    :ivar server_socket: In ``server`` mode, the path of the Unix socket to
+            listen on, or ``None`` to read requests from standard input. Set by
+            the ``--socket`` flag.
+    :ivar journal_directory: A directory to keep crash recovery journals in,
+            or ``None`` (the default) to not keep any. See :meth:`run_tests`.
+    :ivar result_cache: A :class:`ResultCache <interact.cache.ResultCache>`
+            used to replay the results of tests whose declared inputs have not
+            changed, or ``None`` (the default) if no results should be cached.
+    :ivar stats_file: The path of a file to keep a history of how long each
+            test takes in, or ``None`` (the default) to not keep one. With a
+            history, the slowest tests (and the tests they unlock) are run
+            first and ``--shard`` splits the tests into pieces that take about
+            the same time. See :mod:`interact.stats`. A sharded run doesn't
+            write to the file itself, as shards running at the same time would
+            overwrite each other. Instead each shard outputs the durations it
+            measured, and :mod:`interact.merge` records all of them at once.
+    :ivar feedback_budget: The most bytes of JSON the harness may output in
+            ``galah`` (and ``server``) mode, or ``None`` (the default) for no
+            limit. Tests' messages are trimmed to fit, with tests that lost
+            more points getting a bigger share (see :meth:`finish`). When
+            sharded, each piece gets an equal part of the budget.
+    :ivar result_store: A :class:`ResultStore
+            <interact.resultstore.ResultStore>` that every graded submission
+            is recorded in, or ``None`` (the default).
 
     """
 
@@ -346,18 +631,49 @@ class Harness:
         """
         Meta information on a single test.
 
+        :ivar inputs: The test's declared inputs, or ``None`` if the test did
+                not declare any (in which case its result is never cached).
+        :ivar code_digest: A digest of the test function's code as returned by
+                :func:`interact.cache.hash_function`, or ``None`` if the test
+                did not declare any inputs.
+        :ivar duration: How long (in seconds) the test's function took the last
+                time it was run, or ``None`` if it has not been run.
+        :ivar freeze: Whether the test's result is frozen (see
+                :meth:`TestResult.freeze`) once it is returned.
+
         """
 
-        def __init__(self, name, depends, func, result = None):
+        def __init__(self, name, depends, func, result = None, inputs = None,
+                code_digest = None, freeze = True):
             self.name = name
             self.depends = [] if depends is None else depends
             self.func = func
             self.result = result
+            self.inputs = inputs
+            self.code_digest = code_digest
+            self.duration = None
+            self.freeze = freeze
 
     def __init__(self):
         self.sheep_data = {}
         self.tests = ORDERED_DICT()
         self.execution_mode = None
+        self.plan = plan.ExecutionPlan()
+        self.result_cache = None
+        self.only = None
+        self.skip = None
+        self.shard = None
+        self.server_socket = None
+        self.journal_directory = None
+        self.stats_file = None
+        self.feedback_budget = None
+        self.result_store = None
+        self._active_fixtures = []
+        self._batch_teardown_registered = False
+
+        # Maps the names of the tests run (rather than replayed) by the last
+        # call to _run_tests to how long they took.
+        self._measured = {}
 
     def _parse_arguments(self, args = sys.argv[1:]):
         """
@@ -379,7 +695,7 @@ class Harness:
         option_list = [
             make_option(
                 "-m", "--mode", dest = "mode", action = "store",
-                default = "galah", choices = ("galah", "test"),
+                default = "galah", choices = ("galah", "test", "server"),
                 help = "Specify the mode of execution the Test Harness is in. "
                        "Default mode is %default."
             ),
@@ -387,6 +703,32 @@ class Harness:
                 "-s", "--set-value", dest = "values", action = "append",
                 nargs = 2, metavar = "KEY VALUE",
                 help = "Sets one of the 'configuration' values."
+            ),
+            make_option(
+                "--socket", dest = "socket", action = "store",
+                metavar = "PATH",
+                help = "In server mode, listen for requests on a Unix socket "
+                       "at PATH rather than reading them from standard input."
+            ),
+            make_option(
+                "--only", dest = "only", action = "append",
+                metavar = "PATTERN",
+                help = "Only run tests whose names match this glob pattern "
+                       "(and the tests they depend on). May be given more "
+                       "than once."
+            ),
+            make_option(
+                "--skip", dest = "skip", action = "append",
+                metavar = "PATTERN",
+                help = "Don't run tests whose names match this glob pattern "
+                       "unless another test depends on them. May be given "
+                       "more than once."
+            ),
+            make_option(
+                "--shard", dest = "shard", action = "store",
+                metavar = "I/N",
+                help = "Split the tests into N independent pieces and only "
+                       "run the I-th one (counting from 1)."
             )
         ]
 
@@ -398,6 +740,17 @@ class Harness:
 
         options, args = parser.parse_args(args)
 
+        if options.shard is not None:
+            try:
+                index, count = [int(i) for i in options.shard.split("/")]
+            except ValueError:
+                parser.error("--shard expects a value like 2/5.")
+
+            if not 1 <= index <= count:
+                parser.error("--shard index must be between 1 and %d." % count)
+
+            options.shard = (index, count)
+
         return (options, args)
 
     @staticmethod
@@ -437,10 +790,19 @@ class Harness:
 
         options, args = self._parse_arguments(arguments)
 
+        self.only = options.only
+        self.skip = options.skip
+        self.shard = options.shard
+
         self.execution_mode = options.mode
+        self.server_socket = options.socket
         if options.mode == "galah":
             json = json_module()
             self.sheep_data = json.load(sys.stdin)
+        elif options.mode == "server":
+            # Every request brings its own sheep data, these are only here for
+            # any code that runs while the harness is warming up.
+            self.sheep_data = Harness._guess_values()
         elif options.mode == "test":
             self.sheep_data = Harness._guess_values()
 
@@ -469,13 +831,75 @@ class Harness:
         a human readable fashion. Otherwise it will print out JSON appropriate
         for Galah to read.
 
+        In ``server`` mode, this is where the harness starts serving requests
+        (see :mod:`interact.server`). It returns once there are no more
+        requests.
+
+        If :attr:`feedback_budget <Harness>` is set, the JSON output is kept
+        within it by trimming tests' messages. Every test is given a share of
+        the budget in proportion to one plus the points it lost, and any share
+        a test doesn't need is handed to the others, so short messages are
+        never trimmed to make room for long ones.
+
+        """
+
+        if self.execution_mode == "server":
+            import server
+            server.serve(self, score, max_score)
+        elif self.execution_mode == "test":
+            score, max_score = self._total_score(score, max_score)
+
+            for i in self.tests.values():
+                if i.result:
+                    print i.result
+                    print "-------"
+            print "Final result: %d out of %d" % (score, max_score)
+        elif self.execution_mode == "galah":
+            json = json_module()
+            json.dump(self._galah_results(score, max_score), sys.stdout)
+        else:
+            # A bad execution mode should be detected in the start() function.
+            # This is our fault if a user encounters this (and didn't set
+            # execution_mode themselves).
+            raise AssertionError("Unknown execution mode.")
+
+        # The results are only stored once they've been output, so that a
+        # problem with the store can't cost the student their grade.
+        if self.execution_mode != "server":
+            sys.stdout.flush()
+            self._store_results(score, max_score)
+
+    def _store_results(self, score = None, max_score = None):
+        """
+        Records the results of the tests in :attr:`result_store <Harness>` if
+        there is one. Any error while doing so (ex: the database is locked or
+        the disk is full) is printed to standard error rather than raised.
+
+        """
+
+        if self.result_store is None:
+            return
+
+        try:
+            self.result_store.add(self, score, max_score)
+            self.result_store.flush()
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+    def _total_score(self, score = None, max_score = None):
+        """
+        Returns a two-tuple ``(score, max_score)``. Either value that is
+        ``None`` is replaced by the sum of that value over every test that was
+        run.
+
         """
 
         if score is None or max_score is None:
             new_score = 0
             new_max_score = 0
             for i in self.tests.values():
-                if i is not None:
+                if i.result is not None:
                     if i.result.score:
                         new_score += i.result.score
 
@@ -488,48 +912,284 @@ class Harness:
             if max_score is None:
                 max_score = new_max_score
 
-        if self.execution_mode == "test":
-            for i in self.tests.values():
-                if i.result:
-                    print i.result
-                    print "-------"
-            print "Final result: %d out of %d" % (score, max_score)
-        elif self.execution_mode == "galah":
-            import json
-            results = {
+        return (score, max_score)
+
+    def _galah_results(self, score = None, max_score = None):
+        """
+        Returns the dictionary that is given to Galah as JSON once the tests
+        have been run.
+
+        """
+
+        total_score, total_max_score = self._total_score(score, max_score)
+        results = {
+            "score": total_score,
+            "max_score": total_max_score,
+            "tests": []
+        }
+
+        positions = []
+        weights = []
+        for key, i in self.tests.items():
+            if i.result is not None:
+                results["tests"].append(i.result.to_galah_dict(i.name))
+                weights.append(1 + max(
+                    (i.result.max_score or 0) - (i.result.score or 0), 0
+                ))
+                if key in self.plan:
+                    positions.append(self.plan.position(key))
+
+        # Sharded output needs to be put back together by interact.merge
+        # before it is handed to Galah, so give it what it needs.
+        if self.shard is not None:
+            results["shard"] = {
+                "index": self.shard[0],
+                "count": self.shard[1],
+                "positions": positions,
+                "total": len(self._selected_plan()),
                 "score": score,
-                "max_score": max_score,
-                "tests": []
+                "max_score": max_score
             }
 
-            for i in self.tests.values():
-                if i is not None:
-                    results["tests"].append(i.result.to_galah_dict(i.name))
+            # Shards don't save their history themselves, interact.merge
+            # records it for all of them.
+            if self.stats_file is not None:
+                results["shard"]["stats_file"] = \
+                    _utils.resolve_path(self.stats_file)
+                results["shard"]["durations"] = self._measured
 
-            json.dump(results, sys.stdout)
-        else:
-            # A bad execution mode should be detected in the start() function.
-            # This is our fault if a user encounters this (and didn't set
-            # execution_mode themselves).
-            raise AssertionError("Unknown execution mode.")
+        if self.feedback_budget is not None:
+            budget = self.feedback_budget
+            if self.shard is not None:
+                budget //= self.shard[1]
+
+            self._fit_feedback(results, weights, budget)
+
+        return results
+
+    @staticmethod
+    def _fit_feedback(results, weights, budget):
+        """
+        Trims the messages of the tests in ``results`` (as returned by
+        :meth:`_galah_results`) so that it is at most ``budget`` bytes once
+        encoded as JSON.
+
+        """
 
-    def test(self, name, depends = None):
+        import pretty
+        json = json_module()
+
+        def size(string):
+            # The encoded size of a string, not counting its quotes.
+            return len(json.dumps(string)) - 2
+
+        # Messages are cut by character, so a byte string must be decoded
+        # first or we could cut a multibyte UTF-8 character in half (which
+        # json can't encode).
+        messages = []
+        for i in results["tests"]:
+            message = i["message"]
+            if isinstance(message, str):
+                message = message.decode("utf-8", "replace")
+            messages.append(message)
+            i["message"] = ""
+
+        # Whatever isn't a message has to be sent no matter what.
+        available = budget - len(json.dumps(results))
+
+        demands = [size(i) for i in messages]
+        allocations = pretty.allocate_budget(available, demands, weights)
+        for test, message, allocation in \
+                zip(results["tests"], messages, allocations):
+            test["message"] = pretty.fit_string(message, allocation, size)
+
+    def test(self, name, depends = None, inputs = None, freeze = True):
         """
         A decorator that takes in a test name and some dependencies and makes
         the harness aware of it all.
 
+        :param name: The name of the test that will be shown to the student.
+        :param depends: A list of test functions that must pass before this
+                test is run.
+        :param inputs: A list of everything the test's result depends on (ex:
+                the student's files, the harness's own source file, or a
+                version string you bump whenever a test's behavior changes).
+                Paths to existing files are hashed by their contents. If given,
+                and :attr:`result_cache <Harness>` is set, the test will not be
+                run again unless its inputs or its code change. See
+                :mod:`interact.cache`.
+        :param freeze: If ``True``, the test's result is frozen (see
+                :meth:`TestResult.freeze`) as soon as the test returns it, so
+                large objects given to its messages (such as lists of lines)
+                can be freed. Set this to ``False`` if something needs the
+                messages' original arguments after the test is run.
+
         """
 
         def test_decorator(func):
             def inner(*args, **kwargs):
                 return func(*args, **kwargs)
 
-            self.tests[inner] = Harness.Test(name, depends, inner)
+            code_digest = None
+            if inputs is not None:
+                import cache
+                code_digest = cache.hash_function(func)
+
+            self.tests[inner] = Harness.Test(
+                name, depends, inner, inputs = inputs,
+                code_digest = code_digest, freeze = freeze
+            )
+            self.plan.add(inner, name, depends)
 
             return inner
 
         return test_decorator
 
+    #: The scopes a fixture may have. See :meth:`fixture`.
+    FIXTURE_SCOPES = ("test", "submission", "batch")
+
+    class Fixture:
+        """
+        A value shared between tests that is computed the first time it is
+        needed. Created with :meth:`Harness.fixture`. Call the fixture (with no
+        arguments) to get its value.
+
+        :ivar func: The function that computes the fixture's value.
+        :ivar scope: One of :attr:`Harness.FIXTURE_SCOPES`.
+
+        """
+
+        def __init__(self, harness, func, scope):
+            self.harness = harness
+            self.func = func
+            self.scope = scope
+            self.__name__ = func.__name__
+            self.__doc__ = func.__doc__
+
+            self._active = False
+            self._value = None
+            self._generator = None
+
+        def __call__(self):
+            if not self._active:
+                # Generator functions provide their value with their first
+                # yield, and tear it down when resumed.
+                if self.func.__code__.co_flags & _CO_GENERATOR:
+                    generator = self.func()
+                    value = next(generator)
+                    self._generator = generator
+                else:
+                    value = self.func()
+
+                self._value = value
+                self._active = True
+                self.harness._active_fixtures.append(self)
+
+            return self._value
+
+        def teardown(self):
+            """
+            Forgets the fixture's value (running its teardown code if it has
+            any) so that it is computed again the next time it is needed.
+            Does nothing if the fixture has no value.
+
+            """
+
+            if not self._active:
+                return
+
+            generator = self._generator
+            self._active = False
+            self._value = None
+            self._generator = None
+
+            if generator is not None:
+                try:
+                    next(generator)
+                except StopIteration:
+                    pass
+                else:
+                    raise RuntimeError(
+                        "Fixture %s yielded more than once." % (self.__name__, )
+                    )
+
+    def fixture(self, scope = "submission"):
+        """
+        A decorator that turns a function into a :class:`Harness.Fixture`: an
+        expensive value (such as a compiled executable or the student's code
+        loaded with :func:`interact.unittest.load_files`) that tests can share.
+        The function is only called the first time a test asks for the value,
+        and every other test in the same scope gets the same value.
+
+        :param scope: When the value is thrown away. ``"test"`` means at the end
+                of each test, ``"submission"`` means at the end of
+                :meth:`run_tests`, and ``"batch"`` means when the harness
+                process exits (useful in ``server`` mode, where batch fixtures
+                that were used before :meth:`finish` is called are shared by
+                every submission).
+
+        If the function is a generator, the value is whatever it yields first,
+        and the rest of the generator is run when the value is thrown away. Use
+        this to clean up after a fixture.
+
+        .. code-block:: python
+
+            @harness.fixture()
+            def student_code():
+                return interact.unittest.load_files(student_files)
+
+            @harness.test("foo works", depends = [check_compilation])
+            def check_foo():
+                foo = student_code()["main"]["foo"]
+                ...
+
+            @harness.test("bar works", depends = [check_compilation])
+            def check_bar():
+                # The student's code is not compiled a second time.
+                bar = student_code()["main"]["bar"]
+                ...
+
+        """
+
+        if scope not in Harness.FIXTURE_SCOPES:
+            raise ValueError(
+                "Unknown fixture scope %r, expected one of %s." %
+                    (scope, ", ".join(Harness.FIXTURE_SCOPES))
+            )
+
+        if scope == "batch" and not self._batch_teardown_registered:
+            import atexit
+            atexit.register(self._teardown_fixtures, "batch")
+            self._batch_teardown_registered = True
+
+        def fixture_decorator(func):
+            return Harness.Fixture(self, func, scope)
+
+        return fixture_decorator
+
+    def _teardown_fixtures(self, scope):
+        """
+        Tears down every active fixture with the given scope, most recently
+        created first. Errors are printed rather than raised so that one bad
+        fixture can't keep the others from being cleaned up.
+
+        """
+
+        remaining = []
+        for fixture in reversed(self._active_fixtures):
+            if fixture.scope != scope:
+                remaining.append(fixture)
+                continue
+
+            try:
+                fixture.teardown()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+
+        remaining.reverse()
+        self._active_fixtures = remaining
+
     class CyclicDependency(RuntimeError):
         def __init__(self, *args, **kwargs):
             RuntimeError.__init__(self, *args, **kwargs)
@@ -576,58 +1236,221 @@ class Harness:
                 dependency_name = test_name
             )
 
-    def run_tests(self):
+    def run_tests(self, journal = None):
         """
         Runs all of the tests the user has registered.
 
+        :param journal: A directory to keep a journal of finished tests in, or
+                ``None`` to use :attr:`journal_directory <Harness>`. If the
+                harness is killed part way through, running it again on the
+                same submission replays the finished tests from the journal
+                rather than running them again. See :mod:`interact.journal`.
+
         :raises: :class:`Harness.CyclicDependency` if a cyclic dependency exists
-                among the test functions.
+                among the test functions. This is raised before any test is
+                run.
 
         Any tests that can't be run due to failed dependencies will have
-        instances of :class:`Harness.FailedDependencies` as their result.
+        instances of :class:`Harness.FailedDependencies` as their result. Tests
+        that were not selected to run (see :attr:`only <Harness>`,
+        :attr:`skip <Harness>`, and :attr:`shard <Harness>`) keep ``None`` as
+        their result and are left out by :meth:`finish`.
+
+        In ``server`` mode this does nothing, the tests are run for each
+        request once :meth:`finish` is called.
 
         """
 
-        # Do a topological sort with a simple depth-first-search algorithm.
-        # Thank you wikipedia for the pseudocodeand inspiration:
-        # http://en.wikipedia.org/wiki/Topological_sorting
-        temporary_marks = set()
-        permanent_marks = set()
+        if journal is not None:
+            self.journal_directory = journal
 
-        def visit(node):
-            if node in temporary_marks:
-                raise Harness.CyclicDependency(
-                    "One or more cyclic dependencies exist among your test "
-                    "functions."
-                )
+        if self.execution_mode == "server":
+            return
 
-            if node not in permanent_marks:
-                # Temporarily mark the node. This is necessary because if we
-                # end up hitting a node that has a temporary mark as we recurse
-                # through the "DAG", it means we have a cycle. Hitting a
-                # permanently marked node when we're recursing is fine because
-                # all that means is two nodes share the same dependency.
-                temporary_marks.add(node)
+        self._run_tests()
+
+    def _run_tests(self):
+        """
+        Does the work of :meth:`run_tests` regardless of the execution mode.
+
+        """
+
+        self._measured = {}
+
+        stats = None
+        costs = None
+        if self.stats_file is not None:
+            import stats as stats_module
+            stats = stats_module.TestStats(self.stats_file)
+            costs = stats.costs(self.tests)
+
+        execution_plan = self._selected_plan()
+        if self.shard is not None:
+            index, count = self.shard
+            execution_plan = execution_plan.shard(index - 1, count, costs)
+
+        if costs is not None:
+            order = execution_plan.schedule(costs)
+        else:
+            order = execution_plan.order
+
+        journal = None
+        journaled = {}
+        if self.journal_directory is not None:
+            import journal as journal_module
+            journal = journal_module.Journal.for_submission(
+                self.journal_directory, self.sheep_data, shard = self.shard
+            )
+            journaled = journal.load()
+
+        # Every test comes after its dependencies in the order, so their
+        # results are always ready by the time we get to it.
+        try:
+            for key in order:
+                node = self.tests[key]
 
                 dependencies_failed = []
                 for dependency in (self.tests[i] for i in node.depends):
-                    if visit(dependency).result.is_failing():
+                    if dependency.result.is_failing():
                         dependencies_failed.append(dependency)
 
-                temporary_marks.remove(node)
-                permanent_marks.add(node)
-
                 if not dependencies_failed:
-                    node.result = node.func()
+                    journal_key = (self.plan.position(key), node.name)
+                    if journal_key in journaled:
+                        node.result = journaled[journal_key]
+                        continue
+
+                    started = time.time()
+                    try:
+                        node.result, cached = self._run_test(node)
+                    finally:
+                        self._teardown_fixtures("test")
+                    node.duration = time.time() - started
+
+                    # A result from the cache took next to no time, which
+                    # says nothing about how long the test takes to run.
+                    if not cached:
+                        self._measured[node.name] = node.duration
+                        if stats is not None:
+                            stats.record(node.name, node.duration)
+
+                    if journal is not None:
+                        journal.record(journal_key[0], node.name, node.result)
                 else:
                     node.result = Harness.FailedDependencies()
                     for i in dependencies_failed:
                         node.result.add_failure(i.name)
+        finally:
+            self._teardown_fixtures("submission")
+
+        # Every test finished, so there's nothing left to resume.
+        if journal is not None:
+            journal.remove()
+
+        # Shards running at the same time would overwrite each other's
+        # history, so only a full run updates it (see interact.merge for
+        # sharded runs).
+        if stats is not None and self.shard is None:
+            stats.save()
+
+    def _selected_plan(self):
+        """
+        Returns the plan of tests selected by :attr:`only <Harness>` and
+        :attr:`skip <Harness>`, before it is split up by :attr:`shard
+        <Harness>`.
+
+        :raises: :class:`Harness.CyclicDependency` if any test can never be
+                run.
+
+        """
+
+        execution_plan = self._current_plan()
+
+        unresolved = execution_plan.unresolved()
+        if unresolved:
+            raise Harness.CyclicDependency(
+                "One or more cyclic dependencies exist among your test "
+                "functions (or a test depends on a function that is not a "
+                "registered test). Tests that cannot be run: %s." %
+                    (", ".join(execution_plan.names[i] for i in unresolved), )
+            )
+
+        if self.only is not None or self.skip is not None:
+            execution_plan = execution_plan.select(self.only, self.skip)
+
+        return execution_plan
+
+    def estimate_duration(self, workers = 1):
+        """
+        Estimates how long running the selected tests will take based on the
+        history in :attr:`stats_file <Harness>`.
+
+        :param workers: How many tests could be run at once.
+        :returns: The estimated number of seconds, or ``None`` if there is no
+                :attr:`stats_file <Harness>`.
+
+        """
+
+        if self.stats_file is None:
+            return None
+
+        import stats
+        costs = stats.TestStats(self.stats_file).costs(self.tests)
+        return self._selected_plan().estimate(costs, workers)
+
+    def _current_plan(self):
+        """
+        Returns :attr:`plan <Harness>`, or a freshly built plan if tests were
+        added to or removed from :attr:`tests <Harness>` directly rather than
+        through :meth:`test`.
+
+        """
+
+        in_sync = len(self.plan) == len(self.tests) and \
+            all(i in self.plan for i in self.tests)
+        if not in_sync:
+            self.plan = plan.ExecutionPlan.from_tests(self.tests)
+
+        return self.plan
+
+    def _run_test(self, test):
+        """
+        Runs a single test's function, going through :attr:`result_cache
+        <Harness>` if the test declared its inputs.
+
+        :returns: A two-tuple of the test's result and whether it came from
+                the cache (rather than the test actually being run).
+
+        """
+
+        if self.result_cache is None or test.inputs is None:
+            return (self._call_test(test), False)
+
+        key = self.result_cache.make_key(
+            test.name, test.code_digest, test.inputs
+        )
+
+        result = self.result_cache.get(key)
+        if result is not None:
+            return (result, True)
+
+        result = self._call_test(test)
+        self.result_cache.put(key, result)
+
+        return (result, False)
+
+    @staticmethod
+    def _call_test(test):
+        """
+        Calls a test's function and freezes its result if it should be.
+
+        """
 
-            return node
+        result = test.func()
+        if test.freeze and isinstance(result, TestResult):
+            result.freeze()
 
-        for test in self.tests.values():
-            visit(test)
+        return result
 
     def student_file(self, filename):
         """
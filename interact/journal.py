@@ -0,0 +1,192 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module provides an append-only journal of finished test results that lets
+a harness pick up where it left off if it is killed part way through grading a
+submission (for example by the out-of-memory killer, or by a crash inside a
+student's code loaded with :mod:`interact.unittest`).
+
+.. code-block:: python
+
+    harness.run_tests(journal = "/var/lib/galah/journals")
+
+If the harness dies and is started again on the same submission, every test
+that finished before the crash is replayed from the journal and only the
+remaining tests are run. The journal is deleted once every test has finished.
+
+"""
+
+import _utils
+import hashlib
+import os
+import os.path
+import pickle
+import struct
+
+# Every record is its length followed by that many bytes of pickled data, which
+# lets us detect a record that was only partially written.
+_HEADER = struct.Struct("!I")
+
+def submission_key(sheep_data, shard = None):
+    """
+    Creates a key identifying a submission being graded by a particular
+    harness.
+
+    :param sheep_data: The harness's :attr:`sheep_data
+            <interact.core.Harness>`.
+    :param shard: The harness's :attr:`shard <interact.core.Harness>`. Each
+            shard of a submission gets its own key, as shards may be run at
+            the same time.
+    :returns: A hex string. The submission's ID is used if Galah provided one,
+            otherwise the path to the student's code is used. The same goes for
+            the harness's ID and its directory.
+
+    """
+
+    submission = sheep_data.get("raw_submission") or {}
+    harness = sheep_data.get("raw_harness") or {}
+
+    parts = (
+        submission.get("id") or sheep_data.get("testables_directory"),
+        harness.get("id") or sheep_data.get("harness_directory")
+    )
+    if shard is not None:
+        parts += tuple(shard)
+
+    return hashlib.sha1(repr(parts)).hexdigest()
+
+class Journal:
+    """
+    A file of test results, each one appended (and flushed to disk) as soon as
+    its test finishes.
+
+    :ivar path: The absolute path of the journal file.
+    :ivar sync: If ``True``, every record is ``fsync``-ed to disk before
+            :meth:`record` returns, so even a machine crash won't lose it.
+
+    Records are keyed by a test's position in the harness's
+    :class:`ExecutionPlan <interact.plan.ExecutionPlan>` along with its name, so
+    a journal written by an older version of a harness won't be applied to the
+    wrong tests.
+
+    """
+
+    def __init__(self, path, sync = True):
+        self.path = _utils.resolve_path(path)
+        self.sync = sync
+        self._file = None
+
+    @classmethod
+    def for_submission(cls, directory, sheep_data, sync = True, shard = None):
+        """
+        :returns: The :class:`Journal` inside ``directory`` for the submission
+                described by ``sheep_data``, or for one shard of it (see
+                :func:`submission_key`). The directory is created if it does
+                not exist.
+
+        """
+
+        directory = _utils.resolve_path(directory)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        return cls(
+            os.path.join(
+                directory, submission_key(sheep_data, shard) + ".journal"
+            ),
+            sync = sync
+        )
+
+    def load(self):
+        """
+        Reads every complete record in the journal. If the journal ends with a
+        partial record (because the harness died while writing it), that
+        record is discarded.
+
+        :returns: A dictionary mapping ``(position, name)`` two-tuples to
+                ``TestResult`` objects.
+
+        """
+
+        results = {}
+        if not os.path.exists(self.path):
+            return results
+
+        valid_length = 0
+        with open(self.path, "rb") as f:
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+
+                length, = _HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+
+                try:
+                    position, name, result = pickle.loads(payload)
+                except Exception:
+                    break
+
+                results[(position, name)] = result
+                valid_length = f.tell()
+
+        # Chop off anything we couldn't read so new records can be appended
+        # after the last good one.
+        if valid_length != os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_length)
+
+        return results
+
+    def record(self, position, name, result):
+        """
+        Appends a test's result to the journal. Results that cannot be pickled
+        are silently skipped (the test will simply be run again after a
+        crash).
+
+        """
+
+        try:
+            payload = pickle.dumps(
+                (position, name, result), pickle.HIGHEST_PROTOCOL
+            )
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+
+        if self._file is None:
+            self._file = open(self.path, "ab")
+
+        self._file.write(_HEADER.pack(len(payload)) + payload)
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def remove(self):
+        """
+        Closes and deletes the journal.
+
+        """
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,176 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module combines the output of a harness that was run in several pieces
+with the ``--shard`` flag (see :doc:`cli`) into a single result that Galah can
+read. It can be run as a script:
+
+.. code-block:: bash
+
+    ./my_harness.py --shard 1/2 < sheep.json > shard1.json
+    ./my_harness.py --shard 2/2 < sheep.json > shard2.json
+    python -m interact.merge shard1.json shard2.json > result.json
+
+If the harness has a :attr:`stats_file <interact.core.Harness>`, the script
+also records how long each shard's tests took in it (see
+:func:`record_durations`), which the shards can't safely do themselves.
+
+"""
+
+import sys
+
+import core
+
+class MergeError(RuntimeError):
+    """
+    Raised when a set of shard results cannot be merged, such as when a shard
+    is missing or the shards came from different splits.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        RuntimeError.__init__(self, *args, **kwargs)
+
+def merge_results(results):
+    """
+    Merges the JSON output of every shard of a harness.
+
+    :param results: A list of dictionaries, each one the deserialized output of
+            a harness run in ``galah`` mode with ``--shard``. They may be in
+            any order.
+    :returns: A dictionary in the format a harness outputs normally. Tests are
+            in the order the harness registered them.
+
+    :raises: :class:`MergeError` if the results are not exactly one of each
+            shard of the same split.
+
+    If the harness gave :meth:`Harness.finish <interact.core.Harness.finish>`
+    an explicit ``score`` or ``max_score`` that value is used, otherwise the
+    shards' values are summed.
+
+    """
+
+    if not results:
+        raise MergeError("No shard results were given.")
+
+    for i in results:
+        if "shard" not in i:
+            raise MergeError("A result was not produced with --shard.")
+
+    count = results[0]["shard"]["count"]
+    indexes = sorted(i["shard"]["index"] for i in results)
+    if indexes != range(1, count + 1) or \
+            any(i["shard"]["count"] != count for i in results):
+        raise MergeError(
+            "Expected exactly one result for each of %d shards, got shards "
+            "%s." % (count, indexes)
+        )
+
+    tests = []
+    for result in results:
+        positions = result["shard"]["positions"]
+        if len(positions) != len(result["tests"]):
+            raise MergeError(
+                "Shard %d is missing test positions." %
+                    (result["shard"]["index"], )
+            )
+        tests.extend(zip(positions, result["tests"]))
+    tests.sort(key = lambda x: x[0])
+
+    # Shards balanced by test history only agree on the split if they read the
+    # same history, so make sure every test was run exactly once.
+    positions = [i[0] for i in tests]
+    if len(set(positions)) != len(positions):
+        raise MergeError("More than one shard ran the same test.")
+
+    total = results[0]["shard"].get("total")
+    if total is not None and len(positions) != total:
+        raise MergeError(
+            "Expected %d tests across all shards, got %d." %
+                (total, len(positions))
+        )
+
+    merged = {"tests": [i[1] for i in tests]}
+    for field in ("score", "max_score"):
+        explicit = results[0]["shard"][field]
+        if explicit is not None:
+            merged[field] = explicit
+        else:
+            merged[field] = sum(i[field] for i in results)
+
+    return merged
+
+def record_durations(results):
+    """
+    Records the durations of the tests run by every shard in the
+    :attr:`stats_file <interact.core.Harness>` the shards were run with, saving
+    the file once.
+
+    :param results: A list of dictionaries, each one the deserialized output of
+            a harness run in ``galah`` mode with ``--shard``. Results from
+            harnesses without a stats file are ignored.
+
+    """
+
+    import stats
+
+    # Maps each stats file to the durations to record in it.
+    durations = {}
+    for result in results:
+        shard = result.get("shard", {})
+        if shard.get("stats_file") is not None:
+            durations.setdefault(shard["stats_file"], {}).update(
+                shard.get("durations", {})
+            )
+
+    for path, measured in durations.items():
+        history = stats.TestStats(path)
+        for name, seconds in sorted(measured.items()):
+            history.record(name, seconds)
+        history.save()
+
+def main(args = sys.argv[1:]):
+    """
+    main(args = sys.argv[1:])
+
+    Reads shard results from the files named in ``args`` (``-`` means standard
+    input, where the results may also be given one per line) and writes the
+    merged result to standard output. Then records the shards' durations (see
+    :func:`record_durations`).
+
+    """
+
+    json = core.json_module()
+
+    results = []
+    for path in args:
+        if path == "-":
+            results.extend(
+                json.loads(line) for line in sys.stdin if line.strip()
+            )
+        else:
+            with open(path) as f:
+                results.append(json.load(f))
+
+    json.dump(merge_results(results), sys.stdout)
+    sys.stdout.flush()
+
+    record_durations(results)
+
+if __name__ == "__main__":
+    main()
@@ -24,7 +24,17 @@ provides a nice abstraction to Clang.
 
 """
 
-class Block:
+import array
+import bisect
+import collections
+import hashlib
+import itertools
+import os
+import re
+
+import _utils
+
+class Block(object):
     """
     Represents a block of code.
 
@@ -32,15 +42,49 @@ class Block:
     :ivar sub_blocks: A list of ``Block`` objects that are children of
             this block.
 
+    Blocks created by :func:`grab_blocks` only remember which of the lines
+    they were given belong to them, and build their list of lines the first
+    time :attr:`lines` is used.
+
     """
 
     def __init__(self, lines, sub_blocks = None):
         if sub_blocks is None:
             sub_blocks = []
 
-        self.lines = lines
+        self._lines = lines
         self.sub_blocks = sub_blocks
 
+        # The lines this block's lines are taken from, and a list of
+        # ``(start, end)`` slices of them that belong to this block.
+        self._source = None
+        self._spans = None
+
+    @classmethod
+    def _from_spans(cls, source, spans, sub_blocks):
+        block = cls(None, sub_blocks)
+        block._source = source
+        block._spans = spans
+        return block
+
+    @property
+    def lines(self):
+        if self._lines is None:
+            self._lines = []
+            for start, end in self._spans:
+                self._lines.extend(self._source[start:end])
+
+            self._source = None
+            self._spans = None
+
+        return self._lines
+
+    @lines.setter
+    def lines(self, value):
+        self._lines = value
+        self._source = None
+        self._spans = None
+
     def _to_str_list(self, indent_level = 0):
         result = [("\t" * indent_level) + repr(i) for i in self.lines]
         for i in self.sub_blocks:
@@ -51,7 +95,10 @@ class Block:
     def __str__(self):
         return "\n".join(self._to_str_list())
 
-class Line:
+# Stands in for an indentation level that hasn't been worked out yet.
+_UNKNOWN = object()
+
+class Line(object):
     """
     Represents a line of code.
 
@@ -60,16 +107,30 @@ class Line:
 
     """
 
+    __slots__ = ("_code", "line_number", "_indent")
+
     def __init__(self, line_number, code):
         self.code = code
         self.line_number = line_number
 
+    @property
+    def code(self):
+        return self._code
+
+    @code.setter
+    def code(self, value):
+        self._code = value
+        self._indent = _UNKNOWN
+
     def __str__(self):
         return self.code
 
     def __repr__(self):
         return "Line(%d, %s)" % (self.line_number, repr(self.code))
 
+    def __reduce__(self):
+        return (Line, (self.line_number, self.code))
+
     def indent_level(self):
         """
         Determines the indentation level of the current line.
@@ -80,18 +141,11 @@ class Line:
 
         """
 
-        # Iterates through the line character by character until a
-        # non-whitespace character is hit.
-        for i, c in enumerate(self.code):
-            if c not in [" ", "\t"]:
-                break
-        else:
-            # If we never hit a non-whitespace character...
-            return None
+        if self._indent is _UNKNOWN:
+            stripped = self.code.lstrip(" \t")
+            self._indent = len(self.code) - len(stripped) if stripped else None
 
-        # i is the position of the first non-whitespace character, and because i
-        # is zero-indexed, i is also the number of whitespace characters we saw.
-        return i
+        return self._indent
 
     @classmethod
     def make_lines(cls, lines, start = 1):
@@ -175,10 +229,201 @@ class Line:
 
         return self.code == other.code and self.line_number == other.line_number
 
+#: The kinds of :class:`Span` that :func:`tokenize` yields.
+CODE, STRING, CHAR, COMMENT = "code", "string", "char", "comment"
+
+#: A piece of a single line of code found by :func:`tokenize`. ``kind`` is one
+#: of :data:`CODE`, :data:`STRING`, :data:`CHAR`, or :data:`COMMENT`. ``line`` is
+#: the index of the line (counting from ``0``) in the lines given to
+#: :func:`tokenize`, and ``start`` and ``end`` are the slice of the line the
+#: span covers. Strings and character literals include their quotes, and
+#: comments include their ``//``, ``/*``, and ``*/``.
+Span = collections.namedtuple("Span", "kind line start end")
+
+# Finds the next thing in a line of code that isn't plain code. Numbers are
+# matched only so that their digit separators (as in 1'000'000) are not
+# mistaken for character literals.
+_CODE_RE = re.compile(r"""
+    (?P<number> (?<![\w.]) \.?\d (?: [eEpP][+-] | [\w.] | '(?=\w) )* ) |
+    (?P<raw> (?<!\w) (?:u8|[uUL])? R" (?P<delimiter>[^()\\\s"]{0,16}) \( ) |
+    (?P<string> " ) |
+    (?P<char> ' ) |
+    (?P<line_comment> // ) |
+    (?P<block_comment> /\* )
+""", re.VERBOSE)
+
+# The rest of a string or character literal after its opening quote, including
+# its closing quote.
+_LITERAL_BODY_RES = {
+    STRING: re.compile(r'(?:[^"\\]|\\.)*"'),
+    CHAR: re.compile(r"(?:[^'\\]|\\.)*'")
+}
+
+# The kind of span each group of _CODE_RE starts.
+_SPAN_KINDS = {
+    "raw": STRING, "string": STRING, "char": CHAR, "line_comment": COMMENT,
+    "block_comment": COMMENT
+}
+
+def _continues(text):
+    """
+    Returns ``True`` if ``text`` ends with a backslash that isn't itself
+    escaped, which splices the next line onto it.
+
+    """
+
+    return (len(text) - len(text.rstrip("\\"))) % 2 == 1
+
+def tokenize(lines):
+    """
+    Splits lines of C++ code into spans of code, string literals, character
+    literals, and comments in a single pass. Comments and strings that span
+    several lines (block comments, raw strings, and anything continued with a
+    backslash) are handled.
+
+    :param lines: An iterable of strings, one per line. It is only iterated
+            over once, so very large files can be streamed through.
+    :returns: An iterator over :class:`Span` objects, in the order they appear.
+            Empty spans are never yielded.
+
+    >>> [(i.kind, i.start, i.end) for i in tokenize(['x = "}"; // {'])]
+    [('code', 0, 4), ('string', 4, 7), ('code', 7, 9), ('comment', 9, 13)]
+
+    """
+
+    # The kind of span we are inside of at the end of the previous line, and
+    # the text that ends it (None if it ends with the line, unless the line is
+    # continued with a backslash).
+    state = CODE
+    terminator = None
+
+    for n, line in enumerate(lines):
+        length = len(line)
+        pos = 0
+
+        while pos < length or state != CODE:
+            if state == CODE:
+                match = _CODE_RE.search(line, pos)
+                if match is None:
+                    yield Span(CODE, n, pos, length)
+                    break
+
+                kind = match.lastgroup
+                if kind == "number":
+                    # Find where the code actually ends.
+                    while match is not None and match.lastgroup == "number":
+                        match = _CODE_RE.search(line, match.end())
+                    if match is None:
+                        yield Span(CODE, n, pos, length)
+                        break
+                    kind = match.lastgroup
+
+                if match.start() > pos:
+                    yield Span(CODE, n, pos, match.start())
+
+                state = _SPAN_KINDS[kind]
+                if kind == "raw":
+                    terminator = ")" + match.group("delimiter") + '"'
+                elif kind == "block_comment":
+                    terminator = "*/"
+                else:
+                    terminator = None
+
+                start = match.start()
+                pos = match.end()
+                if kind == "line_comment":
+                    pos = length
+            else:
+                # Picking up a span that started on a previous line.
+                start = pos
+
+            # Find the end of the span we are in.
+            if terminator is not None:
+                end = line.find(terminator, pos)
+                if end != -1:
+                    end += len(terminator)
+            elif state in _LITERAL_BODY_RES:
+                body = _LITERAL_BODY_RES[state].match(line, pos)
+                end = -1 if body is None else body.end()
+            else:
+                # Line comments always go to the end of the line.
+                end = -1
+
+            if end == -1:
+                if length > start:
+                    yield Span(state, n, start, length)
+
+                # Only raw strings and block comments go on to the next line
+                # by themselves, everything else needs a backslash (an
+                # unterminated literal is a compile error anyway).
+                if terminator is None and not _continues(line):
+                    state = CODE
+                break
+
+            yield Span(state, n, start, end)
+            state = CODE
+            terminator = None
+            pos = end
+
+def _stream_code(lines):
+    """
+    Like :func:`code_only`, but yields ``(line, code)`` two-tuples as it goes,
+    reading at most one line ahead of the last line it yielded.
+
+    """
+
+    # The lines tokenize has read that we haven't yielded yet.
+    waiting = collections.deque()
+
+    def feed():
+        for line in lines:
+            waiting.append(line)
+            yield line
+
+    current = 0
+    code = []
+    for span in tokenize(feed()):
+        while span.line > current:
+            yield (waiting.popleft(), "".join(code))
+            code = []
+            current += 1
+
+        if span.kind == CODE:
+            code.append(waiting[0][span.start:span.end])
+
+    while waiting:
+        yield (waiting.popleft(), "".join(code))
+        code = []
+
+def code_only(lines):
+    """
+    Removes string literals, character literals, and comments from lines of
+    C++ code.
+
+    :param lines: A list of strings, one per line.
+    :returns: A list of strings, one per line, containing only the line's
+            code.
+
+    >>> code_only(["char c = '{'; /* {", "} */ int x;"])
+    ['char c = ; ', ' int x;']
+
+    """
+
+    return _code_from_spans(lines, tokenize(lines))
+
+def _code_from_spans(lines, spans):
+    result = [[] for i in lines]
+    for span in spans:
+        if span.kind == CODE:
+            result[span.line].append(lines[span.line][span.start:span.end])
+
+    return ["".join(i) for i in result]
+
 def grab_blocks(lines):
     """
     Finds all blocks created using curly braces (does not handle two line if
-    statements for example).
+    statements for example). Curly braces inside of string literals, character
+    literals, and comments are ignored (see :func:`tokenize`).
 
     :param lines: A list of ``Line`` objects.
     :returns: A single ``Block`` object which can be traversed like a tree.
@@ -220,67 +465,123 @@ def grab_blocks(lines):
 
     """
 
-    # The number of nested blocks the current line is in relative to our
-    # starting point. We will only look at the indentation for lines with
-    # in_block == 0, all other lines we will recursively defer.
-    in_block = 0
+    lines = list(lines)
 
-    # These are all of the lines that are within the current block (and not
-    # within any sub blocks).
-    lines_to_check = []
+    # Strings, characters, and comments can't open or close blocks, so only
+    # look at the code.
+    return _build_blocks(lines, code_only([i.code for i in lines]))
 
-    # Contains the actual result (the list of two-tuples).
-    sub_blocks = []
+def _build_blocks(lines, code):
+    """
+    Does the work of :func:`grab_blocks` given the ``Line`` objects and the
+    code (see :func:`code_only`) in each of them.
 
-    # When we encounter code that is in a sub block, we push it onto this list.
-    # Then when we get out of that sub block, we recurse on these lines and then
-    # empty the list.
-    unhandled_chunk = []
+    """
 
-    for line in lines:
-        # Remove all quoted strings from the line, that way when we search for
-        # a curly brace we know it's an actual curly brace.
-        stripped_line = cleanse_quoted_strings(line.code)
+    root = _OpenBlock(lines)
+    for n, block in _walk_blocks(
+            code, root, lambda base, parent: _OpenBlock(lines)):
+        block.add(n)
 
-        # Will be set to true if the the current line is in the current block.
-        include_current_line = False
+    if not root.spans and not root.sub_blocks:
+        return None
+    else:
+        return root.to_block()
 
-        # Figure out if we are ending a block here
-        for char in stripped_line:
-            # If at any point we reach 0, that means we want to include this
-            # line in the current block. This may occur if you have something
-            # like "} else {".
-            if in_block == 0:
-                include_current_line = True
+def _walk_blocks(code, root, new_block):
+    """
+    Works out which block each line of code belongs to in a single pass.
+
+    :param code: An iterable of strings, one per line, containing only code
+            (see :func:`code_only`). It is only iterated over once.
+    :param root: An object standing for the top-level block.
+    :param new_block: A function called as ``new_block(base, parent)`` to get
+            an object standing for a new block, ``parent`` being the block it
+            is opened inside of.
+    :returns: An iterator over ``(index, block)`` two-tuples giving the block
+            each line belongs to. When a block is finished, it is passed to
+            its parent's ``adopt`` method. Blocks that are never finished are
+            forgotten about.
 
-            # See comment above the in_block initialization.
-            if char == "{":
-                in_block += 1
-            elif char == "}":
-                in_block -= 1
+    """
 
-        # Check if we ended a block here.
-        if in_block == 0:
-            include_current_line = True
+    # Every block that is still open, outermost first. The line a block starts
+    # on sets its base: the depth (the number of curly braces left open) at the
+    # start of that line. A line belongs to a block if the depth is ever that
+    # block's base while reading it, and always to the outermost such block
+    # (ex: "} else {" belongs to the block outside the braces). A line that
+    # doesn't belong to any open block starts a new one.
+    stack = [root]
+    bases = [0]
+
+    # Maps each open block's base to its position in the stack. No two open
+    # blocks ever have the same base, as a line starting a new block could
+    # have gone into the open block with its base instead.
+    positions = {0: 0}
+
+    depth = 0
+    for n, text in enumerate(code):
+        start = low = high = depth
+        if "{" in text or "}" in text:
+            for char in text:
+                if char == "{":
+                    depth += 1
+                    if depth > high:
+                        high = depth
+                elif char == "}":
+                    depth -= 1
+                    if depth < low:
+                        low = depth
+
+        if low == high:
+            position = positions.get(low)
+        else:
+            position = min([
+                positions[i] for i in xrange(low, high + 1) if i in positions
+            ] or [None])
+
+        if position is None:
+            positions[start] = len(stack)
+            stack.append(new_block(start, stack[-1]))
+            bases.append(start)
+        elif position + 1 < len(stack):
+            # The block directly inside the one this line belongs to is
+            # finished. Any blocks still open inside of that one were never
+            # closed, and are thrown away.
+            for i in bases[position + 1:]:
+                del positions[i]
+
+            finished = stack[position + 1]
+            del stack[position + 1:]
+            del bases[position + 1:]
+            stack[-1].adopt(finished)
+
+        yield (n, stack[-1])
+
+class _OpenBlock:
+    """
+    A block that :func:`grab_blocks` is still adding lines to.
 
-        if include_current_line:
-            # If we were just looking at a chunk of code in a sub block,
-            # recurse properly.
-            if unhandled_chunk:
-                unhandled_block = grab_blocks(unhandled_chunk)
-                if unhandled_block:
-                    sub_blocks.append(unhandled_block)
+    """
 
-                unhandled_chunk = []
+    def __init__(self, lines):
+        self.lines = lines
+        self.spans = []
+        self.sub_blocks = []
 
-            lines_to_check.append(line)
+    def add(self, index):
+        if self.spans and self.spans[-1][1] == index:
+            self.spans[-1][1] = index + 1
         else:
-            unhandled_chunk.append(line)
+            self.spans.append([index, index + 1])
 
-    if not lines_to_check and not sub_blocks:
-        return None
-    else:
-        return Block(lines_to_check, sub_blocks)
+    def adopt(self, block):
+        self.sub_blocks.append(block.to_block())
+
+    def to_block(self):
+        return Block._from_spans(
+            self.lines, [tuple(i) for i in self.spans], self.sub_blocks
+        )
 
 def cleanse_quoted_strings(line):
     """
@@ -303,42 +604,742 @@ def cleanse_quoted_strings(line):
 
     This function is of particular use when trying to detect curly braces or
     other language constructs, and you don't want to be fooled by the symbols
-    appearing in string literals.
+    appearing in string literals. To also skip comments and handle literals
+    spanning several lines, use :func:`code_only` or :func:`tokenize` instead.
+
+    """
+
+    return _QUOTED_STRING_RE.sub("", line)
+
+# A quoted string as understood by cleanse_quoted_strings. A string that is
+# never closed runs to the end of the line.
+_QUOTED_STRING_RE = re.compile(
+    r"""
+        " (?:[^"\\]|\\.)* (?:"|\\?$) |
+        ' (?:[^'\\]|\\.)* (?:'|\\?$)
+    """,
+    re.VERBOSE | re.DOTALL
+)
+
+# Splits text into lines the same way str.splitlines() does, seperating each
+# line's indentation from the rest of it.
+_LINE_RE = re.compile(r"([ \t]*)([^\r\n]*)(?:\r\n|\r|\n|$)")
+
+class LineBuffer(object):
+    """
+    The lines of a file, kept as the file's text along with arrays of where
+    each line starts and ends and how far it is indented. Indexing a
+    ``LineBuffer`` gives the text of a line (like indexing a list of lines
+    would), and :meth:`line` gives a :class:`Line` object.
+
+    :ivar text: The text of the file.
+    :ivar starts: An ``array`` of the offset in :attr:`text` where each line
+            starts.
+    :ivar ends: An ``array`` of the offset in :attr:`text` where each line ends
+            (not including the line break).
+    :ivar indents: An ``array`` of the indentation level of each line (see
+            :meth:`Line.indent_level`), with ``-1`` for blank lines.
+
+    >>> buffer = LineBuffer("int main() {\\n    return 0;\\n\\n}\\n")
+    >>> len(buffer), buffer[1], buffer.indent_level(1), buffer.indent_level(2)
+    (4, '    return 0;', 4, None)
+
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = array.array("l")
+        self.ends = array.array("l")
+        self.indents = array.array("l")
+
+        length = len(text)
+        for match in _LINE_RE.finditer(text):
+            if match.start() == length:
+                break
+
+            self.starts.append(match.start())
+            self.ends.append(match.end(2))
+            self.indents.append(
+                match.end(1) - match.start() if match.end(2) > match.end(1)
+                    else -1
+            )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        return self.text[self.starts[index]:self.ends[index]]
+
+    def __iter__(self):
+        text = self.text
+        for start, end in zip(self.starts, self.ends):
+            yield text[start:end]
+
+    def indent_level(self, index):
+        """
+        :returns: The indentation level of the line at ``index`` (see
+                :meth:`Line.indent_level`).
+
+        """
+
+        indent = self.indents[index]
+        return None if indent == -1 else indent
+
+    def line(self, index):
+        """
+        :returns: A :class:`Line` for the line at ``index``, numbered
+                ``index``, that already knows its indentation level.
+
+        """
+
+        result = Line(index, self[index])
+        result._indent = self.indent_level(index)
+        return result
+
+    def lines(self):
+        """
+        :returns: A list with a :class:`Line` for every line.
+
+        """
+
+        return [self.line(i) for i in xrange(len(self))]
+
+class SourceFile(object):
+    """
+    A source file along with everything this module can work out about it.
+    Everything is worked out the first time it is needed and then kept, so
+    checks that look at the same file share the work.
+
+    Use :meth:`SourceFile.open` to get the ``SourceFile`` for a file on disk.
+    Opening the same file again returns the same object unless the file was
+    changed in between, or more than :attr:`cache_size` other files were
+    opened since.
+
+    :ivar path: The absolute path of the file, or ``None`` if the source did
+            not come from a file.
+    :ivar text: The contents of the file.
+    :ivar digest: A SHA1 hex digest of :attr:`text`.
+
+    .. code-block:: python
+
+        source = interact.parse.SourceFile.open("main.cpp")
+        for i in source.comments:
+            print source.raw_lines[i.line][i.start:i.end]
+
+    """
+
+    #: How many files :meth:`open` remembers. Once there are more, the one
+    #: opened least recently is forgotten, so that grading many submissions
+    #: in one process doesn't keep every one of them in memory.
+    cache_size = 32
+
+    # Maps absolute paths to (stat signature, SourceFile) two-tuples.
+    _by_path = {}
+
+    # Maps absolute paths to when they were last opened, counted in calls to
+    # open.
+    _last_opened = {}
+    _clock = itertools.count()
+
+    def __init__(self, text, path = None, digest = None):
+        self.text = text
+        self.path = path
+        self.digest = \
+            hashlib.sha1(text).hexdigest() if digest is None else digest
+
+        self._buffer = None
+        self._lines = None
+        self._tokens = None
+        self._code = None
+        self._blocks = None
+        self._scopes = None
+
+    @classmethod
+    def open(cls, path):
+        """
+        :returns: The ``SourceFile`` for the file at ``path``, reading it only
+                if it has not been read before or has changed since.
+
+        """
+
+        path = _utils.resolve_path(path)
+
+        stat = os.stat(path)
+        signature = (stat.st_mtime, stat.st_size, stat.st_ino)
+
+        cached = cls._by_path.get(path)
+        if cached is not None and cached[0] == signature:
+            source = cached[1]
+        else:
+            with open(path) as f:
+                text = f.read()
+            digest = hashlib.sha1(text).hexdigest()
+
+            # A file that is touched without being changed isn't parsed
+            # again.
+            if cached is not None and cached[1].digest == digest:
+                source = cached[1]
+            else:
+                source = cls(text, path, digest)
+
+            cls._by_path[path] = (signature, source)
+
+        cls._last_opened[path] = next(cls._clock)
+        if len(cls._by_path) > cls.cache_size:
+            oldest = min(cls._last_opened, key = cls._last_opened.get)
+            del cls._by_path[oldest]
+            del cls._last_opened[oldest]
+
+        return source
+
+    @classmethod
+    def clear_cache(cls):
+        """
+        Forgets every file opened with :meth:`open`.
+
+        """
+
+        cls._by_path.clear()
+        cls._last_opened.clear()
+
+    @property
+    def raw_lines(self):
+        """
+        A :class:`LineBuffer` holding the file's lines, which can be used as a
+        list of strings, one per line.
+
+        """
+
+        if self._buffer is None:
+            self._buffer = LineBuffer(self.text)
+
+        return self._buffer
+
+    @property
+    def lines(self):
+        """
+        A list of :class:`Line` objects, one per line. Like
+        :meth:`Line.make_lines`, lines are numbered from ``0``.
+
+        """
+
+        if self._lines is None:
+            self._lines = self.raw_lines.lines()
+
+        return self._lines
+
+    @property
+    def indent_levels(self):
+        """
+        A list of the indentation level of each line (see
+        :meth:`Line.indent_level`).
+
+        """
+
+        buffer = self.raw_lines
+        return [buffer.indent_level(i) for i in xrange(len(buffer))]
+
+    @property
+    def tokens(self):
+        """
+        A list of every :class:`Span` in the file (see :func:`tokenize`).
+
+        """
+
+        if self._tokens is None:
+            self._tokens = list(tokenize(self.raw_lines))
+
+        return self._tokens
+
+    @property
+    def comments(self):
+        """
+        A list of the :class:`Span` objects of every comment in the file.
+
+        """
+
+        return [i for i in self.tokens if i.kind == COMMENT]
+
+    @property
+    def code(self):
+        """
+        A list of strings, one per line, with string literals, character
+        literals, and comments removed (see :func:`code_only`).
+
+        """
+
+        if self._code is None:
+            self._code = _code_from_spans(self.raw_lines, self.tokens)
+
+        return self._code
+
+    @property
+    def blocks(self):
+        """
+        The :class:`Block` tree of the file (see :func:`grab_blocks`), or
+        ``None`` if the file is empty.
+
+        """
+
+        if self._blocks is None and len(self.raw_lines) != 0:
+            self._blocks = _build_blocks(self.lines, self.code)
+
+        return self._blocks
+
+    @property
+    def scopes(self):
+        """
+        The :class:`ScopeIndex` of the file.
+
+        """
+
+        if self._scopes is None:
+            self._scopes = ScopeIndex(self)
+
+        return self._scopes
+
+class Scope(object):
+    """
+    A block of code along with what :class:`ScopeIndex` could work out about
+    what it is. All line numbers are indexes into the lines of the file
+    (counting from ``0``).
+
+    :ivar kind: One of ``"function"``, ``"class"`` (classes, structs, and
+            unions), ``"enum"``, ``"namespace"``, ``"control"`` (the body of an
+            ``if``, ``for``, ``while``, etc.), or ``"block"`` for anything
+            else (such as lambdas and bare blocks).
+    :ivar name: The name given in the header (ex: ``"main"`` or
+            ``"Foo::bar"``), or ``None`` if it has none.
+    :ivar qualified_name: :attr:`name` prefixed by the names of the classes and
+            namespaces it is inside of (ex: ``"std::Foo::bar"``), or ``None``.
+    :ivar header: The code before the opening curly brace that says what the
+            block is (ex: ``"int Foo::bar(int x) const"``), with its
+            whitespace collapsed.
+    :ivar start: The first line of the header.
+    :ivar opening: The line with the opening curly brace.
+    :ivar end: The line with the closing curly brace.
+    :ivar block: The :class:`Block` holding the body, or ``None`` if the body
+            has no lines of its own (ex: ``int foo() { return 1; }``).
+    :ivar parent: The ``Scope`` this one is inside of, or ``None``.
+    :ivar children: A list of the ``Scope`` objects directly inside this one.
+
+    """
+
+    def __init__(self, kind, name, header, start, opening, end, block,
+            parent = None):
+        self.kind = kind
+        self.name = name
+        self.header = header
+        self.start = start
+        self.opening = opening
+        self.end = end
+        self.block = block
+        self.parent = parent
+        self.children = []
+
+        # The columns of the opening and closing curly braces in the lines of
+        # code (see SourceFile.code).
+        self._columns = (None, None)
+
+        self.qualified_name = name
+        if name is not None:
+            outer = parent
+            while outer is not None:
+                if outer.kind in ("class", "namespace") and \
+                        outer.name is not None:
+                    self.qualified_name = outer.qualified_name + "::" + name
+                    break
+                outer = outer.parent
+
+    def __repr__(self):
+        return "Scope(%s, %r, %d-%d)" % (
+            self.kind, self.name, self.start, self.end
+        )
+
+# How many lines before the opening curly brace we will look through for the
+# rest of a block's header.
+_MAX_HEADER_LINES = 10
+
+_ACCESS_LABEL_RE = re.compile(
+    r"^(?:(?:public|private|protected)\s*:(?!:)\s*)+"
+)
+_CONTROL_RE = re.compile(
+    r"^(?:else\s+)?(?:if|else|for|while|do|switch|try|catch)\b"
+)
+_TYPE_RE = re.compile(r"""
+    ^(?: template \s* <.*> \s* )?
+    (?: typedef \s+ )?
+    (?P<kind> class | struct | union | enum | namespace ) \b
+    (?: \s+ (?: class | struct ) \b )?
+    (?: \s+ (?P<name> [A-Za-z_]\w* ) )?
+""", re.VERBOSE)
+_FUNCTION_RE = re.compile(r"""
+    (?P<name>
+        (?: [A-Za-z_]\w* \s* :: \s* )*
+        (?: operator \s* (?: \(\s*\) | [^\s(]+ ) | ~?[A-Za-z_]\w* )
+    )
+    \s* \(
+""", re.VERBOSE)
+
+# Words that look like function names in front of a parenthesis but aren't.
+_NOT_FUNCTIONS = frozenset([
+    "if", "for", "while", "switch", "catch", "return", "sizeof", "decltype",
+    "alignof", "noexcept", "throw", "static_assert"
+])
+
+def _classify_header(header):
+    """
+    Returns a two-tuple ``(kind, name)`` describing a block with the given
+    header (see :class:`Scope`).
 
     """
 
-    # Returns ' if " is given, returns " if ' is given.
-    inv_quote = lambda x: "'" if x == "\"" else "\""
+    if _CONTROL_RE.match(header):
+        return ("control", None)
+
+    # Functions can return structs (ex: "struct point origin()").
+    match = _TYPE_RE.match(header)
+    if match is not None and "(" not in header:
+        kind = match.group("kind")
+        if kind in ("struct", "union"):
+            kind = "class"
+        return (kind, match.group("name"))
 
-    is_quote = lambda x: x in ["\"", "'"]
+    match = _FUNCTION_RE.search(header)
+    if match is not None and ")" in header[match.end():] and \
+            "=" not in header[:match.start()] and \
+            re.search(r"\]\s*\(", header) is None:
+        name = re.sub(r"\s+", "", match.group("name"))
+        if name not in _NOT_FUNCTIONS:
+            return ("function", name)
 
-    # Will be a list of characters that we will join together to get the
-    # resulting string sans quoted strings.
-    unquoted_string = []
+    return ("block", None)
 
-    in_quotes = None
-    for i, char in enumerate(line):
-        # Check to see if this character is escaped (this will occur if there is
-        # an odd number of back slashes in front of it).
-        num_slashes = 0
-        for j in reversed(range(0, i)):
-            if line[j] == "\\":
-                num_slashes += 1
+class ScopeIndex(object):
+    """
+    Finds the functions, classes, and other scopes in a file from its
+    :class:`Block` tree, and answers which scope any line is in. Use
+    :attr:`SourceFile.scopes` to get the index of a file, so that it is only
+    built once.
+
+    :ivar source: The :class:`SourceFile` indexed.
+    :ivar scopes: A list of every :class:`Scope`, in the order they start.
+    :ivar top_level: A list of the scopes that aren't inside of any other.
+
+    .. code-block:: python
+
+        index = interact.parse.SourceFile.open("main.cpp").scopes
+        foo = index.find("foo")
+        if not foo:
+            print "There's no foo function!"
+        elif index.calls(foo[0], "foo"):
+            print "foo is recursive!"
+        else:
+            print "foo is %d lines long." % (foo[0].end - foo[0].start + 1, )
+
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.scopes = []
+        self.top_level = []
+
+        self._by_name = {}
+
+        # Sorted line numbers where the innermost scope changes, and the
+        # innermost scope (or None) from each of them up to the next one.
+        self._boundaries = []
+        self._owners = []
+
+        self._find_scopes()
+        self._build_segments()
+
+    def _find_scopes(self):
+        code = self.source.code
+
+        # The block holding the body of each scope, found by its first line.
+        blocks = {}
+        if self.source.blocks is not None:
+            stack = list(self.source.blocks.sub_blocks)
+            while stack:
+                block = stack.pop()
+                blocks[_block_range(block)[0]] = block
+                stack.extend(block.sub_blocks)
+
+        # Every scope in the order they are opened, and the ones that are
+        # still open (None standing in for the braces of an initializer list,
+        # which aren't scopes).
+        opened = []
+        stack = []
+        for n, text in enumerate(code):
+            if "{" not in text and "}" not in text:
+                continue
+
+            for column, char in enumerate(text):
+                if char == "{":
+                    # Braces inside an initializer list are initializers
+                    # too (ex: "int xs[][2] = {{1, 2}, {3, 4}};").
+                    if stack and stack[-1] is None or \
+                            self._is_initializer(code, n, column):
+                        stack.append(None)
+                        continue
+
+                    start, header = self._header(code, n, column)
+                    kind, name = _classify_header(header)
+                    parents = [i for i in stack if i is not None]
+
+                    scope = Scope(
+                        kind, name, header, start, n, None, None,
+                        parents[-1] if parents else None
+                    )
+                    scope._columns = (column, None)
+                    opened.append(scope)
+                    stack.append(scope)
+                elif char == "}" and stack:
+                    scope = stack.pop()
+                    if scope is not None:
+                        scope.end = n
+                        scope._columns = (scope._columns[0], column)
+
+                        # With several braces opened on one line, the body
+                        # on the lines after it belongs to the innermost.
+                        block = blocks.pop(scope.opening + 1, None)
+                        if block is not None:
+                            if _block_range(block)[1] < n:
+                                scope.block = block
+                            else:
+                                blocks[scope.opening + 1] = block
+
+        # Scopes that are never closed are forgotten about, along with
+        # everything inside of them.
+        kept = set()
+        for scope in opened:
+            if scope.end is None or \
+                    (scope.parent is not None and scope.parent not in kept):
+                continue
+            kept.add(scope)
+
+            self.scopes.append(scope)
+            if scope.parent is None:
+                self.top_level.append(scope)
             else:
+                scope.parent.children.append(scope)
+
+            if scope.name is not None:
+                # Index "ns::Foo::bar" as "Foo::bar" and "bar" too.
+                parts = scope.qualified_name.split("::")
+                for i in xrange(len(parts)):
+                    self._by_name.setdefault(
+                        "::".join(parts[i:]), []
+                    ).append(scope)
+
+    @staticmethod
+    def _is_initializer(code, line, column):
+        """
+        Returns ``True`` if the curly brace at ``column`` of the line ``line``
+        starts an initializer list (ex: ``int x[] = {1, 2};`` or
+        ``foo({1, 2});``) rather than a block of code.
+
+        """
+
+        # Find the last character before the brace that isn't whitespace,
+        # without copying the line (there can be a great many braces on it).
+        text = code[line]
+        i = column - 1
+        while True:
+            while i >= 0 and text[i].isspace():
+                i -= 1
+            if i >= 0:
                 break
-        escaped = num_slashes % 2 == 1
+            elif line == 0:
+                return False
+
+            line -= 1
+            text = code[line]
+            i = len(text) - 1
+
+        if text[i] in "=(,[":
+            return True
+
+        return text.endswith("return", 0, i + 1) and \
+            (i < 6 or not (text[i - 6].isalnum() or text[i - 6] == "_"))
+
+    @staticmethod
+    def _header(code, opening, column):
+        """
+        Returns a two-tuple ``(start, header)`` with the first line of the
+        header of the block whose curly brace is at ``column`` of the line
+        ``opening``, and the header.
+
+        The header goes back to the closest ``;``, ``{``, or ``}`` outside of
+        any parentheses (so the header of a ``for`` loop is all of it), or to
+        an unmatched ``(`` or a ``,`` before a ``[`` (so the header of a
+        lambda passed to a function is just the lambda).
+
+        """
+
+        parts = []
+        depth = 0
+        start = line = opening
+        text = code[opening][:column]
+        while True:
+            cut = None
+            for i in xrange(len(text) - 1, -1, -1):
+                char = text[i]
+                if char == ")":
+                    depth += 1
+                elif char == "(":
+                    depth -= 1
+                    if depth < 0:
+                        cut = i
+                        break
+                elif depth == 0 and (char in ";{}" or char == "," and
+                        text[i + 1:].lstrip().startswith("[")):
+                    cut = i
+                    break
+
+            if cut is not None:
+                text = text[cut + 1:]
+            if text.strip():
+                start = line
+            parts.append(text)
+
+            if cut is not None or line == 0 or \
+                    opening - line + 1 >= _MAX_HEADER_LINES or \
+                    code[line - 1].lstrip().startswith("#") or \
+                    code[line - 1].strip() in INDENT_EXCEPTED_LINES:
+                break
+
+            line -= 1
+            text = code[line]
+
+        header = " ".join(" ".join(reversed(parts)).split())
+        return (start, _ACCESS_LABEL_RE.sub("", header))
+
+    def _build_segments(self):
+        boundaries = self._boundaries
+        owners = self._owners
+
+        def add(line, owner):
+            if boundaries and boundaries[-1] == line:
+                owners[-1] = owner
+            elif not owners or owners[-1] is not owner:
+                boundaries.append(line)
+                owners.append(owner)
+
+        # Each entry is the scope whose lines we are handing out, the last
+        # line it can have, and an iterator over its children. Scopes can
+        # share a line (as in "} else {"), in which case the line goes to the
+        # one that ends there.
+        cursor = 0
+        stack = [(None, len(self.source.raw_lines) - 1, iter(self.top_level))]
+        while stack:
+            scope, last, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                if cursor <= last:
+                    add(cursor, scope)
+                    cursor = last + 1
+                stack.pop()
+                continue
+
+            child_start = max(child.start, cursor)
+            child_end = min(child.end, last)
+            if child_start > child_end:
+                continue
+
+            if child_start > cursor:
+                add(cursor, scope)
+            cursor = child_start
+            stack.append((child, child_end, iter(child.children)))
+
+    def find(self, name, kind = None):
+        """
+        Finds scopes by name.
+
+        :param name: A name (ex: ``"bar"``), or a name along with the classes
+                or namespaces it is in (ex: ``"Foo::bar"``).
+        :param kind: If given, only scopes of this :attr:`kind <Scope>` are
+                returned.
+        :returns: A list of the matching :class:`Scope` objects, in the order
+                they start.
 
-        if char == in_quotes and not escaped:
-            in_quotes = None
-            continue
-        elif is_quote(char) and in_quotes is None:
-            in_quotes = char
-            continue
+        """
+
+        return [
+            i for i in self._by_name.get(name, [])
+                if kind is None or i.kind == kind
+        ]
+
+    @property
+    def functions(self):
+        """
+        A list of every function's :class:`Scope`.
+
+        """
+
+        return [i for i in self.scopes if i.kind == "function"]
+
+    def scope_at(self, line):
+        """
+        :returns: The innermost :class:`Scope` containing the line at index
+                ``line``, or ``None`` if it isn't in any scope.
 
-        if in_quotes is None:
-            unquoted_string.append(char)
+        """
 
-    return "".join(unquoted_string)
+        position = bisect.bisect_right(self._boundaries, line) - 1
+        return self._owners[position] if position >= 0 else None
+
+    def function_at(self, line):
+        """
+        :returns: The innermost function :class:`Scope` containing the line at
+                index ``line``, or ``None``.
+
+        """
+
+        scope = self.scope_at(line)
+        while scope is not None and scope.kind != "function":
+            scope = scope.parent
+
+        return scope
+
+    def calls(self, scope, name):
+        """
+        :returns: A list of the lines in the body of ``scope`` (everything
+                between its curly braces) where ``name`` is followed by an
+                opening parenthesis, such as a call to a function ``name``.
+
+        """
+
+        pattern = re.compile(
+            r"(?<![\w.>:])" + re.escape(name) + r"\s*\("
+        )
+
+        code = self.source.code
+        opening_column, end_column = scope._columns
+        result = []
+        for line in xrange(scope.opening, scope.end + 1):
+            text = code[line]
+            if line == scope.end:
+                text = text[:end_column]
+            if line == scope.opening:
+                text = text[opening_column + 1:]
+            if pattern.search(text):
+                result.append(line)
+
+        return result
+
+def _block_range(block):
+    """
+    Returns a two-tuple with the indexes of the first and last of a block's
+    own lines.
+
+    """
+
+    if block._spans is not None:
+        return (block._spans[0][0], block._spans[-1][1] - 1)
+    else:
+        return (block.lines[0].line_number, block.lines[-1].line_number)
 
 #: Lines of code to ignore when looking for bad indentation. See
 #: :func:`find_bad_indentation` for more information.
@@ -348,11 +1349,10 @@ def find_bad_indentation(block, minimum = None):
     """
     Detects blocks of code that are not indented more than their parent blocks.
 
-    :param block: The top-level block of code. Sub-blocks will be recursively
-                  checked.
+    :param block: The top-level block of code. Sub-blocks will be checked as
+                  well.
     :param minimum: The minimum level of indentation required for the top-level
-                    block. Mainly useful due to this function's recursive
-                    nature.
+                    block.
     :returns: A list of ``Line`` objects where each ``Line`` had a problem with
               its indentation.
 
@@ -404,30 +1404,160 @@ def find_bad_indentation(block, minimum = None):
 
     problems = []
 
-    # Check that each line in the current block has an indentation level
-    # strictly greater than the minimum.
-    for i in block.lines:
-        if i.code.strip() in INDENT_EXCEPTED_LINES:
-            continue
+    # Blocks still to check along with their minimums, with our own stack
+    # rather than recursion so that deeply nested code is fine. Blocks are
+    # checked in the order they start.
+    stack = [(block, minimum)]
+    while stack:
+        block, minimum = stack.pop()
+
+        # Check that each line in the current block has an indentation level
+        # strictly greater than the minimum, while finding the indent level of
+        # the least indented line in the current block.
+        new_minimum = None
+        for i in block.lines:
+            level = i.indent_level()
+            if level is None or i.code.strip() in INDENT_EXCEPTED_LINES:
+                continue
 
-        indent_level = i.indent_level()
-        if minimum is not None and indent_level is not None and \
-                indent_level <= minimum:
-            problems.append(i)
+            if minimum is not None and level <= minimum:
+                problems.append(i)
 
-    # Find the indent level of the least indented line in the current block
-    levels = []
-    for i in block.lines:
-        if i.code.strip() in INDENT_EXCEPTED_LINES:
-            continue
+            if new_minimum is None or level < new_minimum:
+                new_minimum = level
 
-        level = i.indent_level()
-        if level is not None:
-            levels.append(level)
-    new_minimum = min(levels) if levels else minimum
+        if new_minimum is None:
+            new_minimum = minimum
 
-    # Recurse into every sub block
-    for i in block.sub_blocks:
-        problems += find_bad_indentation(i, new_minimum)
+        for i in reversed(block.sub_blocks):
+            stack.append((i, new_minimum))
 
     return problems
+
+def find_bad_indentation_streaming(lines):
+    """
+    Finds the same lines, in the same order, as
+    ``find_bad_indentation(grab_blocks(Line.make_lines(lines)))``, in a single
+    pass over ``lines`` and without keeping them all around. Only lines that
+    might still turn out to be badly indented are kept.
+
+    :param lines: An iterable of strings, one per line, such as an open file.
+            Line breaks at the ends of the strings are ignored.
+    :returns: A list of ``Line`` objects, numbered from ``0``.
+
+    >>> find_bad_indentation_streaming(["int main() {", "return 0;", "}"])
+    [Line(1, 'return 0;')]
+
+    """
+
+    lines = (i.rstrip("\r\n") for i in lines)
+
+    # Every block is numbered in the order it starts, which is the order
+    # find_bad_indentation reports blocks' lines in.
+    counter = [0]
+
+    def new_block(base, parent):
+        counter[0] += 1
+        return _IndentationBlock(parent, counter[0])
+
+    # _walk_blocks only needs the code of each line, but we need the whole
+    # line once we know which block it is in.
+    current = [None]
+
+    def code():
+        for line, text in _stream_code(lines):
+            current[0] = line
+            yield text
+
+    root = _IndentationBlock(None, 0)
+    for n, block in _walk_blocks(code(), root, new_block):
+        block.add(n, current[0])
+
+    return root.finish()
+
+class _IndentationBlock:
+    """
+    A block that :func:`find_bad_indentation_streaming` is still reading.
+
+    """
+
+    def __init__(self, parent, order):
+        self.parent = parent
+        self.order = order
+
+        # The indentation level of the least indented of our lines so far.
+        self.minimum = None
+
+        # Three-tuples (level, order, Line) of our lines, and of the lines of
+        # finished sub blocks, that might be indented no more than the
+        # parent's minimum and our minimum respectively.
+        self.pending = []
+        self.sub_pending = []
+
+        # The problems found in finished sub blocks, as a list of lists of
+        # (order, Line) two-tuples.
+        self.problems = []
+
+    def add(self, index, text):
+        stripped = text.lstrip(" \t")
+        if not stripped or text.strip() in INDENT_EXCEPTED_LINES:
+            return
+
+        level = len(text) - len(stripped)
+        if self.minimum is None or level < self.minimum:
+            self.minimum = level
+
+        # The parent's minimum only ever gets smaller, so a line indented more
+        # than it is now is fine.
+        if self.parent is not None and (self.parent.minimum is None or
+                level <= self.parent.minimum):
+            self.pending.append((level, self.order, Line(index, text)))
+
+    def _resolve(self):
+        """
+        Checks the lines of our finished sub blocks now that our minimum is
+        known. Returns the lines our own sub blocks should have been checked
+        against our parent's minimum instead, as happens when we don't have any
+        lines of our own.
+
+        """
+
+        if self.minimum is None:
+            return self.sub_pending
+
+        self.problems.append([
+            (order, line) for level, order, line in self.sub_pending
+                if level <= self.minimum
+        ])
+        return []
+
+    def adopt(self, block):
+        self.sub_pending.extend(block._resolve())
+        self.sub_pending.extend(
+            i for i in block.pending
+                if self.minimum is None or i[0] <= self.minimum
+        )
+        self.problems.append(block.problems)
+
+    def finish(self):
+        """
+        Called on the top-level block once every line has been read. Returns
+        every problem found.
+
+        """
+
+        self._resolve()
+
+        result = []
+        stack = [self.problems]
+        while stack:
+            problems = stack.pop()
+            for i in problems:
+                if isinstance(i, list):
+                    stack.append(i)
+                else:
+                    result.append(i)
+
+        result.sort(key = lambda x: (x[0], x[1].line_number))
+        return [i[1] for i in result]
+
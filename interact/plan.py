@@ -0,0 +1,471 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module contains the :class:`ExecutionPlan` which decides the order that a
+:class:`Harness <interact.core.Harness>` runs its tests in. You generally won't
+need to use it directly, as every harness builds one as tests are registered
+(see :attr:`Harness.plan <interact.core.Harness>`).
+
+"""
+
+import fnmatch
+import heapq
+
+class ExecutionPlan:
+    """
+    A dependency graph of tests kept in topological order as tests are added.
+
+    :ivar order: A list of keys such that every key comes after all of the keys
+            it depends on. Keys whose dependencies have not all been added yet
+            are not in this list (see :meth:`unresolved`).
+    :ivar names: A dictionary mapping each key to the name of its test.
+    :ivar depends: A dictionary mapping each key to a list of the keys it
+            depends on.
+
+    Keys may be anything hashable, a :class:`Harness
+    <interact.core.Harness>` uses its test functions. Adding a test takes time
+    proportional to its number of dependencies, so building a plan for ``n``
+    tests is linear, and no recursion is used so arbitrarily long chains of
+    dependencies are fine.
+
+    >>> a = ExecutionPlan()
+    >>> a.add("compiles", "Program compiles")
+    >>> a.add("output", "Output is correct", depends = ["compiles"])
+    >>> a.order
+    ['compiles', 'output']
+
+    """
+
+    def __init__(self):
+        self.order = []
+        self.names = {}
+        self.depends = {}
+
+        # Maps each key in order to its position in order.
+        self._positions = {}
+
+        # Maps each key that is not yet in order to the set of its dependencies
+        # that aren't in order either.
+        self._unmet = {}
+
+        # Maps a key that is not yet in order to a list of keys that are waiting
+        # on it.
+        self._waiting = {}
+
+    def __len__(self):
+        return len(self.depends)
+
+    def __contains__(self, key):
+        return key in self.depends
+
+    def add(self, key, name, depends = None):
+        """
+        Adds a test to the plan.
+
+        :param key: A unique, hashable value identifying the test.
+        :param name: The name of the test.
+        :param depends: A list of keys the test depends on. These do not need
+                to have been added yet.
+        :returns: ``None``
+
+        :raises: ``ValueError`` if ``key`` has already been added.
+
+        """
+
+        if key in self.depends:
+            raise ValueError("%r was already added to the plan." % (key, ))
+
+        depends = [] if depends is None else list(depends)
+        self.names[key] = name
+        self.depends[key] = depends
+
+        unmet = set(i for i in depends if i not in self._positions)
+        if unmet:
+            self._unmet[key] = unmet
+            for i in unmet:
+                self._waiting.setdefault(i, []).append(key)
+        else:
+            self._place(key)
+
+    def _place(self, key):
+        """
+        Appends ``key`` to the order, along with any keys that were only
+        waiting on it (and so on).
+
+        """
+
+        ready = [key]
+        while ready:
+            current = ready.pop()
+            self._positions[current] = len(self.order)
+            self.order.append(current)
+
+            for waiter in self._waiting.pop(current, []):
+                unmet = self._unmet[waiter]
+                unmet.discard(current)
+                if not unmet:
+                    del self._unmet[waiter]
+                    ready.append(waiter)
+
+    def unresolved(self):
+        """
+        :returns: A list of the keys that can never be run, either because
+                they are part of a cycle, because they depend on a key that
+                was never added, or because they depend on such a key. An empty
+                list means the plan is complete.
+
+        """
+
+        return [i for i in self.depends if i in self._unmet]
+
+    def position(self, key):
+        """
+        :returns: The index of ``key`` in :attr:`order`.
+
+        """
+
+        return self._positions[key]
+
+    def subset(self, keys):
+        """
+        Creates a new plan containing only the given keys along with
+        everything they (directly or indirectly) depend on.
+
+        :param keys: An iterable of keys in this plan.
+        :returns: A new :class:`ExecutionPlan`. Its order is consistent with
+                this plan's order.
+
+        """
+
+        needed = set()
+        to_visit = list(keys)
+        while to_visit:
+            current = to_visit.pop()
+            if current not in needed:
+                needed.add(current)
+                to_visit.extend(self.depends[current])
+
+        result = ExecutionPlan()
+        for i in self.order:
+            if i in needed:
+                result.add(i, self.names[i], self.depends[i])
+
+        return result
+
+    def select(self, only = None, skip = None):
+        """
+        Creates a new plan containing only the tests whose names match the
+        given glob patterns (see the ``fnmatch`` module), along with every test
+        they depend on.
+
+        :param only: A list of patterns. If not ``None``, only tests matching
+                at least one of these patterns are selected.
+        :param skip: A list of patterns. Tests matching any of these patterns
+                are not selected (though they will still be included if a
+                selected test depends on them).
+        :returns: A new :class:`ExecutionPlan`.
+
+        >>> a = ExecutionPlan()
+        >>> a.add("compiles", "Program compiles")
+        >>> a.add("output", "Output is correct", depends = ["compiles"])
+        >>> a.select(only = ["Output*"]).order
+        ['compiles', 'output']
+        >>> a.select(skip = ["Output*"]).order
+        ['compiles']
+
+        """
+
+        def matches(key, patterns):
+            return any(
+                fnmatch.fnmatchcase(self.names[key], i) for i in patterns
+            )
+
+        selected = []
+        for i in self.order:
+            if only is not None and not matches(i, only):
+                continue
+
+            if skip is not None and matches(i, skip):
+                continue
+
+            selected.append(i)
+
+        return self.subset(selected)
+
+    def components(self):
+        """
+        Groups the tests into sets that are independent of each other, meaning
+        no test in one group depends on a test in another group.
+
+        :returns: A list of lists of keys. Each inner list is in plan order,
+                and the groups are ordered by their first test.
+
+        """
+
+        # A union-find forest over the keys. Each key maps to its parent, roots
+        # map to themselves.
+        parents = dict((i, i) for i in self.order)
+
+        def find(key):
+            while parents[key] != key:
+                # Path halving keeps the trees shallow.
+                parents[key] = parents[parents[key]]
+                key = parents[key]
+            return key
+
+        for i in self.order:
+            for j in self.depends[i]:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parents[root_i] = root_j
+
+        groups = {}
+        roots = []
+        for i in self.order:
+            root = find(i)
+            if root not in groups:
+                groups[root] = []
+                roots.append(root)
+            groups[root].append(i)
+
+        return [groups[i] for i in roots]
+
+    def shard(self, index, count, costs = None):
+        """
+        Splits the plan into ``count`` pieces that can be run independently of
+        each other (in seperate processes or on seperate machines) and returns
+        one of them.
+
+        :param index: Which piece to return, from ``0`` to ``count - 1``.
+        :param count: The number of pieces to split the plan into.
+        :param costs: A dictionary mapping keys to their expected durations,
+                or ``None``. If given, the pieces are balanced by their total
+                expected duration (longest group of tests first, each going to
+                the piece with the least work so far). Otherwise groups of tests
+                are dealt out to the pieces in turn.
+        :returns: A new :class:`ExecutionPlan`.
+
+        Tests that depend on each other are always placed in the same piece so
+        no test is ever run by more than one piece. The split only depends on
+        the plan and ``costs``, so every process given the same costs will
+        agree on it.
+
+        """
+
+        if not 0 <= index < count:
+            raise ValueError(
+                "Shard index must be between 0 and %d, got %d." %
+                    (count - 1, index)
+            )
+
+        components = self.components()
+
+        if costs is None:
+            assignments = [i % count for i in range(len(components))]
+        else:
+            totals = [
+                sum(costs.get(j, 0) for j in i) for i in components
+            ]
+            by_cost = sorted(
+                range(len(components)), key = lambda i: (-totals[i], i)
+            )
+
+            assignments = [None] * len(components)
+            loads = [(0, i) for i in range(count)]
+            for i in by_cost:
+                load, piece = heapq.heappop(loads)
+                assignments[i] = piece
+                heapq.heappush(loads, (load + totals[i], piece))
+
+        selected = []
+        for component, piece in zip(components, assignments):
+            if piece == index:
+                selected.extend(component)
+
+        return self.subset(selected)
+
+    def _dependents(self):
+        """
+        Returns a dictionary mapping each key to a list of the keys that depend
+        on it directly.
+
+        """
+
+        dependents = dict((i, []) for i in self.order)
+        for i in self.order:
+            for j in set(self.depends[i]):
+                dependents[j].append(i)
+
+        return dependents
+
+    def priorities(self, costs):
+        """
+        :param costs: A dictionary mapping keys to their expected durations.
+                Missing keys are assumed to take no time.
+        :returns: A dictionary mapping each key to the expected duration of the
+                longest chain of tests that starts with it (its own cost plus
+                that of its most expensive chain of dependents). Starting the
+                tests with the highest priority first keeps slow tests and the
+                tests that unlock them from being left until the end.
+
+        """
+
+        dependents = self._dependents()
+
+        result = {}
+        for i in reversed(self.order):
+            longest = max([result[j] for j in dependents[i]] or [0])
+            result[i] = costs.get(i, 0) + longest
+
+        return result
+
+    def schedule(self, costs):
+        """
+        Orders the tests so that, among the tests whose dependencies are done,
+        the one with the highest priority (see :meth:`priorities`) always comes
+        next. When no test depends on another this is simply slowest first.
+
+        :param costs: A dictionary mapping keys to their expected durations.
+        :returns: A list of keys such that every key comes after all of the
+                keys it depends on. Ties are broken by plan order.
+
+        """
+
+        priorities = self.priorities(costs)
+        dependents = self._dependents()
+        remaining = dict((i, len(set(self.depends[i]))) for i in self.order)
+
+        ready = [
+            (-priorities[i], self._positions[i], i)
+                for i in self.order if remaining[i] == 0
+        ]
+        heapq.heapify(ready)
+
+        result = []
+        while ready:
+            current = heapq.heappop(ready)[2]
+            result.append(current)
+
+            for i in dependents[current]:
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    heapq.heappush(
+                        ready, (-priorities[i], self._positions[i], i)
+                    )
+
+        return result
+
+    def estimate(self, costs, workers = 1):
+        """
+        Estimates how long running the plan will take.
+
+        :param costs: A dictionary mapping keys to their expected durations.
+        :param workers: How many tests may be run at once.
+        :returns: The expected wall time, in the same units as ``costs``,
+                assuming tests are started in the order chosen by
+                :meth:`schedule` as soon as a worker is free.
+
+        """
+
+        priorities = self.priorities(costs)
+        dependents = self._dependents()
+        remaining = dict((i, len(set(self.depends[i]))) for i in self.order)
+
+        ready = [
+            (-priorities[i], self._positions[i], i)
+                for i in self.order if remaining[i] == 0
+        ]
+        heapq.heapify(ready)
+
+        # Tests currently being run, as (finish time, position, key).
+        running = []
+        now = 0
+        while ready or running:
+            while ready and len(running) < workers:
+                key = heapq.heappop(ready)[2]
+                heapq.heappush(
+                    running,
+                    (now + costs.get(key, 0), self._positions[key], key)
+                )
+
+            now, _, finished = heapq.heappop(running)
+            for i in dependents[finished]:
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    heapq.heappush(
+                        ready, (-priorities[i], self._positions[i], i)
+                    )
+
+        return now
+
+    def to_dict(self):
+        """
+        Serializes the plan into a JSON-compatible dictionary. Keys are replaced
+        by their positions in :attr:`order`.
+
+        :raises: ``ValueError`` if the plan has unresolved keys.
+
+        >>> a = ExecutionPlan()
+        >>> a.add("compiles", "Program compiles")
+        >>> a.add("output", "Output is correct", depends = ["compiles"])
+        >>> a.to_dict() # doctest: +NORMALIZE_WHITESPACE
+        {'tests': [{'depends': [], 'name': 'Program compiles'},
+                   {'depends': [0], 'name': 'Output is correct'}]}
+
+        """
+
+        if self._unmet:
+            raise ValueError("Cannot serialize a plan with unresolved tests.")
+
+        return {
+            "tests": [
+                {
+                    "name": self.names[i],
+                    "depends": [self._positions[j] for j in self.depends[i]]
+                } for i in self.order
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Creates a plan from the output of :meth:`to_dict`. The keys of the new
+        plan are the positions of the tests.
+
+        """
+
+        plan = cls()
+        for i, test in enumerate(data["tests"]):
+            plan.add(i, test["name"], test["depends"])
+
+        return plan
+
+    @classmethod
+    def from_tests(cls, tests):
+        """
+        Creates a plan from a dictionary mapping keys to :class:`Harness.Test
+        <interact.core.Harness.Test>` objects, such as :attr:`Harness.tests
+        <interact.core.Harness>`.
+
+        """
+
+        plan = cls()
+        for key, test in tests.items():
+            plan.add(key, test.name, test.depends)
+
+        return plan
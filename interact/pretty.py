@@ -107,6 +107,87 @@ def truncate_string(string, max_lines = 20, max_characters = 20 * 72):
     else:
         return new_string + "\n---Remaining text truncated---"
 
+def fit_string(string, max_size, size = len,
+        marker = "\n---Remaining text truncated---"):
+    """
+    Returns the longest beginning of ``string`` (followed by ``marker`` if
+    anything was cut off) whose size is at most ``max_size``, or an empty
+    string if not even ``marker`` fits.
+
+    :param size: A function that measures a string. Useful to fit a string
+            into a number of bytes after it has been encoded in some way (the
+            size of a prefix must never be larger than the size of the whole
+            string).
+
+    ``string`` is cut between any two of its items, so pass text containing
+    multibyte characters as ``unicode`` rather than as an encoded ``str``.
+
+    >>> fit_string("Hello world", 20, marker = "...")
+    'Hello world'
+    >>> fit_string("Hello world", 8, marker = "...")
+    'Hello...'
+
+    """
+
+    if size(string) <= max_size:
+        return string
+    elif size(marker) > max_size:
+        return ""
+
+    # Binary search for the longest prefix that fits along with the marker.
+    low, high = 0, len(string)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if size(string[:middle] + marker) <= max_size:
+            low = middle
+        else:
+            high = middle - 1
+
+    return string[:low] + marker
+
+def allocate_budget(budget, demands, weights = None):
+    """
+    Splits ``budget`` between a number of consumers, each asking for some
+    amount of it.
+
+    :param budget: The total amount to hand out.
+    :param demands: A list of how much each consumer would like.
+    :param weights: A list of positive numbers, one per consumer, or ``None``
+            to weigh every consumer equally. Consumers that can't have all
+            they asked for get shares proportional to their weights.
+    :returns: A list of integer allocations, one per consumer, that sum to at
+            most ``budget``. No consumer gets more than it asked for, and
+            whatever a consumer doesn't need is shared among the rest.
+
+    >>> allocate_budget(100, [10, 80, 80])
+    [10, 45, 45]
+    >>> allocate_budget(100, [10, 80, 80], [1, 1, 3])
+    [10, 23, 67]
+
+    """
+
+    if weights is None:
+        weights = [1] * len(demands)
+
+    allocations = [0] * len(demands)
+    remaining = max(budget, 0)
+    remaining_weight = float(sum(weights))
+
+    # Satisfying the consumers asking for the least (relative to their weight)
+    # first means every consumer we get to afterwards gets at least its fair
+    # share of what's left.
+    by_need = sorted(
+        range(len(demands)), key = lambda i: demands[i] / float(weights[i])
+    )
+    for i in by_need:
+        share = int(remaining * weights[i] / remaining_weight)
+        allocations[i] = min(demands[i], share)
+
+        remaining -= allocations[i]
+        remaining_weight -= weights[i]
+
+    return allocations
+
 def craft_shell_command(command):
     """
     Returns a shell command from a list of arguments suitable to be passed into
@@ -0,0 +1,358 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module records the results of every submission a harness grades into a
+local SQLite database, so questions about a whole class (such as which
+problems are most common in a test, or how scores are spread) can be answered
+with a quick query rather than by reading every result again.
+
+.. code-block:: python
+
+    harness.result_store = interact.resultstore.ResultStore("results.db")
+
+Once :attr:`Harness.result_store <interact.core.Harness>` is set, every
+submission's results are recorded when :meth:`Harness.finish
+<interact.core.Harness.finish>` is called (in ``server`` mode, once each
+request is graded). The database has three tables:
+
+``submissions``
+    One row per graded submission: its ``id``, the ``submission`` and
+    ``harness`` IDs Galah gave us (or the paths of the student's code and of
+    the harness), when it was ``recorded``, and its total ``score`` and
+    ``max_score``.
+``results``
+    One row per test of each submission: the ``submission`` it belongs to, the
+    test's ``position`` and ``name``, its ``score`` and ``max_score``, and how
+    many seconds it took (``duration``).
+``messages``
+    One row per message type of each test: the ``submission`` and
+    ``position`` of the test, the message ``type`` (``NULL`` for messages
+    without one), how many messages of that type there were (``count``), and
+    their summed ``dscore``.
+
+"""
+
+import os
+import time
+
+import core
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    submission TEXT,
+    harness TEXT,
+    recorded REAL,
+    score REAL,
+    max_score REAL
+);
+CREATE TABLE IF NOT EXISTS results (
+    submission INTEGER NOT NULL REFERENCES submissions(id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    score REAL,
+    max_score REAL,
+    duration REAL,
+    PRIMARY KEY (submission, position)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    submission INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    type TEXT,
+    count INTEGER NOT NULL,
+    dscore REAL
+);
+CREATE INDEX IF NOT EXISTS submissions_by_submission
+    ON submissions (submission);
+CREATE INDEX IF NOT EXISTS results_by_name ON results (name, score);
+CREATE INDEX IF NOT EXISTS messages_by_result
+    ON messages (submission, position);
+CREATE INDEX IF NOT EXISTS messages_by_type ON messages (type);
+"""
+
+class ResultStore:
+    """
+    A SQLite database of graded submissions.
+
+    :ivar path: The path of the database file. It is created if it does not
+            exist.
+    :ivar batch_size: How many submissions are held in memory before they are
+            written to the database together in a single transaction. Call
+            :meth:`flush` to write them sooner.
+    :ivar max_delay: Once the oldest submission held in memory is this many
+            seconds old, adding another one writes them all even if there are
+            fewer than :attr:`batch_size`.
+    :ivar timeout: How many seconds to wait for another process that is
+            writing to the database.
+
+    In ``server`` mode each request is graded in its own process, which sends
+    its rows back to the server so that they can be written in batches.
+
+    """
+
+    def __init__(self, path, batch_size = 100, max_delay = 5, timeout = 30):
+        self.path = path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.timeout = timeout
+
+        # Submissions that haven't been written yet, each a three-tuple
+        # (submission row, result rows, message rows), and when the first of
+        # them was added.
+        self._pending = []
+        self._pending_since = None
+
+        self._connection = None
+        self._connection_pid = None
+
+    def _connect(self):
+        """
+        Returns a connection to the database, opening one if needed. A process
+        forked from one that has a connection gets its own, as SQLite
+        connections cannot be shared between processes.
+
+        """
+
+        if self._connection is None or self._connection_pid != os.getpid():
+            import sqlite3
+
+            # We manage transactions ourselves so that a whole batch is
+            # committed at once.
+            connection = sqlite3.connect(
+                self.path, timeout = self.timeout, isolation_level = None
+            )
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(_SCHEMA)
+
+            self._connection = connection
+            self._connection_pid = os.getpid()
+
+        return self._connection
+
+    def add(self, harness, score = None, max_score = None):
+        """
+        Adds the results of the tests a harness has just run.
+
+        :param harness: A :class:`Harness <interact.core.Harness>` whose tests
+                have been run.
+        :param score: Passed onto the harness as if given to
+                :meth:`Harness.finish <interact.core.Harness.finish>`.
+        :param max_score: Same as ``score``.
+
+        """
+
+        self.add_rows(self.make_rows(harness, score, max_score))
+
+    def add_rows(self, rows):
+        """
+        Adds a submission's rows as returned by :meth:`make_rows` (possibly
+        after a round trip through JSON).
+
+        """
+
+        submission_row, result_rows, message_rows = rows
+        self._pending.append((
+            tuple(submission_row),
+            [tuple(i) for i in result_rows],
+            [tuple(i) for i in message_rows]
+        ))
+
+        if self._pending_since is None:
+            self._pending_since = time.time()
+
+        if len(self._pending) >= self.batch_size or \
+                time.time() - self._pending_since >= self.max_delay:
+            self.flush()
+
+    @staticmethod
+    def make_rows(harness, score = None, max_score = None):
+        """
+        Returns the rows describing the results of the tests a harness has
+        just run, without adding them to any store. See :meth:`add`.
+
+        """
+
+        total_score, total_max_score = harness._total_score(score, max_score)
+
+        submission = harness.sheep_data.get("raw_submission") or {}
+        harness_data = harness.sheep_data.get("raw_harness") or {}
+        submission_row = (
+            submission.get("id") or
+                harness.sheep_data.get("testables_directory"),
+            harness_data.get("id") or
+                harness.sheep_data.get("harness_directory"),
+            time.time(),
+            total_score,
+            total_max_score
+        )
+
+        result_rows = []
+        message_rows = []
+        for position, test in enumerate(harness.tests.values()):
+            result = test.result
+            if result is None:
+                continue
+
+            result_rows.append((
+                position, test.name, result.score, result.max_score,
+                test.duration
+            ))
+
+            for message_type, (count, dscore) in \
+                    sorted(_count_messages(result).items()):
+                message_rows.append((position, message_type, count, dscore))
+
+        return (submission_row, result_rows, message_rows)
+
+    def flush(self):
+        """
+        Writes every submission added so far to the database.
+
+        """
+
+        if not self._pending:
+            return
+
+        connection = self._connect()
+        cursor = connection.cursor()
+
+        # Taking the write lock up front means we never have to give up half
+        # way through because another process started writing.
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for submission_row, result_rows, message_rows in self._pending:
+                cursor.execute(
+                    "INSERT INTO submissions "
+                        "(submission, harness, recorded, score, max_score) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                    submission_row
+                )
+                submission_id = cursor.lastrowid
+
+                cursor.executemany(
+                    "INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                    ((submission_id, ) + i for i in result_rows)
+                )
+                cursor.executemany(
+                    "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                    ((submission_id, ) + i for i in message_rows)
+                )
+        except:
+            cursor.execute("ROLLBACK")
+            raise
+        else:
+            cursor.execute("COMMIT")
+
+        self._pending = []
+        self._pending_since = None
+
+    def close(self):
+        """
+        Writes any remaining submissions and closes the database.
+
+        """
+
+        self.flush()
+        if self._connection is not None and \
+                self._connection_pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+
+    def query(self, sql, parameters = ()):
+        """
+        Runs an arbitrary query against the database (after writing any
+        pending submissions) and returns a list of the resulting rows.
+
+        """
+
+        self.flush()
+        return self._connect().execute(sql, parameters).fetchall()
+
+    def message_types(self, test_name, limit = 10):
+        """
+        :returns: A list of ``(type, count)`` two-tuples of the most common
+                types of messages given by the test named ``test_name``, most
+                common first.
+
+        """
+
+        return self.query(
+            "SELECT messages.type, SUM(messages.count) AS total "
+                "FROM results JOIN messages "
+                "ON messages.submission = results.submission "
+                    "AND messages.position = results.position "
+                "WHERE results.name = ? AND messages.type IS NOT NULL "
+                "GROUP BY messages.type ORDER BY total DESC, messages.type "
+                "LIMIT ?",
+            (test_name, limit)
+        )
+
+    def score_distribution(self, test_name):
+        """
+        :returns: A list of ``(score, count)`` two-tuples, one for every score
+                the test named ``test_name`` has given, lowest score first.
+
+        """
+
+        return self.query(
+            "SELECT score, COUNT(*) FROM results WHERE name = ? "
+                "GROUP BY score ORDER BY score",
+            (test_name, )
+        )
+
+    def test_summary(self):
+        """
+        :returns: A list of ``(name, submissions, average score, average
+                max_score, average duration)`` five-tuples, one per test.
+
+        """
+
+        return self.query(
+            "SELECT name, COUNT(*), AVG(score), AVG(max_score), AVG(duration) "
+                "FROM results GROUP BY name ORDER BY MIN(position), name"
+        )
+
+def _count_messages(result):
+    """
+    Returns a dictionary mapping each message type in a
+    :class:`TestResult <interact.core.TestResult>` to a two-tuple of how many
+    messages had that type and their summed ``dscore``.
+
+    """
+
+    counts = {}
+
+    def count(message_type, number, dscore):
+        old_number, old_dscore = counts.get(message_type, (0, None))
+        if old_dscore is not None and dscore is not None:
+            dscore += old_dscore
+        elif dscore is None:
+            dscore = old_dscore
+        counts[message_type] = (old_number + number, dscore)
+
+    for message in result.messages:
+        if isinstance(message, core.TestResult.Summary):
+            count(message.type, message.count, message.dscore)
+        else:
+            count(message.type, 1, message.dscore)
+
+    if result.dropped_count:
+        count(None, result.dropped_count, result.dropped_dscore)
+
+    return counts
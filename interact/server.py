@@ -0,0 +1,253 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module implements the ``server`` execution mode (see :doc:`cli`). In
+``server`` mode a harness starts up, imports everything, and registers its tests
+once, and then grades any number of submissions.
+
+Each request is a single line containing the same JSON object a harness reads
+in ``galah`` mode, and each reply is a single line containing the JSON object a
+harness would output in ``galah`` mode. If grading a submission fails, the reply
+is instead an object with a single ``error`` key.
+
+Every submission is graded in its own process forked from the warmed up
+harness, so nothing a test does (or a student's code does) can leak into the
+grading of the next submission.
+
+.. warning::
+
+    Because tests are registered before any request has been read, anything
+    computed from :attr:`Harness.sheep_data <interact.core.Harness>` outside of
+    a test function (such as a module-level call to
+    :meth:`Harness.student_files <interact.core.Harness.student_files>`) will
+    not reflect the submission being graded. Do such work inside your tests.
+
+"""
+
+import os
+import signal
+import socket
+import sys
+import tempfile
+import traceback
+
+import core
+
+def handle_request(harness, sheep_data, score = None, max_score = None):
+    """
+    Grades a single submission in a child process.
+
+    :param harness: A :class:`Harness <interact.core.Harness>` whose tests have
+            been registered.
+    :param sheep_data: The configuration values for the submission.
+    :param score: Passed onto the harness as if given to :meth:`Harness.finish
+            <interact.core.Harness.finish>`.
+    :param max_score: Same as ``score``.
+    :returns: The dictionary the harness would output in ``galah`` mode, or a
+            dictionary with a single ``error`` key if grading failed.
+
+    """
+
+    json = core.json_module()
+
+    # Anything left in our buffers would be written twice if we forked now.
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    # The reply comes back through a file rather than a pipe. Any process a
+    # test starts inherits the child's descriptors, and one still running
+    # (such as a student's program) would keep a pipe from ever reaching its
+    # end. Once the child has exited the file has everything.
+    replies = tempfile.TemporaryFile()
+    child_pid = os.fork()
+    if child_pid == 0:
+        # We are in the child process. Whatever happens we must not return
+        # into the caller's code, so we always leave through os._exit.
+        status = 1
+        try:
+            # Don't let the tests read requests meant for the server, or write
+            # into the stream of replies.
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(2, 1)
+
+            harness.sheep_data = sheep_data
+            harness._run_tests()
+
+            # The server writes the rows for the result store so it can
+            # batch many submissions together.
+            reply = {"results": harness._galah_results(score, max_score)}
+            if harness.result_store is not None:
+                reply["rows"] = harness.result_store.make_rows(
+                    harness, score, max_score
+                )
+
+            replies.write(json.dumps(reply))
+            replies.flush()
+
+            status = 0
+        except:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    # We are in the parent process
+    with replies:
+        _, status = os.waitpid(child_pid, 0)
+        replies.seek(0)
+        output = replies.read()
+
+    if status != 0 or not output:
+        if os.WIFSIGNALED(status):
+            reason = "killed by signal %d" % (os.WTERMSIG(status), )
+        else:
+            reason = "exited with status %d" % (os.WEXITSTATUS(status), )
+
+        return {"error": "The harness %s while grading." % (reason, )}
+
+    reply = json.loads(output)
+    if "rows" in reply:
+        # Adding rows can write a whole batch of them.
+        try:
+            harness.result_store.add_rows(reply["rows"])
+        except Exception:
+            traceback.print_exc()
+
+    return reply["results"]
+
+def _flush_store(harness):
+    """
+    Writes any submissions held by the harness's result store. The store is
+    only for analysis, so an error while writing it is printed rather than
+    raised.
+
+    """
+
+    if harness.result_store is None:
+        return
+
+    try:
+        harness.result_store.flush()
+    except Exception:
+        traceback.print_exc()
+
+def serve_stream(harness, requests, replies, score = None, max_score = None):
+    """
+    Reads requests line by line from the file object ``requests`` and writes a
+    reply line to the file object ``replies`` for each one. Returns once
+    ``requests`` is exhausted.
+
+    """
+
+    json = core.json_module()
+
+    # Iterating over a file directly reads ahead, which would leave a client
+    # that sends one request at a time waiting forever.
+    try:
+        for line in iter(requests.readline, ""):
+            if not line.strip():
+                continue
+
+            try:
+                sheep_data = json.loads(line)
+            except ValueError:
+                reply = {"error": "Could not parse request as JSON."}
+            else:
+                reply = handle_request(harness, sheep_data, score, max_score)
+
+            replies.write(json.dumps(reply) + "\n")
+            replies.flush()
+    finally:
+        # Even if we are being stopped (see serve), don't lose the
+        # submissions the result store is holding on to.
+        _flush_store(harness)
+
+def _reap_children(children):
+    for pid in list(children):
+        reaped, _ = os.waitpid(pid, os.WNOHANG)
+        if reaped != 0:
+            children.discard(pid)
+
+def serve_socket(harness, path, score = None, max_score = None):
+    """
+    Listens for connections on a Unix socket at ``path``, and serves each
+    connection (see :func:`serve_stream`) in its own process so that many
+    clients can be served at once. Runs until interrupted.
+
+    """
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    # Turn the usual way of stopping a server into an exception so that the
+    # socket file gets cleaned up below.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    children = set()
+    try:
+        server.bind(path)
+        server.listen(16)
+
+        while True:
+            connection, _ = server.accept()
+            _reap_children(children)
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+
+            child_pid = os.fork()
+            if child_pid == 0:
+                status = 1
+                try:
+                    server.close()
+                    serve_stream(
+                        harness, connection.makefile("r"),
+                        connection.makefile("w"), score, max_score
+                    )
+                    status = 0
+                except:
+                    traceback.print_exc()
+                finally:
+                    os._exit(status)
+
+            children.add(child_pid)
+            connection.close()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+def serve(harness, score = None, max_score = None):
+    """
+    Serves requests on the harness's :attr:`server_socket
+    <interact.core.Harness>` if it has one, or on standard input and output
+    otherwise. This is called by :meth:`Harness.finish
+    <interact.core.Harness.finish>` in ``server`` mode.
+
+    """
+
+    if harness.server_socket is not None:
+        serve_socket(harness, harness.server_socket, score, max_score)
+    else:
+        # Turn the usual way of stopping a server into an exception so that
+        # serve_stream writes out what the result store is holding.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        serve_stream(harness, sys.stdin, sys.stdout, score, max_score)
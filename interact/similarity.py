@@ -0,0 +1,534 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module finds submissions that are suspiciously similar to each other
+without comparing every pair of them. Each submission is boiled down to a set
+of fingerprints that survive renaming variables and reformatting (see
+:func:`normalize` and :func:`fingerprint`), and a small signature of those
+fingerprints is used to find the pairs worth comparing (see
+:class:`SimilarityIndex`).
+
+The index is kept in a SQLite database, so submissions can be added as they
+come in and are only compared against the ones already there. It can be run as
+a script, with each directory given being one submission:
+
+.. code-block:: bash
+
+    python -m interact.similarity similarity.db submissions/* > report.tsv
+
+"""
+
+import array
+import collections
+import hashlib
+import os
+import os.path
+import re
+import struct
+import sys
+import zlib
+
+import _utils
+import parse
+
+#: Words that :func:`normalize` keeps as they are rather than treating them as
+#: identifiers.
+KEYWORDS = frozenset("""
+    alignas alignof and and_eq asm auto bitand bitor bool break case catch char
+    char16_t char32_t class compl const constexpr const_cast continue decltype
+    default delete do double dynamic_cast else enum explicit export extern
+    false float for friend goto if inline int long mutable namespace new
+    noexcept not not_eq nullptr operator or or_eq private protected public
+    register reinterpret_cast return short signed sizeof static static_assert
+    static_cast struct switch template this thread_local throw true try typedef
+    typeid typename union unsigned using virtual void volatile wchar_t while
+    xor xor_eq
+""".split())
+
+# The words, numbers, and operators that make up a span of code.
+_WORD_RE = re.compile(r"""
+    [A-Za-z_]\w* |
+    \.?\d (?: [eEpP][+-] | [\w.] | '(?=\w) )* |
+    -> | :: | << | >> | && | \|\| | \+\+ | -- | [-+*/%&|^!=<>]= |
+    \S
+""", re.VERBOSE)
+
+#: A pair of similar submissions. ``similarity`` is the Jaccard similarity of
+#: their fingerprints (between ``0`` and ``1``), ``first`` and ``second`` are
+#: their names, and ``shared`` is how many fingerprints they have in common.
+Match = collections.namedtuple("Match", "similarity first second shared")
+
+def normalize(source):
+    """
+    Turns code into a list of tokens that stays the same when comments,
+    whitespace, or the names of things are changed. Every identifier that is
+    not in :data:`KEYWORDS` becomes ``V``, every number ``N``, every string
+    literal ``S``, and every character literal ``C``. Comments and preprocessor
+    lines (such as ``#include``) are dropped.
+
+    :param source: A :class:`parse.SourceFile <interact.parse.SourceFile>`, or
+            the text of a file.
+    :returns: A list of strings.
+
+    >>> normalize("int sum = 0; // Total\\nsum += f(\\"x\\", 'y');")
+    ['int', 'V', '=', 'N', ';', 'V', '+=', 'V', '(', 'S', ',', 'C', ')', ';']
+
+    """
+
+    if not isinstance(source, parse.SourceFile):
+        source = parse.SourceFile(source)
+
+    raw_lines = source.raw_lines
+    code = source.code
+
+    tokens = []
+    for span in source.tokens:
+        if span.kind == parse.COMMENT or code[span.line].lstrip()[:1] == "#":
+            continue
+        elif span.kind == parse.STRING:
+            tokens.append("S")
+        elif span.kind == parse.CHAR:
+            tokens.append("C")
+        else:
+            text = raw_lines[span.line][span.start:span.end]
+            for word in _WORD_RE.findall(text):
+                first = word[0]
+                if first.isalpha() or first == "_":
+                    tokens.append(word if word in KEYWORDS else "V")
+                elif first.isdigit() or first == "." and len(word) > 1:
+                    tokens.append("N")
+                else:
+                    tokens.append(word)
+
+    return tokens
+
+def fingerprint(tokens, k = 5, window = 4):
+    """
+    Picks a set of fingerprints for a list of tokens by winnowing: every run of
+    ``k`` tokens is hashed, and the smallest hash in every ``window``
+    consecutive hashes is kept. Any run of at least ``k + window - 1`` tokens
+    that two lists share is guaranteed to give them a fingerprint in common.
+
+    :param tokens: A list of strings, such as one returned by
+            :func:`normalize`.
+    :returns: A ``frozenset`` of integers.
+
+    """
+
+    hashes = [
+        zlib.crc32(" ".join(tokens[i:i + k])) & 0xffffffff
+            for i in xrange(len(tokens) - k + 1)
+    ]
+    if len(hashes) <= window:
+        return frozenset(hashes)
+
+    selected = set()
+
+    # The positions of the hashes that could still be the smallest in a
+    # window, their hashes increasing from left to right. On ties the
+    # rightmost one is kept, so a run of equal hashes is only picked once.
+    candidates = collections.deque()
+    for i, value in enumerate(hashes):
+        while candidates and hashes[candidates[-1]] >= value:
+            candidates.pop()
+        candidates.append(i)
+
+        if candidates[0] <= i - window:
+            candidates.popleft()
+
+        if i >= window - 1:
+            selected.add(hashes[candidates[0]])
+
+    return frozenset(selected)
+
+_MASK = (1 << 64) - 1
+
+def _mix(value):
+    """
+    Scrambles a 64-bit integer (the finalizer of splitmix64), so that every
+    bit of the result depends on every bit of ``value``.
+
+    """
+
+    value = (value + 0x9e3779b97f4a7c15) & _MASK
+    value = ((value ^ (value >> 30)) * 0xbf58476d1ce4e5b9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94d049bb133111eb) & _MASK
+    return value ^ (value >> 31)
+
+def signature(fingerprints, size = 64):
+    """
+    Computes a MinHash signature of a set of fingerprints, such that the
+    fraction of places two signatures agree in estimates the Jaccard
+    similarity of their sets. This uses one hash function split into ``size``
+    bins (one permutation hashing) rather than ``size`` hash functions, so it
+    takes time proportional to the number of fingerprints only. Empty bins
+    borrow the value of the next bin along that isn't empty.
+
+    :returns: A list of ``size`` integers, or ``None`` if ``fingerprints`` is
+            empty.
+
+    """
+
+    bins = [None] * size
+    for i in fingerprints:
+        mixed = _mix(i)
+        position, value = mixed % size, mixed // size
+        if bins[position] is None or value < bins[position]:
+            bins[position] = value
+
+    if all(i is None for i in bins):
+        return None
+
+    result = list(bins)
+    for position in xrange(size):
+        distance = 1
+        while result[position] is None:
+            borrowed = bins[(position + distance) % size]
+            if borrowed is not None:
+                result[position] = _mix(borrowed + distance)
+            distance += 1
+
+    return result
+
+def jaccard(first, second):
+    """
+    :returns: The Jaccard similarity of two sets: the size of their
+            intersection divided by the size of their union.
+
+    """
+
+    if not first and not second:
+        return 0.0
+
+    shared = len(first & second)
+    return shared / float(len(first) + len(second) - shared)
+
+# Source files are found in submission directories by their extensions.
+_SOURCE_EXTENSIONS = frozenset([
+    ".c", ".cc", ".cpp", ".cxx", ".c++", ".h", ".hh", ".hpp", ".hxx"
+])
+
+def find_sources(directory):
+    """
+    :returns: A sorted list of the paths of every C or C++ source and header
+            file in ``directory`` or any directory inside of it.
+
+    """
+
+    result = []
+    for root, dirs, files in os.walk(directory):
+        for i in files:
+            if os.path.splitext(i)[1].lower() in _SOURCE_EXTENSIONS:
+                result.append(os.path.join(root, i))
+
+    return sorted(result)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    fingerprints BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bands (
+    key INTEGER NOT NULL,
+    submission INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_by_key ON bands (key);
+CREATE INDEX IF NOT EXISTS bands_by_submission ON bands (submission);
+"""
+
+class SimilarityIndex:
+    """
+    An index of submissions' fingerprints, kept in a SQLite database.
+
+    Each submission's :func:`signature` is cut into ``bands`` bands of ``rows``
+    values, and two submissions are only compared if at least one of their
+    bands is exactly the same (locality sensitive hashing). Pairs with a
+    similarity of ``s`` are found with probability
+    ``1 - (1 - s ** rows) ** bands``: with the defaults, more than 99% of pairs
+    at ``0.8``, 64% at ``0.5``, and under 3% at ``0.2``.
+
+    :ivar path: The path of the database file, or ``":memory:"`` if the index
+            isn't saved anywhere.
+    :ivar k: See :func:`fingerprint`.
+    :ivar window: See :func:`fingerprint`.
+    :ivar bands: How many bands each signature is cut into.
+    :ivar rows: How many values of the signature are in each band.
+    :ivar threshold: Candidate pairs less similar than this are not reported.
+
+    ``k``, ``window``, ``bands``, and ``rows`` are saved along with the index,
+    and opening an existing index with different ones raises a
+    ``ValueError``.
+
+    """
+
+    def __init__(self, path = None, k = 5, window = 4, bands = 16, rows = 4,
+            threshold = 0.5):
+        import sqlite3
+
+        self.path = ":memory:" if path is None else _utils.resolve_path(path)
+        self.k = k
+        self.window = window
+        self.bands = bands
+        self.rows = rows
+        self.threshold = threshold
+
+        # We manage transactions ourselves so that a submission is never
+        # half added.
+        self._connection = sqlite3.connect(self.path, isolation_level = None)
+        self._connection.executescript(_SCHEMA)
+
+        settings = {"k": k, "window": window, "bands": bands, "rows": rows}
+        saved = dict(self._connection.execute(
+            "SELECT name, value FROM settings"
+        ).fetchall())
+        if not saved:
+            self._connection.executemany(
+                "INSERT INTO settings VALUES (?, ?)", settings.items()
+            )
+        elif saved != settings:
+            raise ValueError(
+                "The index at %s was built with different settings: %r." %
+                    (self.path, saved)
+            )
+
+    def close(self):
+        self._connection.close()
+
+    def fingerprint_files(self, files):
+        """
+        :returns: The fingerprints of a submission made up of the given files,
+                whose tokens are joined together in the order given.
+
+        """
+
+        # Each file is only needed once, so it isn't put in the cache of
+        # parse.SourceFile.open, which would keep a whole cohort of
+        # submissions in memory.
+        tokens = []
+        for path in files:
+            with open(path) as f:
+                tokens.extend(normalize(f.read()))
+
+        return fingerprint(tokens, self.k, self.window)
+
+    def _band_keys(self, fingerprints):
+        values = signature(fingerprints, self.bands * self.rows)
+        if values is None:
+            return []
+
+        keys = []
+        for band in xrange(self.bands):
+            packed = struct.pack(
+                "<I%dQ" % (self.rows, ),
+                band, *values[band * self.rows:(band + 1) * self.rows]
+            )
+            keys.append(
+                struct.unpack("<q", hashlib.sha1(packed).digest()[:8])[0]
+            )
+
+        return keys
+
+    def _load(self, submission_ids):
+        """
+        Returns a dictionary mapping each of the given submission IDs to a
+        two-tuple of the submission's name and fingerprints.
+
+        """
+
+        result = {}
+        submission_ids = list(submission_ids)
+
+        # SQLite only allows so many parameters in one query.
+        for start in xrange(0, len(submission_ids), 500):
+            chunk = submission_ids[start:start + 500]
+            rows = self._connection.execute(
+                "SELECT id, name, fingerprints FROM submissions "
+                    "WHERE id IN (%s)" % (", ".join("?" * len(chunk)), ),
+                chunk
+            )
+            for submission_id, name, blob in rows:
+                fingerprints = array.array("L")
+                fingerprints.fromstring(str(blob))
+                result[submission_id] = (name, frozenset(fingerprints))
+
+        return result
+
+    def add(self, name, files):
+        """
+        Adds a submission to the index, replacing any submission with the same
+        name.
+
+        :param name: The name of the submission, such as the student's user
+                name.
+        :param files: A list of paths of the submission's source files.
+        :returns: A list of :class:`Match` objects for the submissions already
+                in the index that are at least :attr:`threshold` similar to
+                this one, most similar first.
+
+        """
+
+        return self.add_fingerprints(name, self.fingerprint_files(files))
+
+    def add_fingerprints(self, name, fingerprints):
+        """
+        Like :meth:`add`, but takes the submission's fingerprints (see
+        :func:`fingerprint`) rather than its files.
+
+        """
+
+        import sqlite3
+
+        keys = self._band_keys(fingerprints)
+        blob = array.array("L", sorted(fingerprints)).tostring()
+
+        cursor = self._connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            old = cursor.execute(
+                "SELECT id FROM submissions WHERE name = ?", (name, )
+            ).fetchone()
+            if old is not None:
+                cursor.execute(
+                    "DELETE FROM bands WHERE submission = ?", (old[0], )
+                )
+                cursor.execute(
+                    "DELETE FROM submissions WHERE id = ?", (old[0], )
+                )
+
+            candidates = set()
+            if keys:
+                candidates.update(i[0] for i in cursor.execute(
+                    "SELECT DISTINCT submission FROM bands WHERE key IN (%s)" %
+                        (", ".join("?" * len(keys)), ),
+                    keys
+                ))
+
+            cursor.execute(
+                "INSERT INTO submissions (name, fingerprints) VALUES (?, ?)",
+                (name, sqlite3.Binary(blob))
+            )
+            submission_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO bands VALUES (?, ?)",
+                ((i, submission_id) for i in keys)
+            )
+        except:
+            cursor.execute("ROLLBACK")
+            raise
+        else:
+            cursor.execute("COMMIT")
+
+        matches = []
+        for other_name, other in self._load(candidates).values():
+            match = self._compare(other_name, other, name, fingerprints)
+            if match is not None:
+                matches.append(match)
+
+        return rank(matches)
+
+    def _compare(self, first_name, first, second_name, second):
+        shared = len(first & second)
+        if not shared:
+            return None
+
+        similarity = shared / float(len(first) + len(second) - shared)
+        if similarity < self.threshold:
+            return None
+
+        return Match(similarity, first_name, second_name, shared)
+
+    def matches(self):
+        """
+        Finds every pair of submissions in the index that are at least
+        :attr:`threshold` similar.
+
+        :returns: A list of :class:`Match` objects, most similar first.
+
+        """
+
+        pairs = self._connection.execute(
+            "SELECT DISTINCT a.submission, b.submission "
+                "FROM bands AS a JOIN bands AS b "
+                "ON a.key = b.key AND a.submission < b.submission"
+        ).fetchall()
+
+        submissions = self._load(set(i for pair in pairs for i in pair))
+
+        result = []
+        for first, second in pairs:
+            match = self._compare(*(submissions[first] + submissions[second]))
+            if match is not None:
+                result.append(match)
+
+        return rank(result)
+
+def rank(matches):
+    """
+    :returns: ``matches`` sorted with the most similar pairs first, and pairs
+            that are equally similar sorted by name.
+
+    """
+
+    return sorted(
+        matches, key = lambda x: (-x.similarity, x.first, x.second)
+    )
+
+def write_report(matches, out = sys.stdout):
+    """
+    Writes a list of :class:`Match` objects to the file ``out`` as
+    tab-seperated values, with a header line.
+
+    """
+
+    out.write("similarity\tshared\tfirst\tsecond\n")
+    for i in matches:
+        out.write("%.3f\t%d\t%s\t%s\n" % (
+            i.similarity, i.shared, i.first, i.second
+        ))
+
+def main(args = sys.argv[1:]):
+    """
+    main(args = sys.argv[1:])
+
+    Adds every submission directory named in ``args[1:]`` to the index saved
+    at ``args[0]`` (creating it if needed, and naming each submission after
+    its directory), then writes a report of every similar pair in the index to
+    standard output.
+
+    """
+
+    if not args:
+        sys.exit("Usage: python -m interact.similarity INDEX [SUBMISSION]...")
+
+    index = SimilarityIndex(args[0])
+    for directory in args[1:]:
+        index.add(
+            os.path.basename(os.path.normpath(directory)),
+            find_sources(directory)
+        )
+
+    write_report(index.matches())
+    index.close()
+
+if __name__ == "__main__":
+    main()
@@ -36,6 +36,7 @@ import core
 import pretty
 import parse
 import execute
+import style
 
 def check_files_exist(*files, **extra):
     """
@@ -92,7 +93,26 @@ def check_files_exist(*files, **extra):
 
     return result
 
-def check_indentation(files, max_score = 10, allow_negative = False):
+#: Files bigger than this many bytes are read a line at a time by
+#: :func:`check_indentation` rather than being parsed whole, and if there are
+#: several of them they are checked in parallel.
+PARALLEL_THRESHOLD = 2 ** 20
+
+def _find_bad_indentation_in_file(path):
+    # Universal newlines splits lines the same way str.splitlines() does.
+    with open(path, "rU") as f:
+        return parse.find_bad_indentation_streaming(f)
+
+def _find_bad_indentation_in_source(path):
+    # Other checks looking at the same file will share its parsed form.
+    source = parse.SourceFile.open(path)
+    if source.text == "":
+        return []
+
+    return parse.find_bad_indentation(source.blocks)
+
+def check_indentation(files, max_score = 10, allow_negative = False,
+        processes = None):
     """
     Checks to see if code is indented properly.
 
@@ -105,8 +125,22 @@ def check_indentation(files, max_score = 10, allow_negative = False):
                       ``max_score``.
     :param allow_negative: If True, a negative total score will be possible,
                            if False, 0 will be the lowest score possible.
+    :param processes: How many processes to check the files with. If ``None``,
+                      the files bigger than :data:`PARALLEL_THRESHOLD` bytes
+                      are checked with one process per CPU if there's more
+                      than one of them, and every other file is checked in
+                      this process. Either way, messages are given in the same
+                      order as ``files``.
     :returns: A ``TestResult`` object.
 
+    Files checked in this process are parsed through
+    :class:`interact.parse.SourceFile`, so other checks of the same files
+    don't parse them again. Files bigger than :data:`PARALLEL_THRESHOLD` bytes
+    (and every file checked in another process) are instead read a line at a
+    time, and only lines that might be badly indented are kept in memory (see
+    :func:`interact.parse.find_bad_indentation_streaming`), so very large
+    files are fine.
+
     .. code-block:: python
 
         >>> print open("main.cpp").read()
@@ -155,20 +189,46 @@ def check_indentation(files, max_score = 10, allow_negative = False):
         max_score = max_score
     )
 
-    for current_file in files:
-        with open(current_file) as f:
-            code = f.read()
-        if code == "":
-            continue
+    def is_large(path):
+        return os.path.isfile(path) and \
+            os.path.getsize(path) > PARALLEL_THRESHOLD
 
-        # Transform tjhe code into a list of Line objects
-        lines = parse.Line.make_lines(code.splitlines())
+    # The files to check in other processes.
+    if processes is None:
+        pooled = [i for i in files if is_large(i)]
+    elif processes > 1:
+        pooled = list(files)
+    else:
+        pooled = []
+
+    # Maps each file checked in another process to its badly indented lines.
+    pooled_problems = {}
+    if len(pooled) > 1:
+        import multiprocessing
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
 
-        # Break the code up into blocks.
-        blocks = parse.grab_blocks(lines)
+        pool = multiprocessing.Pool(min(processes, len(pooled)))
+        try:
+            pooled_problems = dict(zip(
+                pooled, pool.map(_find_bad_indentation_in_file, pooled)
+            ))
+        except:
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            pool.join()
 
-        # Get a list of all the badly indented lines.
-        problems = parse.find_bad_indentation(blocks)
+    for current_file in files:
+        if current_file in pooled_problems:
+            problems = pooled_problems[current_file]
+        elif is_large(current_file):
+            problems = _find_bad_indentation_in_file(current_file)
+        else:
+            problems = _find_bad_indentation_in_source(current_file)
 
         if problems:
             result.add_message(core.TestResult.Message(
@@ -192,6 +252,28 @@ def check_indentation(files, max_score = 10, allow_negative = False):
 
     return result
 
+def check_style(files, rules = None, max_score = 10, allow_negative = False):
+    """
+    Checks the style of some code against a number of rules in a single pass
+    over each file. See :mod:`interact.style` for the rules available and how
+    to write new ones.
+
+    :param files: A list of file paths that will each be opened and examined.
+    :param rules: A list of :class:`interact.style.Rule` objects. If ``None``,
+                  every rule in :mod:`interact.style` is used with its default
+                  settings.
+    :param max_score: Each problem found takes a point off from the total
+                      score, which starts at ``max_score``.
+    :param allow_negative: If True, a negative total score will be possible,
+                           if False, 0 will be the lowest score possible.
+    :returns: A ``TestResult`` object.
+
+    """
+
+    return style.StyleChecker(rules).check_combined(
+        files, max_score = max_score, allow_negative = allow_negative
+    )
+
 def check_compiles(files, flags = [], ignore_cache = False):
     """
     Attempts to compile some files.
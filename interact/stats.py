@@ -0,0 +1,121 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module keeps track of how long each test has taken in previous runs of a
+harness. A :class:`Harness <interact.core.Harness>` with a :attr:`stats_file
+<interact.core.Harness>` uses these durations to start its slowest tests first
+and to balance the pieces it is split into with ``--shard``.
+
+"""
+
+import _utils
+import os
+import os.path
+import tempfile
+
+import core
+
+#: The duration (in seconds) assumed for a test when no test has any history.
+DEFAULT_COST = 1.0
+
+class TestStats:
+    """
+    A small JSON file mapping test names to their typical duration in seconds.
+
+    :ivar path: The absolute path of the file.
+    :ivar durations: A dictionary mapping test names to durations.
+    :ivar smoothing: How much weight a new duration gets when it is averaged
+            with the old one, between ``0`` and ``1``. ``1`` means only the
+            most recent run matters.
+
+    """
+
+    def __init__(self, path, smoothing = 0.5):
+        self.path = _utils.resolve_path(path)
+        self.smoothing = smoothing
+        self.durations = {}
+
+        json = core.json_module()
+        try:
+            with open(self.path) as f:
+                loaded = json.load(f)
+        except (IOError, ValueError):
+            # Missing or corrupted stats just means we have no history.
+            loaded = {}
+
+        if isinstance(loaded, dict):
+            self.durations = loaded
+
+    def record(self, name, seconds):
+        """
+        Adds a new duration for the test named ``name`` to its history.
+
+        """
+
+        old = self.durations.get(name)
+        if old is None:
+            self.durations[name] = seconds
+        else:
+            self.durations[name] = \
+                self.smoothing * seconds + (1 - self.smoothing) * old
+
+    def estimate(self, name, default = None):
+        """
+        :returns: The typical duration of the test named ``name``, or
+                ``default`` if it has no history.
+
+        """
+
+        return self.durations.get(name, default)
+
+    def costs(self, tests):
+        """
+        :param tests: A dictionary mapping keys to :class:`Harness.Test
+                <interact.core.Harness.Test>` objects.
+        :returns: A dictionary mapping the same keys to estimated durations.
+                Tests without any history are assumed to take the average
+                duration of the tests that have one.
+
+        """
+
+        known = [i for i in self.durations.values() if i is not None]
+        default = sum(known) / len(known) if known else DEFAULT_COST
+
+        return dict(
+            (key, self.estimate(test.name, default))
+                for key, test in tests.items()
+        )
+
+    def save(self):
+        """
+        Writes the durations back to the file. The file is replaced atomically
+        so a harness reading it at the same time never sees half of it.
+
+        """
+
+        json = core.json_module()
+
+        directory = os.path.dirname(self.path)
+        fd, temp_path = tempfile.mkstemp(dir = directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.durations, f)
+            os.rename(temp_path, self.path)
+        except:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,542 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+This module checks the style of students' code. A style check is made up of
+rules (subclasses of :class:`Rule`), each of which is told about the blocks,
+lines, and tokens of a file as a :class:`StyleChecker` walks over it. However
+many rules there are, each file is parsed once (see
+:class:`parse.SourceFile <interact.parse.SourceFile>`) and walked once.
+
+.. code-block:: python
+
+    checker = interact.style.StyleChecker([
+        interact.style.Indentation(),
+        interact.style.LineLength(max_length = 100),
+        interact.style.TrailingWhitespace()
+    ])
+
+    # One TestResult per rule...
+    for name, result in checker.check(["main.cpp", "foo.cpp"]).items():
+        print result
+
+    # ...or one for all of them.
+    print checker.check_combined(["main.cpp", "foo.cpp"])
+
+    # How many seconds each rule took.
+    print checker.timings
+
+New rules only need to override the callbacks they care about and call
+:meth:`Rule.report` for each line that breaks them.
+
+.. code-block:: python
+
+    class NoGoto(interact.style.Rule):
+        name = "no_goto"
+        brief = "This test checks that you never use goto."
+        message = "{lines_} {line_numbers_} in {file_name} {are_} using goto."
+        type = "myharness/style/no_goto"
+
+        def token(self, source, span, text):
+            if span.kind == interact.parse.CODE and \\
+                    re.search(r"\\bgoto\\b", text):
+                self.report(span.line)
+
+"""
+
+import time
+
+import core
+import pretty
+import parse
+
+class Rule(object):
+    """
+    A style rule. A :class:`StyleChecker` calls a rule's callbacks as it walks
+    over each file, in this order:
+
+    #. :meth:`begin` once.
+    #. :meth:`line` for every line in order, each followed by :meth:`token`
+       for every :class:`Span <interact.parse.Span>` on that line. Along the
+       way, :meth:`enter_block` is called for every block just before its
+       first line and :meth:`exit_block` just after its last line, so a line
+       is always seen while inside the block it belongs to.
+    #. :meth:`end` once.
+
+    Only the callbacks a subclass overrides are ever called. Every callback is
+    given the :class:`parse.SourceFile <interact.parse.SourceFile>` being
+    walked, and lines are always referred to by their index in
+    ``source.raw_lines`` (counting from ``0``).
+
+    :ivar name: A short name for the rule, used as the key of its result in
+            :meth:`StyleChecker.check` and of its time in
+            :attr:`StyleChecker.timings`.
+    :ivar brief: The ``brief`` of the rule's ``TestResult``.
+    :ivar message: A format string used for the message given for each file
+            that breaks the rule. ``{file_name}`` is the path of the file,
+            ``{line_numbers_}`` is a pretty list of the line numbers of the
+            problems (counting from ``1``), ``{lines_}`` is ``Line`` or
+            ``Lines``, and ``{are_}`` is ``is`` or ``are``.
+    :ivar type: The ``type`` of the messages.
+    :ivar dscore: How many points each problem is worth (a negative number).
+
+    """
+
+    name = "style"
+    brief = "This test checks the style of your code."
+    message = "{lines_} {line_numbers_} in {file_name} {are_} badly styled."
+    type = "interact/style/basic_style"
+    dscore = -1
+
+    def begin(self, source):
+        """
+        Called before anything else in each file.
+
+        """
+
+        pass
+
+    def enter_block(self, source, block, depth):
+        """
+        Called for each :class:`Block <interact.parse.Block>` before any of its
+        sub blocks. The top-level block has a ``depth`` of ``0``.
+
+        """
+
+        pass
+
+    def exit_block(self, source, block, depth):
+        """
+        Called for each :class:`Block <interact.parse.Block>` after all of its
+        sub blocks.
+
+        """
+
+        pass
+
+    def line(self, source, index, text):
+        """
+        Called for each line, ``text`` being its contents.
+
+        """
+
+        pass
+
+    def token(self, source, span, text):
+        """
+        Called for each :class:`Span <interact.parse.Span>` found by
+        :func:`parse.tokenize <interact.parse.tokenize>`, ``text`` being the
+        part of the line it covers.
+
+        """
+
+        pass
+
+    def end(self, source):
+        """
+        Called after everything else in each file.
+
+        """
+
+        pass
+
+    def report(self, index):
+        """
+        Records that the line at ``index`` breaks this rule. Reporting the same
+        line more than once only counts it once.
+
+        """
+
+        self._problems.add(index)
+
+# The names of the callbacks a Rule can override.
+_CALLBACKS = ("begin", "enter_block", "exit_block", "line", "token", "end")
+
+class StyleChecker(object):
+    """
+    Walks over files and tells each of its rules about them.
+
+    :ivar rules: A list of the :class:`Rule` objects to check. If not given to
+            the constructor, every rule in this module with its default
+            settings (see :func:`default_rules`).
+    :ivar timings: A dictionary mapping each rule's name to the total number of
+            seconds spent in its callbacks, across every file this checker has
+            walked.
+
+    """
+
+    def __init__(self, rules = None):
+        self.rules = default_rules() if rules is None else list(rules)
+        self.timings = dict((i.name, 0.0) for i in self.rules)
+
+    def _handlers(self):
+        """
+        Returns a dictionary mapping each callback name to a list of
+        ``(rule, method)`` two-tuples, one for every rule that overrides it.
+
+        """
+
+        handlers = dict((i, []) for i in _CALLBACKS)
+        for rule in self.rules:
+            for name in _CALLBACKS:
+                method = getattr(type(rule), name).im_func
+                if method is not getattr(Rule, name).im_func:
+                    handlers[name].append((rule, getattr(rule, name)))
+
+        return handlers
+
+    def check_file(self, path):
+        """
+        Walks over a single file.
+
+        :param path: The path of the file.
+        :returns: A dictionary mapping each rule's name to a sorted list of the
+                indexes (counting from ``0``) of the lines that break it.
+
+        """
+
+        source = parse.SourceFile.open(path)
+        handlers = self._handlers()
+        timings = self.timings
+        clock = time.time
+
+        for rule in self.rules:
+            rule._problems = set()
+
+        def dispatch(name, *args):
+            for rule, method in handlers[name]:
+                started = clock()
+                method(source, *args)
+                timings[rule.name] = \
+                    timings.get(rule.name, 0.0) + clock() - started
+
+        dispatch("begin")
+
+        walk_blocks = source.blocks is not None and \
+            (handlers["enter_block"] or handlers["exit_block"])
+        walk_lines = handlers["line"] or handlers["token"]
+
+        raw_lines = source.raw_lines
+        tokens = source.tokens if handlers["token"] else []
+
+        # The index of the next line and token to dispatch.
+        positions = [0, 0]
+
+        # Dispatches every line before the one at until, along with its
+        # tokens.
+        def dispatch_lines(until):
+            if until is None:
+                return
+
+            index, position = positions
+            while index < until and index < len(raw_lines):
+                text = raw_lines[index]
+                if handlers["line"]:
+                    dispatch("line", index, text)
+
+                while position < len(tokens) and \
+                        tokens[position].line == index:
+                    span = tokens[position]
+                    dispatch("token", span, text[span.start:span.end])
+                    position += 1
+
+                index += 1
+
+            positions[:] = [index, position]
+
+        # Where the lines of a block start and end (the index just past its
+        # last line), or None if there's no need to know.
+        def start(block):
+            if walk_lines and block.lines:
+                return block.lines[0].line_number
+
+        def stop(block):
+            if walk_lines and block.lines:
+                return block.lines[-1].line_number + 1
+
+        if walk_blocks:
+            # Walk the tree with our own stack so that deeply nested code
+            # can't hit the recursion limit. Each line is dispatched between
+            # entering the block it belongs to and exiting it.
+            dispatch_lines(start(source.blocks))
+            dispatch("enter_block", source.blocks, 0)
+            stack = [(source.blocks, iter(source.blocks.sub_blocks))]
+            while stack:
+                block, sub_blocks = stack[-1]
+                sub_block = next(sub_blocks, None)
+                if sub_block is None:
+                    stack.pop()
+                    dispatch_lines(stop(block))
+                    dispatch("exit_block", block, len(stack))
+                else:
+                    dispatch_lines(start(sub_block))
+                    dispatch("enter_block", sub_block, len(stack))
+                    stack.append((sub_block, iter(sub_block.sub_blocks)))
+
+        if walk_lines:
+            dispatch_lines(len(raw_lines))
+
+        dispatch("end")
+
+        problems = dict((i.name, sorted(i._problems)) for i in self.rules)
+        for rule in self.rules:
+            del rule._problems
+
+        return problems
+
+    def _add_messages(self, result, rule, path, problems):
+        if not problems:
+            return
+
+        line_numbers = [i + 1 for i in problems]
+        result.add_message(
+            rule.message,
+            lines_ = pretty.plural_if("Line", len(problems)),
+            line_numbers_ = pretty.pretty_list(line_numbers),
+            are_ = "are" if len(problems) > 1 else "is",
+            line_numbers = line_numbers,
+            file_name = path,
+            dscore = rule.dscore * len(problems),
+            type = rule.type
+        )
+
+    def check(self, files, max_score = 10, allow_negative = False):
+        """
+        Checks every rule against some files.
+
+        :param files: A list of paths of files to check.
+        :param max_score: The score of each rule's ``TestResult`` starts at
+                ``max_score``, and every problem takes the rule's
+                :attr:`dscore <Rule>` off of it.
+        :param allow_negative: If ``True``, a negative score will be possible,
+                if ``False``, 0 will be the lowest score possible.
+        :returns: A :data:`core.ORDERED_DICT <interact.core.ORDERED_DICT>`
+                mapping each rule's name to a ``TestResult``, in the same order
+                as :attr:`rules`.
+
+        """
+
+        results = core.ORDERED_DICT()
+        for rule in self.rules:
+            results[rule.name] = core.TestResult(
+                brief = rule.brief,
+                default_message = "**Great job!** We didn't find any "
+                                  "problems with your code.",
+                max_score = max_score
+            )
+
+        for path in files:
+            problems = self.check_file(path)
+            for rule in self.rules:
+                self._add_messages(
+                    results[rule.name], rule, path, problems[rule.name]
+                )
+
+        for result in results.values():
+            result.calculate_score(
+                min_score = None if allow_negative else 0
+            )
+
+        return results
+
+    def check_combined(self, files, max_score = 10, allow_negative = False):
+        """
+        Like :meth:`check`, but gives a single ``TestResult`` for all of the
+        rules.
+
+        """
+
+        result = core.TestResult(
+            brief = "This test checks the style of your code.",
+            default_message = "**Great job!** We didn't find any problems "
+                              "with the style of your code.",
+            max_score = max_score
+        )
+
+        for path in files:
+            problems = self.check_file(path)
+            for rule in self.rules:
+                self._add_messages(result, rule, path, problems[rule.name])
+
+        return result.calculate_score(min_score = None if allow_negative else 0)
+
+class Indentation(Rule):
+    """
+    Checks that every block of code is indented strictly more than its parent
+    block, exactly like :func:`parse.find_bad_indentation
+    <interact.parse.find_bad_indentation>`.
+
+    """
+
+    name = "indentation"
+    brief = ("This test checks to ensure you are indenting properly. Make "
+             "sure that every time you start a new block (curly braces "
+             "delimit blocks) you indent more.")
+    message = ("{lines_} {line_numbers_} in {file_name} {are_} not indented "
+               "more than the outer block.")
+    type = "interact/style/indentation"
+
+    def begin(self, source):
+        # The minimum indentation level of each block we are inside of.
+        self._minimums = [None]
+
+    def enter_block(self, source, block, depth):
+        minimum = self._minimums[-1]
+
+        new_minimum = None
+        for i in block.lines:
+            level = i.indent_level()
+            if level is None or \
+                    i.code.strip() in parse.INDENT_EXCEPTED_LINES:
+                continue
+
+            if minimum is not None and level <= minimum:
+                self.report(i.line_number)
+
+            if new_minimum is None or level < new_minimum:
+                new_minimum = level
+
+        self._minimums.append(minimum if new_minimum is None else new_minimum)
+
+    def exit_block(self, source, block, depth):
+        self._minimums.pop()
+
+class LineLength(Rule):
+    """
+    Checks that no line is longer than ``max_length`` characters, with tabs
+    counted as ``tab_width`` characters.
+
+    """
+
+    name = "line_length"
+    brief = "This test checks that none of your lines are too long."
+    type = "interact/style/line_length"
+
+    def __init__(self, max_length = 80, tab_width = 4):
+        self.max_length = max_length
+        self.tab_width = tab_width
+        self.message = (
+            "{lines_} {line_numbers_} in {file_name} {are_} longer than "
+            "%d characters." % (max_length, )
+        )
+
+    def line(self, source, index, text):
+        if len(text) > self.max_length or "\t" in text and \
+                len(text.expandtabs(self.tab_width)) > self.max_length:
+            self.report(index)
+
+class TrailingWhitespace(Rule):
+    """
+    Checks that no line ends with spaces or tabs.
+
+    """
+
+    name = "trailing_whitespace"
+    brief = "This test checks that none of your lines end with whitespace."
+    message = ("{lines_} {line_numbers_} in {file_name} {are_} followed by "
+               "trailing whitespace.")
+    type = "interact/style/trailing_whitespace"
+
+    def line(self, source, index, text):
+        if text and text[-1] in " \t":
+            self.report(index)
+
+class MixedIndentation(Rule):
+    """
+    Checks that no line is indented with both tabs and spaces.
+
+    """
+
+    name = "mixed_indentation"
+    brief = ("This test checks that you don't indent with both tabs and "
+             "spaces.")
+    message = ("{lines_} {line_numbers_} in {file_name} {are_} indented with "
+               "both tabs and spaces.")
+    type = "interact/style/mixed_indentation"
+
+    def line(self, source, index, text):
+        level = source.raw_lines.indent_level(index)
+        if level:
+            indentation = text[:level]
+            if " " in indentation and "\t" in indentation:
+                self.report(index)
+
+class BraceStyle(Rule):
+    """
+    Checks that every opening curly brace is placed the same way: either at
+    the end of the line that starts the block (``if (x) {``) or on a line of
+    its own. Whichever is used more in a file is taken to be that file's
+    style (or whichever comes first if they are used equally), and the lines
+    with braces placed the other way are reported.
+
+    """
+
+    name = "brace_style"
+    brief = ("This test checks that you place your curly braces consistently.")
+    message = ("{lines_} {line_numbers_} in {file_name} {are_} placing a curly "
+               "brace differently than the rest of the file.")
+    type = "interact/style/brace_style"
+
+    def begin(self, source):
+        # The lines with braces placed each way.
+        self._attached = []
+        self._own_line = []
+
+        # The last line we saw any code on.
+        self._code_line = None
+
+    def token(self, source, span, text):
+        if span.kind != parse.CODE:
+            return
+
+        if "{" in text:
+            stripped = text.lstrip()
+            if self._code_line != span.line and stripped.startswith("{"):
+                self._own_line.append(span.line)
+                if "{" in stripped[1:]:
+                    self._attached.append(span.line)
+            else:
+                self._attached.append(span.line)
+
+        if not text.isspace():
+            self._code_line = span.line
+
+    def end(self, source):
+        attached, own_line = self._attached, self._own_line
+        if not attached or not own_line:
+            return
+
+        if len(attached) > len(own_line) or \
+                len(attached) == len(own_line) and attached[0] < own_line[0]:
+            wrong = own_line
+        else:
+            wrong = attached
+
+        for i in wrong:
+            self.report(i)
+
+def default_rules():
+    """
+    :returns: A list with one of each of the rules in this module, with their
+            default settings.
+
+    """
+
+    return [
+        Indentation(), LineLength(), TrailingWhitespace(), MixedIndentation(),
+        BraceStyle()
+    ]
@@ -30,21 +30,25 @@ student's code.
 
 import interact._utils as _utils
 import os
-import imp
-import inspect
 import atexit
 import shutil
 import tempfile
-import subprocess
 import os.path
-import distutils.core
 import capture
 
-#: The absolute path to the swig executable. When this module is imported, the
-#: environmental variable ``PATH`` is searched for a file named ``swig``, this
-#: variable will be set to the first one that is found. This variable will equal
-#: ``None`` if no such file could be found.
-swig_path = _utils.which("swig")
+_swig_path = False
+def _find_swig():
+    """
+    :returns: The value of :data:`swig_path`. The environmental variable
+            ``PATH`` is only searched the first time this is called.
+
+    """
+
+    global _swig_path
+    if _swig_path is False:
+        _swig_path = _utils.which("swig")
+
+    return _swig_path
 
 class CouldNotCompile(RuntimeError):
     """
@@ -73,6 +77,8 @@ class CouldNotCompile(RuntimeError):
         return "\n".join(output)
 
 def _build_extension(module, mod_ext, working_directory):
+    import distutils.core
+
     os.chdir(working_directory)
     distutils.core.setup(
         name = module,
@@ -90,6 +96,8 @@ def _generate_shared_libraries(modules, wrapper_directory):
 
     """
 
+    import distutils.core
+
     wrapper_directory = _utils.resolve_path(wrapper_directory)
 
     for module in modules:
@@ -99,18 +107,24 @@ def _generate_shared_libraries(modules, wrapper_directory):
             str(so_name), sources = [str(wrapper_file)]
         )
 
-        try:
-            captured = capture.capture_function(
-                _build_extension, str(module), mod_ext, str(wrapper_directory)
-            )
-            captured.wait()
-        except SystemExit:
+        captured = capture.capture_function(
+            _build_extension, str(module), mod_ext, str(wrapper_directory)
+        )
+
+        # The compiler can write a lot, so read everything at once rather than
+        # risk filling up a pipe.
+        completed = captured.communicate()
+
+        exception = completed.exception
+        if exception is SystemExit or isinstance(exception, SystemExit):
             # Setup will call exit which can make the running script exit rather
             # suddenly. At least give the user an error with a traceback.
             raise CouldNotCompile(
                 "Could not compile extension module.",
-                stderr = captured.stderr.read()
+                stderr = completed.stderr
             )
+        elif exception is not None:
+            raise exception
 
 def _generate_swig_wrappers(interface_files, output_directory):
     """
@@ -121,7 +135,9 @@ def _generate_swig_wrappers(interface_files, output_directory):
 
     """
 
-    if swig_path is None:
+    import subprocess
+
+    if _find_swig() is None:
         raise EnvironmentError("No swig executable found.")
 
     output_directory = _utils.resolve_path(output_directory)
@@ -134,9 +150,9 @@ def _generate_swig_wrappers(interface_files, output_directory):
 
         # Let swig generate the wrapper files.
         subprocess.check_call(
-            [swig_path, "-c++", "-python", "-o", output_file, current_file],
+            [_find_swig(), "-c++", "-python", "-o", output_file, current_file],
             cwd = output_directory,
-            stdout = _utils.DEVNULL,
+            stdout = _utils.devnull(),
             stderr = subprocess.STDOUT
         )
 
@@ -160,6 +176,8 @@ def _generate_swig_interface(file_path, output_directory):
 
     """
 
+    import subprocess
+
     file_path = _utils.resolve_path(file_path)
     output_directory = _utils.resolve_path(output_directory)
 
@@ -298,6 +316,9 @@ def load_files(files):
 
     """
 
+    import imp
+    import inspect
+
     module_dict = {}
 
     # Get a directory we can work within.
@@ -327,3 +348,9 @@ def load_files(files):
     to_delete.append(temp_dir)
 
     return module_dict
+
+#: The absolute path to the swig executable. The first time this variable is
+#: used, the environmental variable ``PATH`` is searched for a file named
+#: ``swig`` and this variable will be set to the first one that is found. This
+#: variable will equal ``None`` if no such file could be found.
+_utils.make_lazy(__name__, {"swig_path": _find_swig})
@@ -0,0 +1,102 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.core as core
+import interact.cache as cache
+import tempfile
+import shutil
+import json
+import os
+
+import unittest
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.student_file = os.path.join(self.temp_dir, "main.cpp")
+        with open(self.student_file, "w") as f:
+            f.write("int main() {}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def make_harness(self, calls):
+        harness = core.Harness()
+        harness.result_cache = \
+            cache.ResultCache(os.path.join(self.temp_dir, "cache"))
+
+        @harness.test("Counts calls", inputs = [self.student_file, "v1"])
+        def counted():
+            calls.append(None)
+            result = core.TestResult(max_score = 2)
+            result.add_message("Lost a point.", dscore = -1)
+            return result.calculate_score()
+
+        return harness
+
+    def test_replays_unchanged(self):
+        calls = []
+        for i in range(3):
+            harness = self.make_harness(calls)
+            harness.run_tests()
+
+            result = harness.tests.values()[0].result
+            self.assertEqual(result.score, 1)
+            self.assertEqual(str(result.messages[0]), "Lost a point.")
+
+        self.assertEqual(len(calls), 1)
+
+    def test_cached_durations_not_recorded(self):
+        calls = []
+        stats_file = os.path.join(self.temp_dir, "stats.json")
+
+        harness = self.make_harness(calls)
+        harness.stats_file = stats_file
+        harness.run_tests()
+
+        with open(stats_file, "w") as f:
+            f.write('{"Counts calls": 5.0}')
+
+        harness = self.make_harness(calls)
+        harness.stats_file = stats_file
+        harness.run_tests()
+        self.assertEqual(len(calls), 1)
+
+        # Replaying the result from the cache didn't make the test look fast.
+        with open(stats_file) as f:
+            self.assertEqual(json.load(f), {"Counts calls": 5.0})
+
+    def test_reruns_changed_input(self):
+        calls = []
+        self.make_harness(calls).run_tests()
+
+        with open(self.student_file, "a") as f:
+            f.write("// A change\n")
+
+        self.make_harness(calls).run_tests()
+
+        self.assertEqual(len(calls), 2)
+
+    def test_function_digest(self):
+        def a():
+            return 1
+
+        def b():
+            return 2
+
+        self.assertNotEqual(
+            cache.hash_function(a), cache.hash_function(b)
+        )
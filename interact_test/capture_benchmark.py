@@ -0,0 +1,100 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how many captured calls per second interact.capture can make by
+forking a process for every call and by using a WorkerPool, and how fast large
+values are passed through shared memory and through pipes. Not run as part of
+the test suite.
+
+Usage: python capture_benchmark.py [number of calls]
+
+"""
+
+import interact.capture as capture
+import time
+import sys
+
+# Some memory for each fork to copy the page tables of, like a harness that
+# has loaded a student's code.
+BALLAST = ["x" * 1024 for _ in range(100000)]
+
+def add(a, b):
+    print a, "+", b
+    return a + b
+
+def big(size):
+    return "x" * size
+
+def read_all():
+    return len(sys.stdin.read())
+
+def timed(label, calls, func):
+    start = time.time()
+    for i in range(calls):
+        func(i)
+    elapsed = time.time() - start
+    print "%-52s %8.3f s %10.1f calls/s" % (label, elapsed, calls / elapsed)
+
+def main(args = sys.argv[1:]):
+    calls = int(args[0]) if args else 500
+
+    timed(
+        "capture_function, %d calls" % (calls, ),
+        calls,
+        lambda i: capture.capture_function(add, i, 1).communicate()
+    )
+
+    with capture.WorkerPool() as pool:
+        timed(
+            "WorkerPool.apply, same calls",
+            calls,
+            lambda i: pool.apply(add, (i, 1))
+        )
+        timed(
+            "WorkerPool.apply with input, same calls",
+            calls,
+            lambda i: pool.apply(add, (i, 1), input = "input\n")
+        )
+
+    # Large values through shared memory, then with it turned off.
+    size = 2 ** 24
+    big_calls = max(1, calls // 50)
+    data = "x" * size
+    threshold = capture.SHARED_MEMORY_THRESHOLD
+    for label in ("shared memory", "pipe"):
+        with capture.WorkerPool() as pool:
+            timed(
+                "capture_function, %d MB returned, %s" % (size >> 20, label),
+                big_calls,
+                lambda i: capture.capture_function(big, size).communicate()
+            )
+            timed(
+                "WorkerPool.apply, %d MB returned, %s" % (size >> 20, label),
+                big_calls,
+                lambda i: pool.apply(big, (size, ))
+            )
+            timed(
+                "WorkerPool.apply, %d MB of input, %s" % (size >> 20, label),
+                big_calls,
+                lambda i: pool.apply(read_all, input = data)
+            )
+        capture.SHARED_MEMORY_THRESHOLD = capture.SHARED_MEMORY_SIZE + 1
+    capture.SHARED_MEMORY_THRESHOLD = threshold
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.capture as capture
+import multiprocessing.pool
+import resource
+import pickle
+import mmap
+import os
+import time
+import sys
+
+import unittest
+
+def noisy(size):
+    # Fill up stderr before writing anything to stdout, and return a value
+    # far bigger than a pipe can hold.
+    sys.stderr.write("e" * size)
+    sys.stdout.write("o" * size)
+    return "r" * size
+
+def echo():
+    data = sys.stdin.read()
+    sys.stdout.write(data.upper())
+    return len(data)
+
+def fails():
+    print "Before"
+    raise ValueError("Bad value")
+
+def spin():
+    while True:
+        sys.stdout.write("spinning\n")
+
+def spin_quietly():
+    while True:
+        pass
+
+def allocate(size):
+    return len("x" * size)
+
+class TestCommunicate(unittest.TestCase):
+    def test_large_output(self):
+        size = 2 ** 20
+        completed = capture.capture_function(noisy, size).communicate()
+
+        self.assertEqual(completed.stdout, "o" * size)
+        self.assertEqual(completed.stderr, "e" * size)
+        self.assertEqual(completed.return_value, "r" * size)
+        self.assertFalse(completed.stdout_truncated)
+        self.assertEqual(completed.status, 0)
+
+    def test_input(self):
+        data = "abc\n" * 100000
+        completed = capture.capture_function(echo).communicate(input = data)
+        self.assertEqual(completed.stdout, data.upper())
+        self.assertEqual(completed.return_value, len(data))
+
+        completed = capture.capture_function(echo).communicate()
+        self.assertEqual(completed.return_value, 0)
+
+    def test_max_bytes(self):
+        completed = capture.capture_function(noisy, 100000).communicate(
+            max_bytes = 10
+        )
+        self.assertEqual(completed.stdout, "o" * 10)
+        self.assertEqual(completed.stderr, "e" * 10)
+        self.assertTrue(completed.stdout_truncated)
+        self.assertTrue(completed.stderr_truncated)
+        self.assertEqual(len(completed.return_value), 100000)
+
+    def test_exception(self):
+        captured = capture.capture_function(fails)
+        completed = captured.communicate()
+        self.assertEqual(completed.stdout, "Before\n")
+        self.assertIsInstance(completed.exception, ValueError)
+        self.assertIs(completed.return_value, capture.CapturedFunction.NOT_SET)
+
+        self.assertRaises(ValueError, capture.capture_function(fails).wait)
+
+class TestLimits(unittest.TestCase):
+    def test_timeout(self):
+        start = time.time()
+        completed = capture.capture_function(spin, timeout = 0.5).communicate(
+            max_bytes = 100
+        )
+        self.assertLess(time.time() - start, 5)
+        self.assertTrue(completed.timed_out)
+        self.assertIsInstance(completed.exception, capture.FunctionTimedOut)
+        self.assertEqual(completed.exception.timeout, 0.5)
+        self.assertTrue(completed.stdout.startswith("spinning\n"))
+        self.assertGreater(completed.cpu_time, 0)
+        self.assertIsNotNone(completed.rusage)
+
+        captured = capture.capture_function(spin_quietly, timeout = 0.2)
+        self.assertRaises(capture.FunctionTimedOut, captured.wait)
+        self.assertTrue(captured.timed_out)
+
+    def test_no_timeout(self):
+        completed = capture.capture_function(allocate, 10, timeout = 10) \
+            .communicate()
+        self.assertFalse(completed.timed_out)
+        self.assertEqual(completed.return_value, 10)
+        self.assertGreater(completed.max_rss, 0)
+
+    def test_rlimits(self):
+        limits = {resource.RLIMIT_AS: 2 ** 30}
+        completed = capture.capture_function(
+            allocate, 2 ** 31, rlimits = limits
+        ).communicate()
+        self.assertIsInstance(completed.exception, MemoryError)
+
+        completed = capture.capture_function(
+            allocate, 2 ** 20, rlimits = limits
+        ).communicate()
+        self.assertEqual(completed.return_value, 2 ** 20)
+
+    def test_rlimits_with_shared_memory(self):
+        # The shared memory is mapped before the fork, but the function should
+        # still get all of the address space it's given.
+        try:
+            with open("/proc/self/status") as f:
+                status = dict(line.split(":", 1) for line in f)
+        except IOError:
+            self.skipTest("/proc/self/status is not available")
+        used = int(status["VmSize"].split()[0]) * 1024
+
+        limits = {resource.RLIMIT_AS: used + 80 * 2 ** 20}
+        completed = capture.capture_function(
+            allocate, 40 * 2 ** 20, rlimits = limits
+        ).communicate()
+        self.assertEqual(completed.return_value, 40 * 2 ** 20)
+
+        completed = capture.capture_function(
+            allocate, 2 ** 30, rlimits = limits
+        ).communicate()
+        self.assertIsInstance(completed.exception, MemoryError)
+
+        with capture.WorkerPool(rlimits = limits) as pool:
+            completed = pool.apply(allocate, (40 * 2 ** 20, ))
+            self.assertEqual(completed.return_value, 40 * 2 ** 20)
+
+def crash():
+    print "Crashing"
+    sys.stdout.flush()
+    os._exit(3)
+
+# Like a student's function with hidden state.
+calls = []
+def count_calls():
+    calls.append(None)
+    return len(calls)
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = capture.WorkerPool(timeout = 5)
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_reuse(self):
+        first = self.pool.apply(noisy, (10, ))
+        self.assertEqual(first.stdout, "o" * 10)
+        self.assertEqual(first.stderr, "e" * 10)
+        self.assertEqual(first.return_value, "r" * 10)
+
+        second = self.pool.apply(fails)
+        self.assertEqual(second.pid, first.pid)
+        self.assertEqual(second.stdout, "Before\n")
+        self.assertIsInstance(second.exception, ValueError)
+        self.assertIs(second.return_value, capture.CapturedFunction.NOT_SET)
+
+    def test_large_output(self):
+        size = 2 ** 20
+        completed = self.pool.apply(noisy, (size, ))
+        self.assertEqual(completed.stdout, "o" * size)
+        self.assertEqual(completed.stderr, "e" * size)
+        self.assertEqual(completed.return_value, "r" * size)
+
+        completed = self.pool.apply(noisy, (size, ), max_bytes = 10)
+        self.assertEqual(completed.stdout, "o" * 10)
+        self.assertTrue(completed.stdout_truncated)
+
+    def test_input(self):
+        data = "abc\n" * 100000
+        completed = self.pool.apply(echo, input = data)
+        self.assertEqual(completed.stdout, data.upper())
+        self.assertEqual(completed.return_value, len(data))
+
+        # Nothing is left over from the last call.
+        self.assertEqual(self.pool.apply(echo, input = "a").return_value, 1)
+        self.assertEqual(self.pool.apply(echo).return_value, 0)
+
+    def test_respawn(self):
+        pid = self.pool.apply(allocate, (1, )).pid
+
+        completed = self.pool.apply(crash)
+        self.assertEqual(completed.stdout, "Crashing\n")
+        self.assertEqual(os.WEXITSTATUS(completed.status), 3)
+        self.assertIs(completed.return_value, capture.CapturedFunction.NOT_SET)
+
+        self.pool.timeout = 0.2
+        completed = self.pool.apply(spin_quietly)
+        self.assertTrue(completed.timed_out)
+        self.assertIsInstance(completed.exception, capture.FunctionTimedOut)
+
+        completed = self.pool.apply(allocate, (5, ))
+        self.assertEqual(completed.return_value, 5)
+        self.assertNotEqual(completed.pid, pid)
+
+    def test_unpicklable(self):
+        pid = self.pool.apply(allocate, (1, )).pid
+
+        completed = self.pool.apply(lambda x: x * 2, (21, ))
+        self.assertEqual(completed.return_value, 42)
+        self.assertNotEqual(completed.pid, pid)
+        self.assertEqual(self.pool.apply(allocate, (1, )).pid, pid)
+
+    def test_state_kept(self):
+        results = [self.pool.apply(count_calls).return_value for i in range(3)]
+        self.assertEqual(results, [1, 2, 3])
+
+    def test_maxtasksperchild(self):
+        pool = capture.WorkerPool(maxtasksperchild = 2)
+        try:
+            completed = [pool.apply(count_calls) for i in range(5)]
+            self.assertEqual(
+                [i.return_value for i in completed], [1, 2, 1, 2, 1]
+            )
+            self.assertEqual(len(set(i.pid for i in completed)), 3)
+            self.assertEqual(len(pool._workers), 1)
+        finally:
+            pool.close()
+
+        # Every call gets a fresh fork, like capture_function.
+        with capture.WorkerPool(maxtasksperchild = 1) as pool:
+            results = [pool.apply(count_calls).return_value for i in range(3)]
+            self.assertEqual(results, [1, 1, 1])
+
+    def test_threads(self):
+        pool = capture.WorkerPool(processes = 3)
+        try:
+            threads = multiprocessing.pool.ThreadPool(6)
+            results = threads.map(
+                lambda n: pool.apply(allocate, (n, )).return_value, range(30)
+            )
+            threads.close()
+            self.assertEqual(results, range(30))
+            self.assertEqual(len(pool._workers), 3)
+        finally:
+            pool.close()
+
+class TestSharedMemory(unittest.TestCase):
+    def setUp(self):
+        self.size = capture.SHARED_MEMORY_SIZE
+        capture.SHARED_MEMORY_SIZE = 2 ** 18
+
+    def tearDown(self):
+        capture.SHARED_MEMORY_SIZE = self.size
+
+    def test_share(self):
+        shared = mmap.mmap(-1, 2 ** 18)
+        try:
+            self.assertIsNone(capture._share("x" * 10, shared))
+            self.assertIsNone(capture._share("x" * (2 ** 18 + 1), shared))
+
+            data = pickle.dumps(range(50000), protocol = 2)
+            in_shared = capture._share(data, shared)
+            self.assertEqual(in_shared.size, len(data))
+            self.assertEqual(
+                capture._unpickle(pickle.dumps(in_shared), shared),
+                range(50000)
+            )
+        finally:
+            shared.close()
+
+    def test_return_values(self):
+        # Small enough for a pipe, big enough for shared memory, and too big
+        # to fit in it.
+        for size in (10, 2 ** 17, 2 ** 19):
+            completed = capture.capture_function(noisy, size).communicate()
+            self.assertEqual(completed.return_value, "r" * size)
+            self.assertEqual(completed.stdout, "o" * size)
+
+            captured = capture.capture_function(noisy, size)
+            captured.communicate()
+            self.assertEqual(captured.return_value, "r" * size)
+
+    def test_pool(self):
+        with capture.WorkerPool() as pool:
+            for size in (10, 2 ** 17, 2 ** 19):
+                completed = pool.apply(noisy, (size, ))
+                self.assertEqual(completed.return_value, "r" * size)
+
+                data = "abc\n" * (size // 4)
+                completed = pool.apply(echo, input = data)
+                self.assertEqual(completed.return_value, len(data))
+                self.assertEqual(completed.stdout, data.upper())
+
+            self.assertEqual(len(set(pool._workers)), 1)
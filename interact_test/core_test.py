@@ -0,0 +1,350 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.core as core
+import tempfile
+import pickle
+import json
+import shutil
+import os
+
+import unittest
+class TestTestResult(unittest.TestCase):
+    def test_running_total(self):
+        a = core.TestResult(max_score = 10)
+        a.add_message("Foo", dscore = -1)
+        a.add_message("Bar")
+        self.assertEqual(a.calculate_score().score, 9)
+
+        a.add_message("Baz", dscore = -2)
+        self.assertEqual(a.calculate_score().score, 7)
+
+        # Changes made behind add_message's back are still counted.
+        a.messages.append(core.TestResult.Message("Qux", dscore = -3))
+        self.assertEqual(a.calculate_score().score, 4)
+        a.messages = [core.TestResult.Message("Quux", dscore = -4)]
+        self.assertEqual(a.calculate_score().score, 6)
+
+    def test_no_dscores(self):
+        a = core.TestResult()
+        a.add_message("Foo")
+        self.assertEqual(a.calculate_score().score, None)
+
+    def test_render_once(self):
+        a = core.TestResult.Message("Hello {name}", name = "world")
+        self.assertEqual(str(a), "Hello world")
+        a.kwargs["name"] = "there"
+        self.assertEqual(str(a), "Hello world")
+
+    def test_slots(self):
+        a = core.TestResult(brief = "Brief")
+        self.assertRaises(AttributeError, setattr, a, "foo", 1)
+        self.assertIn("brief = 'Brief'", repr(a))
+
+    def test_pickle(self):
+        a = core.TestResult(brief = "Brief", max_score = 3)
+        a.add_message("Foo {0}", 1, dscore = -1)
+
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            b = pickle.loads(pickle.dumps(a, protocol))
+            self.assertEqual(b.brief, "Brief")
+            self.assertEqual(str(b.messages[0]), "Foo 1")
+            self.assertEqual(b.calculate_score().score, 2)
+
+    def test_aggregation(self):
+        a = core.TestResult(max_score = 100, examples_per_type = 2)
+        for i in range(1000):
+            a.add_message("Case {0} failed.", i, type = "case", dscore = -0.1)
+            a.add_message("Untyped {0}.", i)
+
+        self.assertEqual(len(a.messages), 1003)
+        self.assertEqual(a.messages[4].count, 998)
+        self.assertEqual(str(a.messages[4]), "...and 998 more like this.")
+        self.assertAlmostEqual(a.calculate_score().score, 0)
+
+        b = pickle.loads(pickle.dumps(a, pickle.HIGHEST_PROTOCOL))
+        b.add_message("Case again.", type = "case", dscore = -1)
+        self.assertEqual(b.messages[4].count, 999)
+        self.assertEqual(len(b.messages), 1003)
+
+    def test_max_messages(self):
+        a = core.TestResult(max_score = 10, max_messages = 3,
+            examples_per_type = 1)
+        for i in range(5):
+            a.add_message("Typed {0}.", i, type = "typed", dscore = -1)
+            a.add_message("Untyped {0}.", i, dscore = -1)
+
+        self.assertEqual(len(a.messages), 3)
+        self.assertEqual(a.dropped_count, 4)
+        self.assertEqual(a.calculate_score().score, 0)
+        self.assertEqual(
+            a.to_str(show_score = False).splitlines()[-1],
+            " * ...and 4 more messages not shown."
+        )
+
+class TestFreeze(unittest.TestCase):
+    def test_freeze(self):
+        harness = core.Harness()
+        lines = [object() for i in range(3)]
+
+        def make_test(name, freeze):
+            @harness.test(name, freeze = freeze)
+            def bad_lines():
+                result = core.TestResult(max_score = 3)
+                result.add_message(
+                    "{count} bad lines.", count = len(lines), lines = lines,
+                    dscore = -1
+                )
+                return result
+        make_test("Frozen", True)
+        make_test("Raw", False)
+
+        harness.run_tests()
+
+        frozen, raw = [i.result.messages[0] for i in harness.tests.values()]
+        self.assertEqual(str(frozen), "3 bad lines.")
+        self.assertEqual(frozen.kwargs, {"count": 3, "dscore": -1})
+        self.assertIs(raw.kwargs["lines"], lines)
+
+        copy = pickle.loads(pickle.dumps(frozen))
+        self.assertEqual(str(copy), "3 bad lines.")
+
+class TestFeedbackBudget(unittest.TestCase):
+    def make_harness(self):
+        harness = core.Harness()
+
+        @harness.test("Short")
+        def short():
+            return core.TestResult(brief = "All good", score = 1, max_score = 1)
+
+        @harness.test("Long")
+        def long():
+            result = core.TestResult(max_score = 10)
+            for i in range(1000):
+                result.add_message(
+                    "Case {0} failed: \"{1}\".", i, "\t", dscore = -1
+                )
+            return result.calculate_score(min_score = 0)
+
+        @harness.test("Medium")
+        def medium():
+            result = core.TestResult(max_score = 1)
+            for i in range(200):
+                result.add_message("Line {0} is too long.", i)
+            return result.calculate_score(starting_score = 0)
+
+        harness.run_tests()
+        return harness
+
+    def test_within_budget(self):
+        harness = self.make_harness()
+        unlimited = harness._galah_results()
+
+        harness.feedback_budget = 4000
+        limited = harness._galah_results()
+
+        self.assertLessEqual(len(json.dumps(limited)), 4000)
+        self.assertGreater(len(json.dumps(limited)), 3900)
+
+        short, long, medium = limited["tests"]
+        self.assertEqual(short, unlimited["tests"][0])
+        self.assertGreater(len(long["message"]), len(medium["message"]))
+        self.assertTrue(long["message"].endswith("truncated---"))
+        self.assertEqual(limited["score"], unlimited["score"])
+
+    def test_large_budget(self):
+        harness = self.make_harness()
+        unlimited = harness._galah_results()
+        harness.feedback_budget = 10 ** 6
+        self.assertEqual(harness._galah_results(), unlimited)
+
+    def test_non_ascii(self):
+        harness = core.Harness()
+
+        @harness.test("Accents")
+        def accents():
+            result = core.TestResult(max_score = 1)
+            result.add_message("caf\xc3\xa9 " * 500)
+            return result
+
+        harness.run_tests()
+        harness.feedback_budget = 300
+        limited = harness._galah_results()
+
+        self.assertLessEqual(len(json.dumps(limited)), 300)
+        message = limited["tests"][0]["message"]
+        self.assertTrue(message.startswith(u" * caf\xe9 caf\xe9"))
+        self.assertTrue(message.endswith("truncated---"))
+
+class TestFixtures(unittest.TestCase):
+    def test_scopes(self):
+        harness = core.Harness()
+        events = []
+
+        @harness.fixture(scope = "submission")
+        def shared():
+            events.append("setup shared")
+            yield "shared"
+            events.append("teardown shared")
+
+        @harness.fixture(scope = "test")
+        def fresh():
+            events.append("setup fresh")
+            return "fresh"
+
+        for i in range(2):
+            @harness.test("Test %d" % (i, ))
+            def uses_both():
+                events.append((shared(), fresh(), shared()))
+                return core.TestResult().set_passing(True)
+
+        harness.run_tests()
+
+        self.assertEqual(events, [
+            "setup shared",
+            "setup fresh",
+            ("shared", "fresh", "shared"),
+            "setup fresh",
+            ("shared", "fresh", "shared"),
+            "teardown shared"
+        ])
+
+    def test_teardown_after_failure(self):
+        harness = core.Harness()
+        events = []
+
+        @harness.fixture(scope = "test")
+        def resource():
+            yield None
+            events.append("teardown")
+
+        @harness.test("Raises")
+        def raises():
+            resource()
+            raise ValueError()
+
+        self.assertRaises(ValueError, harness.run_tests)
+        self.assertEqual(events, ["teardown"])
+
+    def test_bad_scope(self):
+        harness = core.Harness()
+        self.assertRaises(ValueError, harness.fixture, scope = "forever")
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_harness(self, calls, crash, shard = None):
+        harness = core.Harness()
+        harness.sheep_data = {"raw_submission": {"id": "abc"}}
+        harness.shard = shard
+
+        @harness.test("Slow")
+        def slow():
+            calls.append("slow")
+            return core.TestResult(score = 3, max_score = 3)
+
+        @harness.test("Crashes", depends = [slow])
+        def crashes():
+            calls.append("crashes")
+            if crash:
+                raise MemoryError()
+            return core.TestResult(score = 1, max_score = 1)
+
+        harness.run_tests(journal = self.temp_dir)
+        return harness
+
+    def test_resume(self):
+        calls = []
+        self.assertRaises(MemoryError, self.run_harness, calls, crash = True)
+        self.assertEqual(len(os.listdir(self.temp_dir)), 1)
+
+        harness = self.run_harness(calls, crash = False)
+        self.assertEqual(calls, ["slow", "crashes", "crashes"])
+        self.assertEqual(harness.tests.values()[0].result.score, 3)
+
+        # A finished run leaves nothing behind.
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_partial_record(self):
+        calls = []
+        self.assertRaises(MemoryError, self.run_harness, calls, crash = True)
+
+        journal_path = os.path.join(self.temp_dir, os.listdir(self.temp_dir)[0])
+        with open(journal_path, "ab") as f:
+            f.write("\x00\x00\x10\x00half a record")
+
+        self.run_harness(calls, crash = False)
+        self.assertEqual(calls, ["slow", "crashes", "crashes"])
+
+    def test_sharded_resume(self):
+        # Each shard keeps its own journal, so one shard finishing doesn't
+        # delete the other's.
+        calls = []
+        self.assertRaises(
+            MemoryError, self.run_harness, calls, crash = True, shard = (1, 1)
+        )
+        self.run_harness(calls, crash = False, shard = (1, 2))
+        self.assertEqual(len(os.listdir(self.temp_dir)), 1)
+
+        del calls[:]
+        self.run_harness(calls, crash = False, shard = (1, 1))
+        self.assertEqual(calls, ["crashes"])
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_harness(self, order):
+        harness = core.Harness()
+        harness.stats_file = os.path.join(self.temp_dir, "stats.json")
+
+        for name in ("Fast", "Slow"):
+            def make_test(name):
+                @harness.test(name)
+                def timed():
+                    order.append(name)
+                    return core.TestResult().set_passing(True)
+            make_test(name)
+
+        harness.run_tests()
+        return harness
+
+    def test_slowest_first(self):
+        order = []
+        harness = self.run_harness(order)
+        self.assertEqual(order, ["Fast", "Slow"])
+        self.assertTrue(all(
+            i.duration is not None for i in harness.tests.values()
+        ))
+
+        with open(os.path.join(self.temp_dir, "stats.json"), "w") as f:
+            f.write('{"Fast": 0.1, "Slow": 2.0}')
+
+        del order[:]
+        harness = self.run_harness(order)
+        self.assertEqual(order, ["Slow", "Fast"])
+
+        # The new durations are averaged into the history.
+        self.assertAlmostEqual(harness.estimate_duration(), 1.05, places = 1)
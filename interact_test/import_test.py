@@ -0,0 +1,96 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact
+import subprocess
+import json
+import sys
+import os
+
+# The directory containing the interact package, so child interpreters import
+# the same copy we're testing.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(interact.__file__)))
+
+#: How much time (in seconds) importing interact may add on top of starting a
+#: bare interpreter. Generous, as the machine running the tests may be busy.
+MAX_IMPORT_OVERHEAD = 0.15
+
+def run_python(code):
+    environment = dict(os.environ)
+    environment["PYTHONPATH"] = ROOT
+    output = subprocess.check_output(
+        [sys.executable, "-c", code], env = environment
+    )
+    return json.loads(output)
+
+TIME_IMPORT = """
+import time
+start = time.time()
+%s
+import json
+print json.dumps(time.time() - start)
+"""
+
+def best_time(statement, runs = 5):
+    return min(run_python(TIME_IMPORT % (statement, )) for i in range(runs))
+
+import unittest
+class TestImport(unittest.TestCase):
+    def test_heavy_modules_not_imported(self):
+        imported = run_python(
+            "import sys, interact, json\n"
+            "print json.dumps([i for i, j in sys.modules.items() if j])"
+        )
+
+        for i in ("interact.unittest", "interact.standardtests",
+                "distutils.core", "imp", "inspect", "subprocess"):
+            self.assertNotIn(i, imported)
+
+    def test_submodules_still_available(self):
+        self.assertTrue(interact.unittest.load_files)
+        self.assertTrue(interact.parse.grab_blocks)
+        self.assertTrue(interact.Harness)
+        self.assertRaises(AttributeError, getattr, interact, "not_a_module")
+
+    def test_unittest_defers_probes(self):
+        imported = run_python(
+            "import sys, interact.unittest, json\n"
+            "print json.dumps([[i for i, j in sys.modules.items() if j],\n"
+            "    'swig_path' in vars(interact.unittest),\n"
+            "    interact.unittest.swig_path == interact._utils.which('swig'),\n"
+            "    interact._utils.DEVNULL.name])"
+        )
+
+        for i in ("distutils.core", "imp", "inspect", "subprocess"):
+            self.assertNotIn(i, imported[0])
+
+        # PATH isn't searched for swig until swig_path is used, and it's
+        # still a plain value rather than something to call.
+        self.assertIs(imported[1], False)
+        self.assertIs(imported[2], True)
+        self.assertEqual(imported[3], os.devnull)
+
+    def test_standardtests_defers_multiprocessing(self):
+        imported = run_python(
+            "import sys, interact.standardtests, json\n"
+            "print json.dumps([i for i, j in sys.modules.items() if j])"
+        )
+        self.assertNotIn("multiprocessing", imported)
+
+    def test_import_time(self):
+        overhead = best_time("import interact") - best_time("")
+        self.assertLess(overhead, MAX_IMPORT_OVERHEAD)
@@ -0,0 +1,90 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.core as core
+import interact.merge as merge
+import StringIO
+import tempfile
+import shutil
+import json
+import sys
+import os
+
+import unittest
+class TestMergeResults(unittest.TestCase):
+    def run_shard(self, shard, max_score = None, stats_file = None):
+        harness = core.Harness()
+        harness.execution_mode = "galah"
+        harness.shard = shard
+        harness.stats_file = stats_file
+
+        for i in range(4):
+            @harness.test("Test %d" % (i, ))
+            def passes():
+                return core.TestResult(score = 1, max_score = 1)
+
+        output = StringIO.StringIO()
+        old_stdout, sys.stdout = sys.stdout, output
+        try:
+            harness.run_tests()
+            harness.finish(max_score = max_score)
+        finally:
+            sys.stdout = old_stdout
+
+        return json.loads(output.getvalue())
+
+    def test_merge(self):
+        shards = [self.run_shard((i, 3)) for i in (3, 1, 2)]
+        self.assertEqual([len(i["tests"]) for i in shards], [1, 2, 1])
+
+        merged = merge.merge_results(shards)
+        self.assertEqual(
+            [i["name"] for i in merged["tests"]],
+            ["Test 0", "Test 1", "Test 2", "Test 3"]
+        )
+        self.assertEqual(merged["score"], 4)
+        self.assertEqual(merged["max_score"], 4)
+
+    def test_explicit_max_score(self):
+        shards = [self.run_shard((i, 2), max_score = 10) for i in (1, 2)]
+        merged = merge.merge_results(shards)
+        self.assertEqual(merged["score"], 4)
+        self.assertEqual(merged["max_score"], 10)
+
+    def test_missing_shard(self):
+        shards = [self.run_shard((1, 2))]
+        self.assertRaises(merge.MergeError, merge.merge_results, shards)
+
+    def test_record_durations(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "stats.json")
+            shards = [
+                self.run_shard((i, 2), stats_file = path) for i in (1, 2)
+            ]
+
+            # Neither shard wrote the history itself.
+            self.assertFalse(os.path.exists(path))
+
+            merge.record_durations(shards)
+            with open(path) as f:
+                durations = json.load(f)
+            self.assertEqual(
+                sorted(durations), ["Test %d" % (i, ) for i in range(4)]
+            )
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,77 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how long it takes (and how much memory it takes) to build, score, and
+render a large number of TestResult messages. Not run as part of the test suite.
+
+Usage: python message_benchmark.py [number of messages] [messages per result]
+
+"""
+
+import interact.core as core
+import resource
+import time
+import sys
+
+def max_rss_megabytes():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def timed(label, func):
+    start = time.time()
+    value = func()
+    print "%-24s %8.2f s %10.1f MB" % (
+        label, time.time() - start, max_rss_megabytes()
+    )
+    return value
+
+def build(total, per_result):
+    results = []
+    for i in xrange(total // per_result):
+        result = core.TestResult(max_score = per_result)
+        for j in xrange(per_result):
+            result.add_message(
+                "Line {line}: expected {0!r}, got {1!r}.", "foo", "bar",
+                line = j, dscore = -1
+            )
+        results.append(result)
+    return results
+
+def score(results):
+    for result in results:
+        result.calculate_score(min_score = 0)
+
+def render(results):
+    return sum(len(result.to_str()) for result in results)
+
+def main(args = sys.argv[1:]):
+    total = int(args[0]) if len(args) > 0 else 1000000
+    per_result = int(args[1]) if len(args) > 1 else 100
+
+    print "%d messages, %d per result" % (total, per_result)
+    print "%-24s %10s %13s" % ("", "time", "max rss")
+    timed("baseline", lambda: None)
+
+    results = timed("build", lambda: build(total, per_result))
+    timed("calculate_score", lambda: score(results))
+    timed("calculate_score again", lambda: score(results))
+    timed("render", lambda: render(results))
+    timed("render again", lambda: render(results))
+
+if __name__ == "__main__":
+    main()
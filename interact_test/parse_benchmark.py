@@ -0,0 +1,123 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Measures how long the functions in interact.parse take on very long lines and
+on large generated C++ sources. Not run as part of the test suite.
+
+Usage: python parse_benchmark.py [number of functions]
+
+"""
+
+import interact.standardtests as standardtests
+import interact.parse as parse
+import tempfile
+import shutil
+import os
+import time
+import sys
+
+FUNCTION = """\
+// Function number %(n)d {
+int function%(n)d(int x) {
+    /* A comment with a brace } in it
+       that goes on for a while { */
+    const char * s = "a string with \\"quotes\\" and a { brace";
+    if (x > 1'000) {
+        for (int i = 0; i < x; ++i) {
+            x += '}' + i;
+        }
+    } else {
+        return R"raw(a raw " string })raw"[0];
+    }
+    return x;
+}
+"""
+
+def generate_source(functions):
+    return "".join(FUNCTION % {"n": n} for n in range(functions)).splitlines()
+
+def timed(label, func):
+    start = time.time()
+    value = func()
+    print "%-44s %8.3f s" % (label, time.time() - start)
+    return value
+
+def main(args = sys.argv[1:]):
+    functions = int(args[0]) if args else 1000
+
+    long_line = 'x = "' + '\\"{' * 100000 + '";' + " // }" * 1000
+    timed(
+        "tokenize, one %d character line" % (len(long_line), ),
+        lambda: list(parse.tokenize([long_line]))
+    )
+    timed(
+        "cleanse_quoted_strings, same line",
+        lambda: parse.cleanse_quoted_strings(long_line)
+    )
+
+    source = generate_source(functions)
+    timed(
+        "tokenize, %d lines" % (len(source), ),
+        lambda: list(parse.tokenize(source))
+    )
+    timed("code_only, same lines", lambda: parse.code_only(source))
+
+    lines = list(parse.Line.make_lines(source))
+    blocks = timed("grab_blocks, same lines", lambda: parse.grab_blocks(lines))
+    timed(
+        "find_bad_indentation, same lines",
+        lambda: parse.find_bad_indentation(blocks)
+    )
+    timed(
+        "find_bad_indentation_streaming, same lines",
+        lambda: parse.find_bad_indentation_streaming(source)
+    )
+
+    text = "\n".join(source) + "\n"
+    timed("LineBuffer, same lines", lambda: parse.LineBuffer(text))
+    timed(
+        "SourceFile.blocks, same lines",
+        lambda: parse.SourceFile(text).blocks
+    )
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp_dir, "main.cpp")
+        with open(path, "w") as f:
+            f.write(text)
+
+        timed(
+            "check_indentation, same lines",
+            lambda: standardtests.check_indentation([path])
+        )
+        timed(
+            "check_indentation again",
+            lambda: standardtests.check_indentation([path])
+        )
+    finally:
+        shutil.rmtree(temp_dir)
+
+    nested = ["{"] * 100000 + ["}"] * 100000
+    nested_lines = list(parse.Line.make_lines(nested))
+    timed(
+        "grab_blocks, %d levels of nesting" % (len(nested) // 2, ),
+        lambda: parse.grab_blocks(nested_lines)
+    )
+
+if __name__ == "__main__":
+    main()
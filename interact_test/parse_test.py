@@ -17,6 +17,10 @@
 
 import interact.parse as parse
 import testcore
+import tempfile
+import shutil
+import time
+import os
 
 import unittest
 class TestCleanseQuotedStrings(unittest.TestCase):
@@ -35,7 +39,93 @@ class TestCleanseQuotedStrings(unittest.TestCase):
         	self, test_cases, parse.cleanse_quoted_strings
         )
 
+class TestTokenize(unittest.TestCase):
+    def spans(self, lines):
+        return [
+            (i.kind, lines[i.line][i.start:i.end])
+                for i in parse.tokenize(lines)
+        ]
+
+    def test_basic(self):
+        self.assertEqual(
+            self.spans(["char c = '\\''; // {", 'puts("\\"}");']),
+            [
+                ("code", "char c = "),
+                ("char", "'\\''"),
+                ("code", "; "),
+                ("comment", "// {"),
+                ("code", "puts("),
+                ("string", '"\\"}"'),
+                ("code", ");")
+            ]
+        )
+
+    def test_multiple_lines(self):
+        lines = [
+            "a /* {", "} */ b", 'R"x(', ')"', ')x" c', '"\\', '" d',
+            "// \\", "e"
+        ]
+        self.assertEqual(self.spans(lines), [
+            ("code", "a "),
+            ("comment", "/* {"),
+            ("comment", "} */"),
+            ("code", " b"),
+            ("string", 'R"x('),
+            ("string", ')"'),
+            ("string", ')x"'),
+            ("code", " c"),
+            ("string", '"\\'),
+            ("string", '"'),
+            ("code", " d"),
+            ("comment", "// \\"),
+            ("comment", "e")
+        ])
+
+    def test_digit_separators(self):
+        self.assertEqual(
+            self.spans(["x = 1'000'000 + 0x1'F;"]),
+            [("code", "x = 1'000'000 + 0x1'F;")]
+        )
+
+    def test_long_line(self):
+        # Would take a very long time if the lexer went back over the line for
+        # every character.
+        line = '"' + '\\"' * 50000 + '"'
+        self.assertEqual(self.spans([line]), [("string", line)])
+        self.assertEqual(parse.cleanse_quoted_strings(line), "")
+
 class TestGrabBlocks(unittest.TestCase):
+    def test_comments(self):
+        lines = list(parse.Line.make_lines([
+            "int main() { // }",
+            "    /* } */",
+            "    return '}';",
+            "}"
+        ]))
+        block = parse.grab_blocks(lines)
+        self.assertEqual(block.lines, [lines[0], lines[3]])
+        self.assertEqual(block.sub_blocks[0].lines, lines[1:3])
+
+    def test_deep_nesting(self):
+        depth = 5000
+        lines = list(parse.Line.make_lines(
+            ["{"] * depth + ["x"] + ["}"] * depth
+        ))
+
+        block = parse.grab_blocks(lines)
+        for i in range(depth):
+            self.assertEqual(block.lines, [lines[i], lines[-i - 1]])
+            block, = block.sub_blocks
+        self.assertEqual(block.lines, [lines[depth]])
+
+    def test_unclosed_block(self):
+        lines = list(parse.Line.make_lines(["a {", "b {", "c", "} d {", "e"]))
+
+        # Blocks that are never closed are left out.
+        block = parse.grab_blocks(lines)
+        self.assertEqual(block.lines, [lines[0]])
+        self.assertEqual(block.sub_blocks, [])
+
     def test_basic(self):
         from interact.parse import Line, Block
         test_cases = (
@@ -159,3 +249,264 @@ class TestGrabBlocks(unittest.TestCase):
             if not compare_blocks(parse.grab_blocks(case), expected):
                 # TODO: Make the failure output meaningful.
                 self.fail("abaabahaha")
+
+class TestFindBadIndentation(unittest.TestCase):
+    def test_streaming(self):
+        test_cases = [
+            [],
+            ["int main() {", "return 0;", "}"],
+            ["a {", "  b {", "  c;", "  } else {", " d;", "  }", "}"],
+            ["a {", "    {", "    b;", "    }", "  c;", "}"],
+            ["a {", "{", "b;", "}", "  c;", "}"],
+            ["a {", "", "public:", "  b; /* {", "*/ c;", "}", "d {", "e;"],
+            ["a {", "  b {", "  c;", "}"],
+            ["{"] * 100 + ["x;"] + ["}"] * 100
+        ]
+
+        for case in test_cases:
+            blocks = parse.grab_blocks(parse.Line.make_lines(case))
+            expected = [] if blocks is None else \
+                parse.find_bad_indentation(blocks)
+            self.assertEqual(
+                parse.find_bad_indentation_streaming(
+                    i + "\n" for i in case
+                ),
+                expected
+            )
+
+    def test_deep_nesting(self):
+        depth = 5000
+        lines = ["{"] * depth + ["x"] + ["}"] * depth
+        self.assertEqual(
+            parse.find_bad_indentation_streaming(lines),
+            parse.find_bad_indentation(
+                parse.grab_blocks(parse.Line.make_lines(lines))
+            )
+        )
+
+class TestLineBuffer(unittest.TestCase):
+    def test_matches_lines(self):
+        test_cases = [
+            "",
+            "\n",
+            "int x;",
+            "int x;\n",
+            "a\r\n  b\rc\n\n\t \td\n",
+            "  \n\t\n \t \r\n",
+            "{\n    }\n\n"
+        ]
+
+        for case in test_cases:
+            buffer = parse.LineBuffer(case)
+            expected = case.splitlines()
+
+            self.assertEqual(len(buffer), len(expected))
+            self.assertEqual(list(buffer), expected)
+            self.assertEqual(
+                [buffer[i] for i in range(len(buffer))], expected
+            )
+
+            lines = list(parse.Line.make_lines(expected))
+            self.assertEqual(buffer.lines(), lines)
+            self.assertEqual(
+                [buffer.indent_level(i) for i in range(len(buffer))],
+                [i.indent_level() for i in lines]
+            )
+
+    def test_line_code_changes(self):
+        line = parse.LineBuffer("    int x;").line(0)
+        self.assertEqual(line.indent_level(), 4)
+
+        line.code = "int x;"
+        self.assertEqual(line.indent_level(), 0)
+
+class TestSourceFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "main.cpp")
+        self.write("int main() { // }\n    return 0;\n}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        parse.SourceFile.clear_cache()
+
+    def write(self, text, mtime = None):
+        with open(self.path, "w") as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_parsed(self):
+        source = parse.SourceFile.open(self.path)
+        self.assertEqual(source.indent_levels, [0, 4, 0])
+        self.assertEqual(source.code[0], "int main() { ")
+        self.assertEqual(
+            [(i.line, i.start, i.end) for i in source.comments], [(0, 13, 17)]
+        )
+        self.assertEqual(source.blocks.lines, [source.lines[0], source.lines[2]])
+
+    def test_memoized(self):
+        source = parse.SourceFile.open(self.path)
+        self.assertIs(parse.SourceFile.open(self.path), source)
+
+        # Touching the file without changing it doesn't matter.
+        self.write(source.text, mtime = time.time() + 10)
+        self.assertIs(parse.SourceFile.open(self.path), source)
+
+        self.write("int x;\n", mtime = time.time() + 20)
+        changed = parse.SourceFile.open(self.path)
+        self.assertIsNot(changed, source)
+        self.assertEqual(list(changed.raw_lines), ["int x;"])
+
+        # The old version isn't kept around.
+        self.assertEqual(len(parse.SourceFile._by_path), 1)
+
+    def test_bounded(self):
+        paths = []
+        for i in range(4):
+            paths.append(os.path.join(self.temp_dir, "%d.cpp" % (i, )))
+            with open(paths[-1], "w") as f:
+                f.write("int x%d;\n" % (i, ))
+
+        cache_size = parse.SourceFile.cache_size
+        parse.SourceFile.cache_size = 2
+        try:
+            first = parse.SourceFile.open(paths[0])
+            parse.SourceFile.open(paths[1])
+            self.assertIs(parse.SourceFile.open(paths[0]), first)
+
+            # paths[1] is the least recently opened, so it goes first.
+            parse.SourceFile.open(paths[2])
+            self.assertEqual(
+                sorted(parse.SourceFile._by_path), sorted(paths[0:3:2])
+            )
+
+            parse.SourceFile.open(paths[3])
+            parse.SourceFile.open(paths[1])
+            self.assertEqual(len(parse.SourceFile._by_path), 2)
+            self.assertIsNot(parse.SourceFile.open(paths[0]), first)
+        finally:
+            parse.SourceFile.cache_size = cache_size
+
+class TestScopeIndex(unittest.TestCase):
+    CODE = (
+        "#include <iostream>\n"
+        "namespace ns {\n"
+        "class Foo : public Bar\n"
+        "{\n"
+        "public:\n"
+        "    int bar(int x) const {\n"
+        "        return x; // }\n"
+        "    }\n"
+        "};\n"
+        "}\n"
+        "\n"
+        "int fact(int n)\n"
+        "{\n"
+        "    if (n <= 1) {\n"
+        "        return 1;\n"
+        "    } else {\n"
+        "        return n * fact(n - 1);\n"
+        "    }\n"
+        "}\n"
+    )
+
+    def test_scopes(self):
+        index = parse.SourceFile(self.CODE).scopes
+        self.assertEqual(
+            [(i.kind, i.qualified_name, i.start, i.end) for i in index.scopes],
+            [
+                ("namespace", "ns", 1, 9),
+                ("class", "ns::Foo", 2, 8),
+                ("function", "ns::Foo::bar", 5, 7),
+                ("function", "fact", 11, 18),
+                ("control", None, 13, 15),
+                ("control", None, 15, 17)
+            ]
+        )
+        self.assertEqual(index.scopes[2].header, "int bar(int x) const")
+        self.assertEqual(index.top_level, [index.scopes[0], index.scopes[3]])
+
+        self.assertEqual(index.find("Foo::bar"), [index.scopes[2]])
+        self.assertEqual(index.find("bar", kind = "class"), [])
+        self.assertEqual(index.functions, [index.scopes[2], index.scopes[3]])
+
+        fact = index.find("fact")[0]
+        self.assertEqual(index.calls(fact, "fact"), [16])
+        self.assertEqual(index.calls(index.scopes[2], "bar"), [])
+
+    def test_scope_at(self):
+        index = parse.SourceFile(self.CODE).scopes
+        expected = [None] + [0] + [1] * 3 + [2] * 3 + [1, 0, None] + \
+            [3] * 2 + [4] * 3 + [5] * 2 + [3]
+        for line, position in enumerate(expected):
+            scope = None if position is None else index.scopes[position]
+            self.assertIs(index.scope_at(line), scope)
+
+        self.assertIs(index.function_at(14), index.scopes[3])
+        self.assertIs(index.function_at(1), None)
+
+    def test_deep_nesting(self):
+        depth = 5000
+        index = parse.SourceFile(
+            "void f() {\n" + "{\n" * depth + "}\n" * depth + "}\n"
+        ).scopes
+        self.assertEqual(len(index.scopes), depth + 1)
+        self.assertIs(index.scope_at(depth), index.scopes[-1])
+        self.assertIs(index.function_at(depth), index.scopes[0])
+
+    def test_one_line_scopes(self):
+        index = parse.SourceFile(
+            "int foo() { return foo(); }\n"
+            "void bar() {\n"
+            "}\n"
+            "struct Point { int x, y; };\n"
+            "int xs[] = {\n"
+            "    1, 2\n"
+            "};\n"
+            "void baz() { if (a) { b(); } c(); }\n"
+            "int ys[][2] = {{1, 2}, {3, 4}};\n"
+        ).scopes
+        self.assertEqual(
+            [(i.kind, i.name, i.start, i.opening, i.end) for i in index.scopes],
+            [
+                ("function", "foo", 0, 0, 0),
+                ("function", "bar", 1, 1, 2),
+                ("class", "Point", 3, 3, 3),
+                ("function", "baz", 7, 7, 7),
+                ("control", None, 7, 7, 7)
+            ]
+        )
+        self.assertEqual(index.scopes[0].header, "int foo()")
+        self.assertIs(index.scopes[0].block, None)
+        self.assertEqual(index.scopes[3].children, [index.scopes[4]])
+
+        self.assertEqual(index.calls(index.scopes[0], "foo"), [0])
+        self.assertEqual(index.calls(index.scopes[4], "c"), [])
+        self.assertEqual(index.calls(index.scopes[3], "c"), [7])
+        self.assertIs(index.function_at(1), index.scopes[1])
+
+    def test_for_headers(self):
+        index = parse.SourceFile(
+            "void f(int n) {\n"
+            "    for (int i = 0; i < n; i++) {\n"
+            "        g(i);\n"
+            "    }\n"
+            "    for (int i = 0;\n"
+            "         i < n;\n"
+            "         i++)\n"
+            "    {\n"
+            "        std::sort(a, b, [](int x, int y) { return x < y; });\n"
+            "    }\n"
+            "}\n"
+        ).scopes
+        self.assertEqual(
+            [(i.kind, i.header, i.start, i.end) for i in index.scopes],
+            [
+                ("function", "void f(int n)", 0, 10),
+                ("control", "for (int i = 0; i < n; i++)", 1, 3),
+                ("control", "for (int i = 0; i < n; i++)", 4, 9),
+                ("block", "[](int x, int y)", 8, 8)
+            ]
+        )
+        self.assertIsNot(index.scopes[1].block, None)
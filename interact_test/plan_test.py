@@ -0,0 +1,146 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.core as core
+import interact.plan as plan
+import doctest
+
+import unittest
+class TestExecutionPlan(unittest.TestCase):
+    def test_out_of_order(self):
+        a = plan.ExecutionPlan()
+        a.add("c", "C", depends = ["a", "b"])
+        a.add("b", "B", depends = ["a"])
+        self.assertEqual(a.order, [])
+
+        a.add("a", "A")
+        self.assertEqual(a.order, ["a", "b", "c"])
+        self.assertEqual(a.unresolved(), [])
+
+    def test_cycle(self):
+        a = plan.ExecutionPlan()
+        a.add("a", "A", depends = ["b"])
+        a.add("b", "B", depends = ["a"])
+        a.add("c", "C")
+
+        self.assertEqual(a.order, ["c"])
+        self.assertItemsEqual(a.unresolved(), ["a", "b"])
+
+    def test_round_trip(self):
+        a = plan.ExecutionPlan()
+        a.add("a", "A")
+        a.add("b", "B", depends = ["a"])
+
+        b = plan.ExecutionPlan.from_dict(a.to_dict())
+        self.assertEqual(b.order, [0, 1])
+        self.assertEqual(b.depends[1], [0])
+        self.assertEqual(b.names[1], "B")
+
+    def test_select(self):
+        a = plan.ExecutionPlan()
+        a.add("a", "Compiles")
+        a.add("b", "Output one", depends = ["a"])
+        a.add("c", "Output two", depends = ["a"])
+        a.add("d", "Style")
+
+        self.assertEqual(a.select(only = ["Output one"]).order, ["a", "b"])
+        self.assertEqual(a.select(skip = ["Output*"]).order, ["a", "d"])
+        self.assertEqual(a.select(skip = ["Compiles"]).order, a.order)
+
+    def test_shard(self):
+        a = plan.ExecutionPlan()
+        a.add("a", "A")
+        a.add("b", "B", depends = ["a"])
+        a.add("c", "C")
+        a.add("d", "D", depends = ["c", "a"])
+        a.add("e", "E")
+
+        self.assertEqual(a.components(), [["a", "b", "c", "d"], ["e"]])
+
+        shards = [a.shard(i, 3).order for i in range(3)]
+        self.assertEqual(shards, [["a", "b", "c", "d"], ["e"], []])
+
+    def test_schedule(self):
+        a = plan.ExecutionPlan()
+        a.add("a", "A")
+        a.add("b", "B")
+        a.add("c", "C", depends = ["a"])
+        a.add("d", "D")
+
+        # a is cheap but unlocks the most expensive test.
+        costs = {"a": 1, "b": 3, "c": 5, "d": 2}
+        self.assertEqual(a.priorities(costs)["a"], 6)
+        self.assertEqual(a.schedule(costs), ["a", "c", "b", "d"])
+        self.assertEqual(a.schedule({}), a.order)
+
+    def test_balanced_shard(self):
+        a = plan.ExecutionPlan()
+        for i in "abcde":
+            a.add(i, i.upper())
+
+        costs = {"a": 7, "b": 5, "c": 4, "d": 3, "e": 1}
+        shards = [a.shard(i, 2, costs).order for i in range(2)]
+        self.assertEqual(shards, [["a", "d"], ["b", "c", "e"]])
+
+    def test_estimate(self):
+        a = plan.ExecutionPlan()
+        a.add("a", "A")
+        a.add("b", "B", depends = ["a"])
+        a.add("c", "C")
+
+        costs = {"a": 2, "b": 2, "c": 3}
+        self.assertEqual(a.estimate(costs), 7)
+        self.assertEqual(a.estimate(costs, workers = 2), 4)
+
+class TestRunTests(unittest.TestCase):
+    def test_long_chain(self):
+        harness = core.Harness()
+
+        previous = []
+        for i in range(5000):
+            @harness.test("Test %d" % (i, ), depends = previous)
+            def chained():
+                return core.TestResult().set_passing(True)
+            previous = [chained]
+
+        harness.run_tests()
+
+        self.assertTrue(all(i.result.is_passing() for i in harness.tests.values()))
+
+    def test_cycle_detected_before_running(self):
+        harness = core.Harness()
+        ran = []
+
+        @harness.test("Runs")
+        def runs():
+            ran.append(None)
+            return core.TestResult().set_passing(True)
+
+        def a():
+            pass
+        def b():
+            pass
+        harness.tests[a] = core.Harness.Test("A", [b], a)
+        harness.tests[b] = core.Harness.Test("B", [a], b)
+
+        self.assertRaises(core.Harness.CyclicDependency, harness.run_tests)
+        self.assertEqual(ran, [])
+
+def load_tests(loader, tests, pattern):
+    # The examples in the docstrings should keep working too.
+    tests.addTests(doctest.DocTestSuite(plan))
+    return tests
@@ -0,0 +1,157 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.core as core
+import interact.resultstore as resultstore
+import interact.server as server
+import interact
+import subprocess
+import StringIO
+import tempfile
+import signal
+import sys
+import shutil
+import json
+import os
+
+# A harness serving requests on stdin, for a test to stop with SIGTERM.
+SERVER = """
+import sys
+sys.path.insert(0, %(test_directory)r)
+import resultstore_test
+import interact.resultstore as resultstore
+
+harness = resultstore_test.make_harness()
+harness.execution_mode = "server"
+harness.result_store = resultstore.ResultStore(%(path)r)
+harness.finish()
+"""
+
+def make_harness():
+    harness = core.Harness()
+
+    @harness.test("Style")
+    def style():
+        result = core.TestResult(max_score = 5, examples_per_type = 1)
+        for i in range(harness.sheep_data.get("problems", 0)):
+            result.add_message("Long line.", type = "long", dscore = -1)
+        result.add_message("Tab.", type = "tab", dscore = -1)
+        return result.calculate_score(min_score = 0)
+
+    return harness
+
+import unittest
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "results.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_queries(self):
+        store = resultstore.ResultStore(self.path, batch_size = 10)
+
+        for problems in (0, 1, 3, 3):
+            harness = make_harness()
+            harness.sheep_data = {"problems": problems}
+            harness.run_tests()
+            store.add(harness)
+
+        # Nothing is written until the batch is full or flushed.
+        self.assertFalse(os.path.exists(self.path))
+
+        self.assertEqual(
+            store.message_types("Style"), [("long", 7), ("tab", 4)]
+        )
+        self.assertEqual(
+            store.score_distribution("Style"), [(1, 2), (3, 1), (4, 1)]
+        )
+
+        name, count, average, _, duration = store.test_summary()[0]
+        self.assertEqual((name, count, average), ("Style", 4, 2.25))
+        self.assertTrue(duration is not None)
+
+        store.close()
+
+    def test_server_batches(self):
+        harness = make_harness()
+        harness.execution_mode = "server"
+        harness.result_store = resultstore.ResultStore(self.path)
+
+        requests = StringIO.StringIO(
+            "\n".join(json.dumps({"problems": i}) for i in range(3)) + "\n"
+        )
+        replies = StringIO.StringIO()
+        server.serve_stream(harness, requests, replies)
+
+        replies = [json.loads(i) for i in replies.getvalue().splitlines()]
+        self.assertEqual([i["score"] for i in replies], [4, 3, 2])
+
+        store = resultstore.ResultStore(self.path)
+        self.assertEqual(store.query("SELECT COUNT(*) FROM submissions"), [(3, )])
+        store.close()
+
+    def test_server_flushes_on_sigterm(self):
+        environment = dict(os.environ)
+        environment["PYTHONPATH"] = os.path.dirname(
+            os.path.dirname(os.path.abspath(interact.__file__))
+        )
+        code = SERVER % {
+            "test_directory": os.path.dirname(os.path.abspath(__file__)),
+            "path": self.path
+        }
+        process = subprocess.Popen(
+            [sys.executable, "-c", code], env = environment,
+            stdin = subprocess.PIPE, stdout = subprocess.PIPE
+        )
+
+        for i in range(2):
+            process.stdin.write(json.dumps({"problems": i}) + "\n")
+            process.stdin.flush()
+            self.assertTrue(process.stdout.readline())
+
+        # Both submissions are still waiting for a full batch.
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+
+        store = resultstore.ResultStore(self.path)
+        self.assertEqual(store.query("SELECT COUNT(*) FROM submissions"), [(2, )])
+        store.close()
+
+class BrokenStore:
+    def add(self, harness, score = None, max_score = None):
+        raise IOError("disk full")
+
+class TestStoreErrors(unittest.TestCase):
+    def test_output_first(self):
+        harness = make_harness()
+        harness.execution_mode = "galah"
+        harness.sheep_data = {}
+        harness.result_store = BrokenStore()
+        harness.run_tests()
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+        try:
+            harness.finish()
+            output, errors = sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        self.assertEqual(json.loads(output)["score"], 4)
+        self.assertIn("disk full", errors)
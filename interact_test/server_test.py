@@ -0,0 +1,85 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.core as core
+import interact.server as server
+import subprocess
+import tempfile
+import shutil
+import StringIO
+import signal
+import json
+import time
+import os
+
+import unittest
+class TestServeStream(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_requests_are_isolated(self):
+        harness = core.Harness()
+        harness.execution_mode = "server"
+        seen = []
+
+        @harness.test("Reads sheep data")
+        def reads():
+            seen.append(harness.sheep_data["student"])
+            result = core.TestResult(max_score = 1)
+            result.add_message("Seen {0}", ", ".join(seen))
+            return result.set_passing(harness.sheep_data["student"] != "bad")
+
+        requests = StringIO.StringIO(
+            "\n".join(json.dumps({"student": i}) for i in ("a", "bad", "b")) +
+            "\nnot json\n"
+        )
+        replies = StringIO.StringIO()
+        server.serve_stream(harness, requests, replies)
+
+        replies = [json.loads(i) for i in replies.getvalue().splitlines()]
+        self.assertEqual([i.get("score") for i in replies], [1, 0, 1, None])
+        self.assertEqual(replies[2]["tests"][0]["message"], " * Seen b")
+        self.assertTrue("error" in replies[3])
+
+        # Nothing should have run in this process.
+        self.assertEqual(seen, [])
+
+    def test_process_left_running(self):
+        harness = core.Harness()
+        harness.execution_mode = "server"
+        started = []
+
+        @harness.test("Starts a process")
+        def starts():
+            # Like a student's program that is never waited on, this holds
+            # onto whatever descriptors it inherited.
+            process = subprocess.Popen(["sleep", "10"])
+            with open(path, "w") as f:
+                f.write(str(process.pid))
+            return core.TestResult().set_passing(True)
+
+        path = os.path.join(self.temp_dir, "pid")
+        start = time.time()
+        reply = server.handle_request(harness, {})
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(reply["score"], 1)
+
+        with open(path) as f:
+            os.kill(int(f.read()), signal.SIGKILL)
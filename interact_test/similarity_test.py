@@ -0,0 +1,173 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.similarity as similarity
+import interact.parse as parse
+import StringIO
+import tempfile
+import shutil
+import os
+
+import unittest
+
+ORIGINAL = """\
+#include <iostream>
+using namespace std;
+
+// Adds up the numbers from 1 to n.
+int sum(int n) {
+    int total = 0;
+    for (int i = 1; i <= n; ++i) {
+        total += i;
+    }
+    return total;
+}
+
+int main() {
+    int n;
+    cin >> n;
+    cout << "The sum is " << sum(n) << endl;
+    return 0;
+}
+"""
+
+# The same program with its names, comments, and layout changed.
+DISGUISED = """\
+#include <iostream>
+#include <string>
+using namespace std;
+
+int addUp(int count)
+{
+    int result = 0;   /* running total */
+    for (int j = 1; j <= count; ++j)
+    {
+        result += j;
+    }
+    return result;
+}
+
+int main()
+{
+    int value; cin >> value;
+    cout << "Total: " << addUp(value) << endl;
+    return 0;
+}
+"""
+
+DIFFERENT = """\
+#include <vector>
+
+double average(const std::vector<double> & values) {
+    if (values.empty()) throw 1;
+    double sum = 0.0;
+    for (std::size_t i = 0; i < values.size(); i++) sum = sum + values[i];
+    return sum / values.size();
+}
+"""
+
+class TestFingerprints(unittest.TestCase):
+    def test_disguised(self):
+        self.assertEqual(
+            similarity.normalize(ORIGINAL), similarity.normalize(DISGUISED)
+        )
+
+        original = similarity.fingerprint(similarity.normalize(ORIGINAL))
+        different = similarity.fingerprint(similarity.normalize(DIFFERENT))
+        self.assertLess(similarity.jaccard(original, different), 0.2)
+
+    def test_winnowing_guarantee(self):
+        shared = ["a%d" % (i % 7, ) for i in range(8)]
+        first = ["x"] * 20 + shared + ["y"] * 20
+        second = ["z", "w"] * 15 + shared
+
+        self.assertTrue(
+            similarity.fingerprint(first, k = 5, window = 4) &
+                similarity.fingerprint(second, k = 5, window = 4)
+        )
+
+    def test_signature(self):
+        fingerprints = similarity.fingerprint(similarity.normalize(ORIGINAL))
+        signature = similarity.signature(fingerprints, 16)
+        self.assertEqual(len(signature), 16)
+        self.assertTrue(all(i is not None for i in signature))
+        self.assertEqual(similarity.signature(frozenset(), 16), None)
+
+class TestSimilarityIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for name, text in [("alice", ORIGINAL), ("bob", DISGUISED),
+                ("carol", DIFFERENT), ("dave", ORIGINAL)]:
+            os.mkdir(os.path.join(self.temp_dir, name))
+            with open(os.path.join(self.temp_dir, name, "main.cpp"), "w") as f:
+                f.write(text)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        parse.SourceFile.clear_cache()
+
+    def add(self, index, name):
+        return index.add(
+            name,
+            similarity.find_sources(os.path.join(self.temp_dir, name))
+        )
+
+    def test_files_not_cached(self):
+        index = similarity.SimilarityIndex()
+        for name in ("alice", "bob", "carol"):
+            self.add(index, name)
+        index.close()
+
+        self.assertEqual(parse.SourceFile._by_path, {})
+
+    def test_incremental(self):
+        path = os.path.join(self.temp_dir, "index.db")
+
+        index = similarity.SimilarityIndex(path)
+        self.assertEqual(self.add(index, "alice"), [])
+        self.assertEqual(
+            [i[1:3] for i in self.add(index, "bob")], [("alice", "bob")]
+        )
+        self.assertEqual(self.add(index, "carol"), [])
+        index.close()
+
+        # The index is kept between runs.
+        index = similarity.SimilarityIndex(path)
+        self.assertEqual(
+            sorted(i[1:3] for i in self.add(index, "dave")),
+            [("alice", "dave"), ("bob", "dave")]
+        )
+
+        # Adding a submission again replaces it.
+        self.add(index, "dave")
+
+        matches = index.matches()
+        self.assertEqual(len(matches), 3)
+        self.assertTrue(all(i.similarity == 1.0 for i in matches))
+
+        out = StringIO.StringIO()
+        similarity.write_report(matches, out)
+        self.assertEqual(
+            out.getvalue().splitlines()[1].split("\t")[2:], ["alice", "bob"]
+        )
+
+        index.close()
+
+    def test_settings(self):
+        path = os.path.join(self.temp_dir, "index.db")
+        similarity.SimilarityIndex(path).close()
+        self.assertRaises(ValueError, similarity.SimilarityIndex, path, k = 6)
@@ -16,6 +16,8 @@
 # limitations under the License.
 
 import interact.standardtests as standardtests
+import interact.parse as parse
+import interact._utils as _utils
 import testcore as testcore
 import tempfile
 import shutil
@@ -61,3 +63,91 @@ class TestCheckFilesExist(unittest.TestCase):
             self.assertListEqual(test_result.messages, [])
         finally:
             shutil.rmtree(temp_dir)
+
+class TestCheckIndentation(unittest.TestCase):
+    def tearDown(self):
+        parse.SourceFile.clear_cache()
+
+    def test_bad_lines(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            path = os.path.join(temp_dir, "main.cpp")
+            with open(path, "w") as f:
+                f.write(
+                    "int main() {\n"
+                    "    if (a) {\n"
+                    "    foo(); // }\n"
+                    "    }\n"
+                    "    if (b) {\n"
+                    "    bar();\n"
+                    "    }\n"
+                    "}\n"
+                )
+
+            test_result = standardtests.check_indentation([path])
+
+            self.assertEqual(test_result.score, 8)
+            self.assertEqual(
+                [i.line_number for i in test_result.messages[0].kwargs["lines"]],
+                [2, 5]
+            )
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_parallel(self):
+        temp_dir = tempfile.mkdtemp()
+
+        try:
+            files = []
+            for i in range(6):
+                path = os.path.join(temp_dir, "file%d.cpp" % (i, ))
+                with open(path, "w") as f:
+                    f.write("void f() {\r\n" + "x;\r\n" * i + "}\r\n")
+                files.append(path)
+
+            serial = standardtests.check_indentation(files, processes = 1)
+            parallel = standardtests.check_indentation(files, processes = 3)
+
+            self.assertEqual(parallel.score, serial.score)
+            self.assertEqual(serial.score, 0)
+            self.assertEqual(
+                [str(i) for i in parallel.messages],
+                [str(i) for i in serial.messages]
+            )
+            self.assertEqual(
+                [i.kwargs["file_name"] for i in parallel.messages], files[1:]
+            )
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_shares_parse(self):
+        temp_dir = tempfile.mkdtemp()
+        threshold = standardtests.PARALLEL_THRESHOLD
+
+        try:
+            small, large = [
+                os.path.join(temp_dir, i) for i in ("small.cpp", "large.cpp")
+            ]
+            for path in (small, large):
+                with open(path, "w") as f:
+                    f.write("int main() {\n" + "x;\n" * 100 + "}\n")
+
+            # Only the small file is parsed whole, where check_style can use
+            # it too. The large one is streamed.
+            standardtests.PARALLEL_THRESHOLD = os.path.getsize(small)
+            with open(large, "a") as f:
+                f.write("\n")
+
+            result = standardtests.check_indentation([small, large])
+            self.assertEqual(result.score, 0)
+            self.assertEqual(
+                parse.SourceFile._by_path.keys(), [_utils.resolve_path(small)]
+            )
+
+            source = parse.SourceFile.open(small)
+            standardtests.check_style([small])
+            self.assertIs(parse.SourceFile.open(small), source)
+        finally:
+            standardtests.PARALLEL_THRESHOLD = threshold
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,130 @@
+# Copyright (c) 2013 Galah Group LLC
+# Copyright (c) 2013 Other contributers as noted in the CONTRIBUTERS file
+#
+# This file is part of galah-interact-python.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+#
+# You may obtain a copy of the License at
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import interact.style as style
+import interact.parse as parse
+import tempfile
+import shutil
+import os
+
+import unittest
+
+CODE = (
+    "int main() {\n"
+    "    if (a) {\n"
+    "    foo(); // {\n"
+    "    } \n"
+    "    else\n"
+    "    {\n"
+    "\t    bar(\"{\");\n"
+    "    }\n"
+    "    return " + "x" * 80 + ";\n"
+    "}\n"
+)
+
+class TestStyleChecker(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "main.cpp")
+        with open(self.path, "w") as f:
+            f.write(CODE)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        parse.SourceFile.clear_cache()
+
+    def test_default_rules(self):
+        problems = style.StyleChecker().check_file(self.path)
+        self.assertEqual(problems, {
+            "indentation": [2],
+            "line_length": [8],
+            "trailing_whitespace": [3],
+            "mixed_indentation": [6],
+            "brace_style": [5]
+        })
+
+        # The indentation rule agrees with find_bad_indentation.
+        source = parse.SourceFile.open(self.path)
+        self.assertEqual(
+            [i.line_number for i in parse.find_bad_indentation(source.blocks)],
+            problems["indentation"]
+        )
+
+    def test_results(self):
+        checker = style.StyleChecker()
+        results = checker.check([self.path], max_score = 3)
+        self.assertEqual(results.keys(), [i.name for i in checker.rules])
+        self.assertTrue(all(i.score == 2 for i in results.values()))
+        self.assertEqual(
+            results["line_length"].messages[0].kwargs["line_numbers"], [9]
+        )
+
+        combined = checker.check_combined([self.path, self.path])
+        self.assertEqual(combined.score, 0)
+        self.assertEqual(len(combined.messages), 10)
+        self.assertEqual(sorted(checker.timings), sorted(results))
+
+    def test_only_overridden_callbacks(self):
+        calls = []
+
+        class Lines(style.Rule):
+            name = "lines"
+
+            def line(self, source, index, text):
+                calls.append(index)
+                if "return" in text:
+                    self.report(index)
+
+        checker = style.StyleChecker([Lines()])
+        self.assertEqual(checker.check_file(self.path), {"lines": [8]})
+        self.assertEqual(calls, range(10))
+
+        handlers = checker._handlers()
+        self.assertEqual(len(handlers["line"]), 1)
+        self.assertEqual(handlers["token"], [])
+
+    def test_single_walk(self):
+        events = []
+
+        class Mixed(style.Rule):
+            name = "mixed"
+
+            def enter_block(self, source, block, depth):
+                events.append(("enter", depth))
+
+            def exit_block(self, source, block, depth):
+                events.append(("exit", depth))
+
+            def line(self, source, index, text):
+                events.append(("line", index))
+
+            def token(self, source, span, text):
+                if span.kind == parse.CODE and "{" in text:
+                    events.append(("token", span.line))
+
+        style.StyleChecker([Mixed()]).check_file(self.path)
+
+        # Every line is seen while inside the block it belongs to.
+        self.assertEqual(events, [
+            ("enter", 0), ("line", 0), ("token", 0),
+            ("enter", 1), ("line", 1), ("token", 1),
+            ("enter", 2), ("line", 2), ("exit", 2),
+            ("line", 3), ("line", 4), ("line", 5), ("token", 5),
+            ("enter", 2), ("line", 6), ("exit", 2),
+            ("line", 7), ("line", 8), ("exit", 1),
+            ("line", 9), ("exit", 0)
+        ])